@@ -0,0 +1,74 @@
+"""File size, write time and scan time of the parquet encoding profiles configured in writer.yaml.
+
+"default" is pyarrow's defaults, which the writers use without a profile. Run from the repository root:
+
+    python benchmarks/encoding_profiles.py
+    python benchmarks/encoding_profiles.py --rows 100000 --event-type trades --profile archive
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from benchmarks.flush_conversion import EVENT_TYPES, make_records  # noqa: E402
+
+
+def best_of(runs: int, func) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def measure(table, options: dict, runs: int) -> dict:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    def write():
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink, **options)
+        return sink.getvalue()
+
+    data = write()
+    return {
+        "bytes": data.size,
+        "write_s": best_of(runs, write),
+        "scan_s": best_of(runs, lambda: pq.read_table(pa.BufferReader(data))),
+        "market_scan_s": best_of(runs, lambda: pq.read_table(pa.BufferReader(data),
+                                                             filters=[("market", "=", "BTC-EUR")])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Size and speed of the parquet encoding profiles.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=3, help="Repetitions, the fastest is reported.")
+    parser.add_argument("--event-type", action="append", choices=EVENT_TYPES)
+    parser.add_argument("--profile", action="append", help="Profile name, repeatable. All if not set.")
+    args = parser.parse_args()
+
+    from src.utils.config_loader import load_config_by_name
+    from src.writer.encoding import get_encoding_profile
+    from src.writer.schemas import records_to_table
+
+    names = args.profile or ["default"] + list(load_config_by_name("writer").get("encoding_profiles", {}))
+    for event_type in args.event_type or EVENT_TYPES:
+        # records of a market follow each other as in a flushed partition of one market
+        records = sorted(make_records(event_type, args.rows), key=lambda record: record["market"])
+        table = records_to_table(records, event_type)
+        baseline = None
+        for name in names:
+            options = {} if name == "default" else get_encoding_profile(name).write_options(table.schema)
+            result = measure(table, options, args.runs)
+            baseline = baseline or result["bytes"]
+            print(f"{event_type:9} {name:12} {result['bytes'] / 1024:9.0f} KiB ({result['bytes'] / baseline:5.2f}x) "
+                  f"write={result['write_s'] * 1000:6.1f} ms scan={result['scan_s'] * 1000:6.1f} ms "
+                  f"market scan={result['market_scan_s'] * 1000:6.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Compares the flush path of the parquet writers: pandas DataFrame versus schema-typed Arrow table.
+
+Each method runs in a fresh interpreter so that the peak resident memory is that of the method alone.
+Run from the repository root:
+
+    python benchmarks/flush_conversion.py
+    python benchmarks/flush_conversion.py --rows 50000 --event-type trades
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+EVENT_TYPES = ["orderbook", "trades", "ticker"]
+
+
+def make_records(event_type: str, rows: int, levels: int = 20) -> list:
+    """Records as the websocket handlers buffer them, numbers are strings as sent by the exchanges."""
+    rng = random.Random(0)
+    markets = ["BTC-EUR", "ETH-EUR", "XRP-EUR", "SOL-EUR"]
+    records = []
+    for i in range(rows):
+        record = {"event": event_type, "exchange": "bitvavo", "market": markets[i % len(markets)],
+                  "fetch_time": 1_700_000_000_000_000_000 + i * 1_000_000}
+        price = 30000 + rng.random() * 100
+        if event_type == "orderbook":
+            record["nonce"] = i
+            record["bids"] = [[f"{price - j:.2f}", f"{rng.random():.8f}"] for j in range(levels)]
+            record["asks"] = [[f"{price + j:.2f}", f"{rng.random():.8f}"] for j in range(levels)]
+        elif event_type == "trades":
+            record.update({"id": f"{i:032x}", "timestamp": 1_700_000_000_000 + i, "price": f"{price:.2f}",
+                           "amount": f"{rng.random():.8f}", "side": "buy" if i % 2 else "sell"})
+        else:
+            # tickers often carry only one side, the other columns are None
+            record.update({"bestBid": f"{price:.2f}" if i % 3 else None, "bestBidSize": None,
+                           "bestAsk": f"{price + 1:.2f}", "bestAskSize": f"{rng.random():.8f}"})
+        records.append(record)
+    return records
+
+
+def flush_pandas(records: list, path: str) -> None:
+    import pandas as pd
+    data = pd.DataFrame(records)
+    data["write_time"] = time.strftime("%Y%m%d-%H")
+    data.to_parquet(path, engine="pyarrow", partition_cols=["write_time"])
+
+
+def flush_arrow(records: list, event_type: str, path: str) -> None:
+    import pyarrow.parquet as pq
+    from src.writer.local_parquet import LocalParquetWriter
+    from src.writer.partitioning import TIME_PARTITION_COLS
+    table = LocalParquetWriter(len(records), path)._to_table(records, event_type)
+    pq.write_to_dataset(table, path, partition_cols=TIME_PARTITION_COLS)
+
+
+def run_method(method: str, event_type: str, rows: int) -> dict:
+    records = make_records(event_type, rows)
+    # import time is not part of a flush
+    import pandas, pyarrow.parquet, src.writer.local_parquet, src.writer.schemas  # noqa: F401
+    # the buffer exists before the flush in the collector as well
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as path:
+        start_cpu, start = time.process_time(), time.perf_counter()
+        if method == "pandas":
+            flush_pandas(records, path)
+        else:
+            flush_arrow(records, event_type, path)
+        cpu, wall = time.process_time() - start_cpu, time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"cpu_s": cpu, "wall_s": wall, "peak_increase_mb": (peak_kb - baseline_kb) / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flush CPU time and peak memory per conversion path.")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--event-type", action="append", choices=EVENT_TYPES)
+    parser.add_argument("--child", nargs=2, metavar=("METHOD", "EVENT_TYPE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, os.getcwd())
+        print(json.dumps(run_method(args.child[0], args.child[1], args.rows)))
+        return
+
+    for event_type in args.event_type or EVENT_TYPES:
+        for method in ["pandas", "arrow"]:
+            out = subprocess.run([sys.executable, __file__, "--rows", str(args.rows), "--child", method, event_type],
+                                 capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{event_type:9} {method:6} rows={args.rows} cpu={result['cpu_s'] * 1000:7.0f} ms "
+                  f"wall={result['wall_s'] * 1000:7.0f} ms peak+={result['peak_increase_mb']:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
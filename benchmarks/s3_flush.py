@@ -0,0 +1,117 @@
+"""Flush latency of the S3 parquet writer: temporary directory with serial uploads versus in-memory parallel uploads.
+
+By default the uploads go to a local moto server, pass --endpoint-url to use another S3 compatible
+store such as MinIO. A local store answers within a millisecond, so every request is delayed by
+--latency-ms to get closer to the round trip of S3. Run from the repository root:
+
+    python benchmarks/s3_flush.py
+    python benchmarks/s3_flush.py --rows 50000 --markets 40 --flushes 10 --endpoint-url http://localhost:9000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from benchmarks.flush_conversion import make_records  # noqa: E402
+
+BUCKET = "benchmark"
+
+
+def add_latency(client, latency_ms: float):
+    """Delays every request of the client, a local stand-in answers faster than S3 does."""
+    if latency_ms > 0:
+        client.meta.events.register("before-send.s3", lambda **kwargs: time.sleep(latency_ms / 1000))
+    return client
+
+
+def client_factory(endpoint_url: str, latency_ms: float):
+    import boto3
+
+    def create():
+        client = boto3.client("s3", endpoint_url=endpoint_url, aws_access_key_id=os.environ["aws_access_key_id"],
+                              aws_secret_access_key=os.environ["aws_secret_access_key"])
+        return add_latency(client, latency_ms)
+    return create
+
+
+def flush_temp_dir(writer, event_type: str, create_client) -> None:
+    """The previous flush: parquet files in a temporary directory, a new client, one upload at a time."""
+    import pyarrow.parquet as pq
+    from src.writer.partitioning import TIME_PARTITION_COLS
+    table = writer._to_table(writer.buffer[event_type], event_type)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "data")
+        pq.write_to_dataset(table, path, partition_cols=writer.partition_cols + TIME_PARTITION_COLS,
+                            basename_template=writer._basename_template())
+        writer.upload_to_s3(path, writer.s3_bucket, f"{writer.s3_prefix}/{event_type}", boto_client=create_client())
+    writer.buffer[event_type].clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flush latency of the S3 parquet writer.")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows per flush.")
+    parser.add_argument("--markets", type=int, default=20, help="Markets, partitioned by market.")
+    parser.add_argument("--flushes", type=int, default=5)
+    parser.add_argument("--event-type", default="trades")
+    parser.add_argument("--endpoint-url", help="S3 compatible endpoint, a local moto server if not set.")
+    parser.add_argument("--latency-ms", type=float, default=20,
+                        help="Round trip added to every request, 0 to measure the endpoint as is.")
+    args = parser.parse_args()
+
+    # credentials as the writer reads them, a local stand-in accepts any
+    os.environ.setdefault("aws_access_key_id", "benchmark")
+    os.environ.setdefault("aws_secret_access_key", "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    server = None
+    endpoint_url = args.endpoint_url
+    if endpoint_url is None:
+        from moto.server import ThreadedMotoServer
+        server = ThreadedMotoServer(port=0, verbose=False)
+        server.start()
+        host, port = server.get_host_and_port()
+        endpoint_url = f"http://{host}:{port}"
+
+    from src.writer.s3_parquet import S3ParquetWriter
+    create_client = client_factory(endpoint_url, args.latency_ms)
+    create_client().create_bucket(Bucket=BUCKET)
+
+    records = make_records(args.event_type, args.rows)
+    for i, record in enumerate(records):
+        record["market"] = f"M{i % args.markets}-EUR"
+
+    writer = S3ParquetWriter(BUCKET, "benchmark", partition_cols=["market"], endpoint_url=endpoint_url)
+    add_latency(writer.client, args.latency_ms)
+
+    def timed(flush):
+        durations = []
+        for _ in range(args.flushes):
+            writer.append(list(records), args.event_type)
+            start = time.perf_counter()
+            flush()
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    methods = {
+        "temp_dir": lambda: flush_temp_dir(writer, args.event_type, create_client),
+        "in_memory": lambda: writer.save_and_refresh(args.event_type),
+    }
+    try:
+        for name, flush in methods.items():
+            durations = timed(flush)
+            print(f"{name:9} rows={args.rows} partitions={args.markets} latency={args.latency_ms:.0f} ms "
+                  f"median={statistics.median(durations) * 1000:7.0f} ms min={min(durations) * 1000:7.0f} ms")
+    finally:
+        writer.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Measures the import time of the collector's entry points in fresh interpreters.
+
+Worker processes are restarted by the supervisor, so every module imported at startup is paid again
+on each restart. Run from the repository root:
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --module src.data_collector --runs 10 --top 20
+
+The report lists the median wall time of the import and the modules with the largest cumulative
+import time as reported by ``python -X importtime``.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+DEFAULT_MODULES = ["src.supervisor", "src.data_collector", "src.writer.factory", "src.exchanges.exchange_factory"]
+
+
+def import_wall_time(module: str) -> float:
+    """Seconds it takes a fresh interpreter to import the module, interpreter startup excluded."""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def import_times(module: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds per module as reported by -X importtime."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True)
+    times = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def report(module: str, runs: int, top: int) -> List[Tuple[str, int]]:
+    wall = [import_wall_time(module) for _ in range(runs)]
+    heaviest = sorted(import_times(module).items(), key=lambda item: item[1], reverse=True)[:top]
+    print(f"{module}: median {statistics.median(wall) * 1000:.0f} ms, "
+          f"min {min(wall) * 1000:.0f} ms over {runs} runs")
+    for name, cumulative in heaviest:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    return heaviest
+
+
+def config_load_time(runs: int) -> None:
+    from src.utils.config_loader import invalidate_config, load_config_by_name
+
+    def timed():
+        start = time.perf_counter()
+        load_config_by_name("data_collector")
+        return time.perf_counter() - start
+
+    invalidate_config()
+    cold = timed()
+    cached = statistics.median(timed() for _ in range(runs))
+    print(f"load_config_by_name: first {cold * 1e6:.0f} us, cached {cached * 1e6:.0f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the collector entry points.")
+    parser.add_argument("--module", action="append", help="Module to import, repeatable.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module.")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest imports to list.")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    for module in args.module or DEFAULT_MODULES:
+        report(module, args.runs, args.top)
+    config_load_time(args.runs)
+
+
+if __name__ == "__main__":
+    main()
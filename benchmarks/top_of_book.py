@@ -0,0 +1,68 @@
+"""Read latency of the shared-memory top-of-book table while another process keeps writing it.
+
+A writer process updates every instrument in a loop, the benchmark attaches to the segment and
+reads random instruments, counting reads that had to retry. Run from the repository root:
+
+    python benchmarks/top_of_book.py
+    python benchmarks/top_of_book.py --instruments 500 --reads 200000
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from src.live.top_of_book import TopOfBook  # noqa: E402
+
+
+def write_forever(name: str, stop):
+    book = TopOfBook.attach(name)
+    price = 100.0
+    count = len(book.instruments())
+    while not stop.is_set():
+        for instrument_id in range(count):
+            book.write(instrument_id, price, 1.0, price + 0.5, 1.0, 0, time.time_ns())
+        price += 0.01
+    book.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instruments", type=int, default=200)
+    parser.add_argument("--reads", type=int, default=100000)
+    args = parser.parse_args()
+
+    import numpy as np
+    instruments = [("bitvavo", f"M{i}-EUR") for i in range(args.instruments)]
+    book = TopOfBook.create(f"benchmark-tob-{os.getpid()}", instruments)
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    writer = context.Process(target=write_forever, args=(book.shm.name, stop))
+    writer.start()
+    try:
+        reader = TopOfBook.attach(book.shm.name)
+        while reader.read(0)["updates"] == 0:
+            time.sleep(0.01)
+        ids = np.random.randint(0, args.instruments, args.reads)
+        latencies = np.empty(args.reads)
+        failed = 0
+        for i, instrument_id in enumerate(ids):
+            start = time.perf_counter_ns()
+            failed += reader.read(int(instrument_id)) is None
+            latencies[i] = time.perf_counter_ns() - start
+        reader.close()
+    finally:
+        stop.set()
+        writer.join()
+        book.close()
+
+    print(f"{args.reads} reads of {args.instruments} instruments under a concurrent writer")
+    for q in (50, 99, 99.9):
+        print(f"p{q}: {np.percentile(latencies, q) / 1000:.2f} us")
+    print(f"inconsistent reads: {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,15 @@ if [ -n "${WriterType}" ] && [ "${WriterType}" != "0" ]; then
   WRITER_TYPE_ARG="--writer-type ${WriterType}"
 fi
 
+# shard of the subscriptions this instance collects
+NODE_ARGS=""
+if [ -n "${NodeIndex}" ] && [ -n "${NodeCount}" ]; then
+  NODE_ARGS="--node-index ${NodeIndex} --node-count ${NodeCount}"
+fi
+
+# make reads the arguments of the run target from the environment
+export BUFFER_SIZE_ARG SLEEP_DURATION_ARG WRITER_TYPE_ARG NODE_ARGS
+
 # add local bin to path
 export PATH="/root/.local/bin:$PATH"
 # Set environment variables
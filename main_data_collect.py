@@ -21,6 +21,8 @@ from src.utils.config_loader import load_config_by_name
 from src.writer.factory import create_writer
 from src.data_collector import DataCollector
 from src.exchanges.exchange_factory import create_exchange
+from src.supervisor import Supervisor
+from src.utils.sharding import node_from_config, normalize_config, shard_config
 
 
 def parse_args():
@@ -35,6 +37,13 @@ def parse_args():
     # Argument to overwrite sleep duration
     parser.add_argument('--sleep-duration', type=int, help='Sleep duration for the data collector.')
     
+    # Argument to overwrite the number of worker processes
+    parser.add_argument('--workers', type=int, help='Number of worker processes the pairs are split over.')
+    
+    # Arguments to collect only this instance's shard of the subscriptions
+    parser.add_argument('--node-index', type=int, help='Index of this collector instance in the fleet.')
+    parser.add_argument('--node-count', type=int, help='Number of collector instances in the fleet.')
+    
     return parser.parse_args()
 
 def main():
@@ -48,11 +57,29 @@ def main():
     # Overwrite with command line arguments if provided
     if args.sleep_duration:
         data_collector_config['sleep_duration'] = args.sleep_duration
-        
+    
     exchanges = [create_exchange(name) for name in data_collector_config["pairs"].keys()]
     logging.info(f"Initialized exchanges: {[exchange.name for exchange in exchanges]}")
+    # one spelling per market, so that it is sharded, assigned and counted as one
+    exchanges_by_name = {exchange.name: exchange for exchange in exchanges}
+    data_collector_config = normalize_config(
+        data_collector_config, lambda exchange, pair: exchanges_by_name[exchange].market_name(pair)
+    )
+    
+    # the command line takes precedence over the NODE_* environment variables and the config
+    sharding_config = data_collector_config.get("sharding", {})
+    node_id, members = node_from_config(sharding_config,
+                                        overrides={"node_index": args.node_index, "node_count": args.node_count})
+    if node_id is not None:
+        data_collector_config = shard_config(data_collector_config, node_id, members,
+                                             sharding_config.get("virtual_nodes", 128))
+        logging.info(f"Node {node_id} of {members} collects {data_collector_config['subscriptions']}")
+    
+    supervisor_config = data_collector_config.get("supervisor", {})
+    if args.workers:
+        supervisor_config['workers'] = args.workers
     
-    # load writer config and initialize writer
+    # load writer config
     writer_config = load_config_by_name("writer")
     
     # Overwrite with command line arguments if provided
@@ -63,10 +90,37 @@ def main():
         logging.info(f"Overwriting buffer size with {args.buffer_size}")
         writer_config['buffer_size'] = args.buffer_size
     
-    writer = create_writer(writer_config)
+    top_of_book = None
+    top_of_book_config = data_collector_config.get("top_of_book") or {}
+    if top_of_book_config.get("enabled", False):
+        from src.live.top_of_book import TopOfBook, instruments_from_config
+        # one instrument ID per market of the node, assigned before the pairs are split over workers
+        top_of_book = TopOfBook.create(top_of_book_config.get("name", "collector-top-of-book"),
+                                       instruments_from_config(data_collector_config))
+    try:
+        collect(data_collector_config, supervisor_config, writer_config, exchanges, node_id)
+    finally:
+        if top_of_book is not None:
+            top_of_book.close()
+
+
+def collect(data_collector_config: dict, supervisor_config: dict, writer_config: dict, exchanges: list, node_id):
+    """Collects in worker processes or in this process until a shutdown signal."""
+    if supervisor_config.get("workers", 1) > 1:
+        # split the pairs over worker processes, each with its own exchanges and writer
+        supervisor = Supervisor(data_collector_config, writer_config, **supervisor_config)
+        signal.signal(signal.SIGINT, supervisor.shutdown)
+        signal.signal(signal.SIGTERM, supervisor.shutdown)
+        supervisor.run_forever()
+        return
+    
+    # a node may be left without the subscriptions of an exchange
+    exchanges = [exchange for exchange in exchanges if exchange.name in data_collector_config["pairs"]]
+    
+    writer = create_writer(writer_config, writer_id=node_id)
     
     # initialize data collector
-    data_collector = DataCollector(exchanges, writer)
+    data_collector = DataCollector(exchanges, writer, config=data_collector_config)
     
     # register signal handler to stop data collection
     # Attach signal handlers
@@ -1,6 +1,6 @@
-from datetime import datetime
 import time
 from typing import List
+from collections import Counter
 import sys
 import logging
 import traceback
@@ -11,31 +11,176 @@ from src.exchanges.exchange_interface import ExchangeInterface
 from src.utils.config_loader import load_config_by_name
 from src.writer.writer_interface import WriterInterface
 from src.utils.http_helpers import async_retry_on_failure
+from src.utils.clock import now_ns, ms_to_ns
+from src.utils.metrics import LatencyHistogram
+from src.utils.dedup import RecentIdIndex
+from src.utils.event_bus import EventBus
+from src.utils.sharding import subscriptions_from_config
+from src.watchdog import StallWatchdog
 
 logger = logging.getLogger(__name__)
 
 
 class DataCollector:
 
-    def __init__(self, exchanges: List[ExchangeInterface] = None, writer: WriterInterface = None):
+    def __init__(self, exchanges: List[ExchangeInterface] = None, writer: WriterInterface = None, config: dict = None):
+        """
+        Args:
+            exchanges (List[ExchangeInterface], optional): exchanges to collect from.
+            writer (WriterInterface, optional): writer that persists the collected data.
+            config (dict, optional): data collector config. Loaded from the config file if not given,
+                worker processes pass their own subset of pairs.
+        """
         self.exchanges = exchanges
         self.writer = writer
         self.collection_mode = None
         self.limit = None
         self.pairs = None
         self._sleep_duration = None
-        self.config = self._load_config()
+        # number of messages collected per (exchange, market) since the last pop_message_counts
+        self.message_counts = Counter()
+        self.config = config if config is not None else self._load_config()
         self._set_attributes_from_config(self.config)
         if self.collection_mode not in ["sync", "async", "websocket"]:
             raise ValueError(f"Collection mode {self.collection_mode} is not supported.")
         
         self.collection_fnc = self._async_fetch_orderbooks if self.collection_mode == "async" else self._sync_fetch_orderbooks
+        self.watchdog = None
+        self.live_store = None
+        self.live_api = None
+        self.top_of_book = None
+        self.feed = None
+        self.portfolio = None
+        self._balances_due = None
+        # stages computing their own event types from the collected events, written like them
+        self.derived = []
+        # trades polled in the REST collection modes: last exchange timestamp and recent ids per (exchange, pair)
+        self._trade_cursors = {}
+        self._seen_trades = {}
+        # the collected events of all exchanges, consumed by the live stages and the derived event types
+        self.bus = EventBus()
         if self.collection_mode == "websocket":
+            conflation_config = dict(self.config.get("conflation") or {})
+            conflation = conflation_config if conflation_config.pop("enabled", False) else None
+            for exchange in self.exchanges:
+                exchange.set_bus(self.bus)
+                exchange.set_conflation(conflation)
             self._initialize_websocket()
+            watchdog_config = dict(self.config.get("watchdog") or {})
+            if watchdog_config.pop("enabled", False):
+                self.watchdog = StallWatchdog(self.exchanges, **watchdog_config)
+            live_config = dict(self.config.get("live_store") or {})
+            if live_config.pop("enabled", False):
+                self._start_live_store(live_config)
+            top_of_book_config = self.config.get("top_of_book") or {}
+            if top_of_book_config.get("enabled", False):
+                self._start_top_of_book(top_of_book_config)
+            feed_config = dict(self.config.get("feed") or {})
+            if feed_config.pop("enabled", False):
+                self._start_feed(feed_config)
+            portfolio_config = dict(self.config.get("portfolio") or {})
+            if portfolio_config.pop("enabled", False):
+                self._start_portfolio(portfolio_config)
+            arbitrage_config = dict(self.config.get("arbitrage") or {})
+            if arbitrage_config.pop("enabled", False):
+                self._start_arbitrage(arbitrage_config)
+        # also fed by the books and trades the REST collection modes poll
+        features_config = dict(self.config.get("features") or {})
+        if features_config.pop("enabled", False):
+            self._start_features(features_config)
+        bars_config = dict(self.config.get("bars") or {})
+        if bars_config.pop("enabled", False):
+            self._start_bars(bars_config)
             
         self._counter = 0
+        # latency histograms of the REST responses keyed by (exchange, event type)
+        self.latency = {}
 
                     
+    def _start_live_store(self, live_config: dict) -> None:
+        """Keeps the latest events in a rolling store and serves it over the local HTTP API if a port is set."""
+        # numpy is only imported when the live store is enabled
+        from src.live.rolling_store import RollingStore
+        from src.live.api import LiveApi
+        host = live_config.pop("host", "127.0.0.1")
+        port = live_config.pop("port", None)
+        self.live_store = RollingStore(**live_config)
+        self.bus.subscribe(self.live_store.append, name="live_store", event_types=list(self.live_store.columns))
+        if port is not None:
+            self.live_api = LiveApi(self.live_store, host, port)
+            self.live_api.start()
+
+    def _start_top_of_book(self, top_of_book_config: dict) -> None:
+        """Publishes the best bid and ask of the collected markets in the shared-memory table."""
+        from src.live.top_of_book import TopOfBook, instruments_from_config
+        name = top_of_book_config.get("name", "collector-top-of-book")
+        try:
+            # created by the main process for all workers of the node
+            self.top_of_book = TopOfBook.attach(name)
+        except FileNotFoundError:
+            self.top_of_book = TopOfBook.create(name, instruments_from_config(self.config))
+        self.bus.subscribe(self.top_of_book.update, name="top_of_book", event_types=["orderbook", "ticker"])
+
+    def _start_feed(self, feed_config: dict) -> None:
+        """Publishes the collected events to local subscribers over a Unix domain socket."""
+        from src.live.feed import EVENT_TYPES, FeedServer
+        self.feed = FeedServer(**feed_config)
+        self.feed.start()
+        self.bus.subscribe(self.feed.publish, name="feed", event_types=EVENT_TYPES)
+
+    def _start_features(self, features_config: dict) -> None:
+        """Computes microstructure features from the books and trades, written as the features event type."""
+        from src.live.features import FeatureEngine
+        from src.writer.schemas import register_schema
+        engine = FeatureEngine(**features_config)
+        register_schema(engine.event_type, engine.schema())
+        self.bus.subscribe(engine.update, name="features", event_types=["orderbook", "trades"])
+        self.derived.append(engine)
+
+    def _start_portfolio(self, portfolio_config: dict) -> None:
+        """Values the balances of the exchanges with the live books, written as the portfolio event type."""
+        from src.live.portfolio import PortfolioValuation
+        from src.writer.schemas import register_schema
+        self._balance_interval = portfolio_config.pop("balance_interval", 60)
+        self.portfolio = PortfolioValuation(
+            fiats={exchange.name: exchange.exchange_fiat for exchange in self.exchanges},
+            commissions={exchange.name: exchange.commision for exchange in self.exchanges},
+            **portfolio_config)
+        register_schema(self.portfolio.event_type, self.portfolio.schema())
+        self.bus.subscribe(self.portfolio.update, name="portfolio", event_types=["orderbook"])
+        self.derived.append(self.portfolio)
+        self.refresh_balances()
+
+    def _start_arbitrage(self, arbitrage_config: dict) -> None:
+        """Scans the books for cross-exchange arbitrage, written as the arbitrage event type and published on the bus."""
+        from src.live.arbitrage import ArbitrageScanner
+        from src.writer.schemas import register_schema
+        scanner = ArbitrageScanner(
+            fiats={exchange.name: exchange.exchange_fiat for exchange in self.exchanges},
+            commissions={exchange.name: exchange.commision for exchange in self.exchanges},
+            publish=self.bus.publish, **arbitrage_config)
+        register_schema(scanner.event_type, scanner.schema())
+        self.bus.subscribe(scanner.update, name="arbitrage", event_types=["orderbook"])
+        self.derived.append(scanner)
+
+    def refresh_balances(self) -> None:
+        """Fetches the balances of every exchange for the portfolio valuation, keeping the last ones on errors."""
+        for exchange in self.exchanges:
+            try:
+                self.portfolio.set_balances(exchange.name, exchange.fetch_balance())
+            except Exception as e:
+                logger.warning(f"Could not fetch the balances of {exchange.name}: {e}")
+        self._balances_due = time.monotonic() + self._balance_interval
+
+    def _start_bars(self, bars_config: dict) -> None:
+        """Aggregates the trades to OHLCV bars, written as the bars event type."""
+        from src.live.bars import BarAggregator
+        from src.writer.schemas import register_schema
+        aggregator = BarAggregator(**bars_config)
+        register_schema(aggregator.event_type, aggregator.schema())
+        self.bus.subscribe(aggregator.update, name="bars", event_types=["trades"])
+        self.derived.append(aggregator)
+
     def _load_config(self) -> dict:
         """Load configuration for data collector."""
         return load_config_by_name("data_collector")
@@ -47,6 +192,8 @@ class DataCollector:
         self._sleep_duration = config["sleep_duration"]
         self.pairs = config["pairs"]
         self.event_types = config["event_types"]
+        # exchange -> event type -> markets, a sharded node only has a subset of pairs x event types
+        self.subscriptions = subscriptions_from_config(config)
         exchange_names = list(self.pairs.keys())
         if set(exchange_names) != (set(self.event_types.keys())): 
             msg = "Exchange names in trading pairs and event types in config does not match"
@@ -61,7 +208,7 @@ class DataCollector:
         tasks = [
             exchange.async_fetch_orderbook(pair, self.limit)
             for exchange in self.exchanges
-            for pair in self.pairs[exchange.name]
+            for pair in self._orderbook_pairs(exchange.name)
         ]
         orderbooks = await asyncio.gather(*tasks)
         return orderbooks
@@ -71,9 +218,12 @@ class DataCollector:
         return [
             exchange.fetch_orderbook(pair, self.limit)
             for exchange in self.exchanges
-            for pair in self.pairs[exchange.name]
+            for pair in self._orderbook_pairs(exchange.name)
         ]
 
+    def _orderbook_pairs(self, exchange_name: str) -> List[str]:
+        return self.subscriptions.get(exchange_name, {}).get("orderbook", [])
+
     def fetch_orderbooks(self) -> List[dict]:
         """Fetch order books using either async or sync methods based on the configuration."""
         if asyncio.iscoroutinefunction(self.collection_fnc):
@@ -83,11 +233,88 @@ class DataCollector:
         else:
             raise NotImplementedError(f"Collection mode {self.collection_mode} is not implemented.")
         
-        now = datetime.now()
+        now = now_ns()
         for book in data:
             book["fetch_time"] = now
+            if book.get("timestamp") is not None:
+                key = (book["exchange"], "orderbook")
+                if key not in self.latency:
+                    self.latency[key] = LatencyHistogram()
+                self.latency[key].record(now - ms_to_ns(book["timestamp"]))
+            # the REST books are keyed by pair, published normalized like the websocket ones
+            self.bus.publish({"event": "orderbook", "exchange": book["exchange"], "market": book["pair"],
+                              "timestamp": book.get("timestamp"), "fetch_time": now,
+                              "bids": book["bids"], "asks": book["asks"]})
         
         return {"orderbook": data}
+
+    def _trade_pairs(self, exchange_name: str) -> List[str]:
+        return self.subscriptions.get(exchange_name, {}).get("trades", [])
+
+    def fetch_trades(self) -> List[dict]:
+        """New public trades of the subscribed pairs since the last poll, for the REST collection modes."""
+        trades = []
+        for exchange in self.exchanges:
+            for pair in self._trade_pairs(exchange.name):
+                key = (exchange.name, pair)
+                seen = self._seen_trades.setdefault(key, RecentIdIndex())
+                # the cursor's millisecond is fetched again, its trades are dropped by id
+                new = [trade for trade in exchange.fetch_trades(pair, self._trade_cursors.get(key))
+                       if seen.add(trade["id"])]
+                if new:
+                    self._trade_cursors[key] = max(int(trade["timestamp"]) for trade in new)
+                trades.extend(new)
+        return trades
+
+    def _add_derived_data(self, data: dict) -> dict:
+        for stage in self.derived:
+            records = stage.extract_data()
+            if records:
+                data.setdefault(stage.event_type, []).extend(records)
+        return data
+
+    def _count_messages(self, data: dict) -> None:
+        derived = {stage.event_type for stage in self.derived}
+        for event_type, event_data in data.items():
+            if event_type in derived:
+                continue
+            for record in event_data:
+                self.message_counts[(record.get("exchange"), record.get("market") or record.get("pair"))] += 1
+
+    def _count_conflated(self) -> None:
+        """Counts the conflated orderbook updates as well, they are load though they are not written."""
+        for exchange in self.exchanges:
+            for market, count in exchange.pop_conflated_counts().items():
+                self.message_counts[(exchange.name, market)] += count
+
+    def pop_message_counts(self) -> Counter:
+        """Returns the message counts per (exchange, market) and starts counting from zero."""
+        counts, self.message_counts = self.message_counts, Counter()
+        return counts
+
+    def latency_report(self) -> dict:
+        """Exchange timestamp to receive time latency summaries keyed by (exchange, event type)."""
+        histograms = dict(self.latency)
+        if self.collection_mode == "websocket":
+            for exchange in self.exchanges:
+                for event_type, histogram in exchange.latency_stats().items():
+                    histograms[(exchange.name, event_type)] = histogram
+        return {key: histogram.summary() for key, histogram in histograms.items()}
+
+    def log_latency_report(self) -> None:
+        for (exchange, event_type), summary in self.latency_report().items():
+            if summary["count"]:
+                logger.info(f"latency {exchange}/{event_type}: {summary}")
+        if self.collection_mode == "websocket":
+            for exchange in self.exchanges:
+                for event_type, duplicates in exchange.duplicate_stats().items():
+                    logger.info(f"duplicates dropped {exchange.name}/{event_type}: {duplicates}")
+                for event_type, conflation in exchange.conflation_stats().items():
+                    logger.info(f"conflation {exchange.name}/{event_type}: {conflation}")
+        if self.bus.subscriptions:
+            logger.info(f"event bus: {self.bus.stats()}")
+        if self.watchdog is not None and self.watchdog.stalls:
+            logger.info(f"stalls: {self.watchdog.summary()}")
     
     def graceful_shutdown(self, signum, frame):
         """Handle graceful shutdown of the data collector."""
@@ -98,6 +325,13 @@ class DataCollector:
                 self.writer.append(event_data, event_type)
             for x in self.exchanges:
                 x.close_socket()
+            if self.live_api is not None:
+                self.live_api.stop()
+            if self.top_of_book is not None:
+                self.top_of_book.close()
+            if self.feed is not None:
+                self.feed.stop()
+            self.bus.close()
         
         for event_type in self.writer.buffer.keys():
             self.writer.save_and_refresh(event_type)
@@ -118,19 +352,34 @@ class DataCollector:
                 # Add new capabilities for fetching other event types
                 if self.collection_mode in ["sync", "async"]:
                     data = self.fetch_orderbooks()
+                    trades = self.fetch_trades()
+                    if trades:
+                        data["trades"] = trades
+                        # the websocket handlers publish their trades, polled ones are published here
+                        for trade in trades:
+                            self.bus.publish(trade)
+                    data = self._add_derived_data(data)
                 else:
                     # check if socket is closed and reconnect if necessary
                     self.reconnect()
+                    # resubscribe single streams that went quiet while the socket is up
+                    if self.watchdog is not None:
+                        self.watchdog.maybe_check()
+                    if self.portfolio is not None and time.monotonic() >= self._balances_due:
+                        self.refresh_balances()
                     if self._counter % 100 == 0:
                         data = self._combine_data_across_exchanges()
+                        self._count_conflated()
                         self._counter = 0
                     else:
                         data = None
                 if data is not None:
+                    self._count_messages(data)
                     for event_type in data.keys():
                         self.writer.append(data[event_type], event_type)
                         if self.writer.is_buffer_full(event_type):
                             self.writer.save_and_refresh(event_type)
+                            self.log_latency_report()
                 time.sleep(self._sleep_duration)
             except Exception as e:
                 logger.error("An error occurred: %s\n%s", e, traceback.format_exc())
@@ -142,14 +391,18 @@ class DataCollector:
     def _initialize_websocket(self):
         """Initialize websocket for data collection."""
         for exchange in self.exchanges:
-            exchange.subscribe(self.event_types[exchange.name], self.pairs[exchange.name])
+            self._subscribe(exchange)
             
+    def _subscribe(self, exchange: ExchangeInterface):
+        subscriptions = self.subscriptions.get(exchange.name, {})
+        if subscriptions:
+            exchange.subscribe_markets(subscriptions)
     
     def reconnect(self):
         """Reconnect to websocket."""
         for x in self.exchanges:
             if x.is_socket_closed():
-                x.subscribe(self.event_types[x.name], self.pairs[x.name])
+                self._subscribe(x)
         
     
     def _combine_data_across_exchanges(self) -> dict:
@@ -166,5 +419,5 @@ class DataCollector:
                 if event_type not in data:
                     data[event_type] = []
                 data[event_type].extend(event_data)
-        return data
+        return self._add_derived_data(data)
                 
\ No newline at end of file
@@ -6,11 +6,12 @@ import time
 import threading
 import json
 
-import httpx
+import websocket
 from python_bitvavo_api.bitvavo import Bitvavo as BitvavoWrapper
 from python_bitvavo_api.bitvavo import errorToConsole
 from python_bitvavo_api.bitvavo import debugToConsole
 from python_bitvavo_api.bitvavo import createSignature
+from python_bitvavo_api.bitvavo import sortAndInsert, bidsCompare, asksCompare
 
 from src.exchanges.exceptions import (
     MissingApiKeyError, PairNotFoundError, AssetNotFoundError
@@ -19,11 +20,15 @@ from src.exchanges.exchange_interface import ExchangeInterface
 from src.utils.config_loader import load_config_by_name
 from src.utils.http_helpers import retry_on_failure, requires_authentication
 from src.ws_handlers.bitvavo import BitvavoWSHandler
+from src.utils.clock import now_ns, NS_PER_MS
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# event type -> Bitvavo websocket channel
+CHANNELS = {"orderbook": "book", "ticker": "ticker", "trades": "trades"}
+
 
 class CustomBitvavoWrapper(BitvavoWrapper):
     def __init__(self, *args, **kwargs):
@@ -35,64 +40,172 @@ class CustomBitvavoWrapper(BitvavoWrapper):
         
         
     class customWebSocket(BitvavoWrapper.websocket):
-        def __init__(self, *args, **kwargs):
+        def __init__(self, *args, ping_interval: int = 5, ping_timeout: int = 3, **kwargs):
             logger.info("initializing custom websocket")
+            # number of markets per channel in a single subscribe message
+            self.batch_size = 50
+            self.ping_interval = ping_interval
+            self.ping_timeout = ping_timeout
+            # called with the disconnect time, and with the disconnect and reconnect times once resubscribed
+            self.disconnect_callback = None
+            self.reconnect_callback = None
+            self.disconnected_at = None
             super().__init__(*args, **kwargs)
             
-        def on_error(self, error):
+        def subscribe_channels(self, channels: Dict[str, Tuple[List[str], callable]], batch_size: int = None):
+            """Subscribes several channels with one message per batch of markets instead of one message per market.
+
+            Args:
+                channels (Dict[str, Tuple[List[str], callable]]): channel name ("book", "ticker", "trades")
+                    -> (markets, callback)
+                batch_size (int, optional): maximum number of markets per channel in a message.
+            """
+            if batch_size is not None:
+                self.batch_size = batch_size
+            for name, (markets, callback) in channels.items():
+                self._register_subscription(name, markets, callback)
+            
+            longest = max((len(markets) for markets, _ in channels.values()), default=0)
+            for start in range(0, longest, self.batch_size):
+                batch = [{"name": name, "markets": markets[start:start + self.batch_size]}
+                         for name, (markets, _) in channels.items() if markets[start:start + self.batch_size]]
+                self.doSend(self.ws, json.dumps({"action": "subscribe", "channels": batch}))
+            
+            # the local books are initialized from a snapshot of each market
+            for market in channels.get("book", ([], None))[0]:
+                self.doSend(self.ws, json.dumps({"action": "getBook", "market": market}))
+            
+        def _register_subscription(self, name: str, markets: List[str], callback):
+            # same bookkeeping as the sdk's subscriptionX methods, so on_message dispatches to the callback
+            if name == "book":
+                self.keepBookCopy = True
+                self.callbacks.setdefault("subscriptionBookUser", {})
+                self.callbacks.setdefault("subscriptionBook", {})
+                for market in markets:
+                    self.callbacks["subscriptionBookUser"][market] = callback
+                    self.callbacks["subscriptionBook"][market] = self._process_book
+                    self.localBook[market] = {}
+            elif name == "ticker":
+                self.callbacks.setdefault("subscriptionTicker", {}).update({m: callback for m in markets})
+            elif name == "trades":
+                self.callbacks.setdefault("subscriptionTrades", {}).update({m: callback for m in markets})
+            else:
+                raise ValueError(f"Unsupported channel {name}")
+            
+        def _process_book(self, ws, message):
+            """Maintains the local book of a market, replaces the sdk's processLocalBook.
+
+            The sdk looks up a callback that is never registered when an update skips a nonce and
+            reads the book from the websocket app it is given, so both are handled on the socket itself.
+            """
+            if message.get("action") == "getBook":
+                snapshot = message["response"]
+                market = snapshot["market"]
+                self.localBook[market] = {"bids": snapshot["bids"], "asks": snapshot["asks"],
+                                          "nonce": snapshot["nonce"], "market": market}
+            elif message.get("event") == "book":
+                market = message["market"]
+                book = self.localBook.get(market)
+                if not book or "nonce" not in book:
+                    # the snapshot is still on its way, updates before it are covered by it
+                    return
+                if message["nonce"] != book["nonce"] + 1:
+                    logger.warning(f"Nonce gap in the {market} book, requesting a new snapshot.")
+                    self.request_book(market)
+                    return
+                book["bids"] = sortAndInsert(book["bids"], message["bids"], bidsCompare)
+                book["asks"] = sortAndInsert(book["asks"], message["asks"], asksCompare)
+                book["nonce"] = message["nonce"]
+            else:
+                return
+            self.callbacks["subscriptionBookUser"][market](self.localBook[market])
+
+        def resubscribe_market(self, name: str, market: str):
+            """Unsubscribes and subscribes a single channel of a market, the other subscriptions are not touched."""
+            channels = [{"name": name, "markets": [market]}]
+            self.doSend(self.ws, json.dumps({"action": "unsubscribe", "channels": channels}))
+            self.doSend(self.ws, json.dumps({"action": "subscribe", "channels": channels}))
+            if name == "book":
+                self.request_book(market)
+
+        def request_book(self, market):
+            # the book is rebuilt from a new snapshot, updates are dropped until it arrives
+            self.localBook[market] = {}
+            self.doSend(self.ws, json.dumps({"action": "getBook", "market": market}))
+            
+        def checkReconnect(self):
+            # resubscribe everything in batches rather than market by market
+            channels = {}
+            for name, key in [("book", "subscriptionBookUser"), ("ticker", "subscriptionTicker"), ("trades", "subscriptionTrades")]:
+                callbacks = self.callbacks.get(key, {})
+                if callbacks:
+                    # there is one handler per event type, so all markets of a channel share the callback
+                    channels[name] = (list(callbacks), next(iter(callbacks.values())))
+            self.subscribe_channels(channels)
+            
+        def subscribe(self):
+            # same as the sdk, but the receive thread pings the server so that half open connections are detected
+            websocket.enableTrace(False)
+            self.ws = websocket.WebSocketApp(self.wsUrl,
+                                             on_message=self.on_message,
+                                             on_error=self.on_error,
+                                             on_close=self.on_close,
+                                             on_open=self.on_open)
+            self.receiveThread = threading.Thread(target=self._run, daemon=True)
+            self.receiveThread.start()
+            self.authenticated = False
+            self.keepBookCopy = False
+            self.localBook = {}
+            
+        def _run(self):
+            while self.keepAlive:
+                self.ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+                self.reconnect = True
+                self.authenticated = False
+                if self.keepAlive:
+                    time.sleep(self.reconnectTimer)
+                    self.reconnectTimer = min(self.reconnectTimer * 2, 30)
+                    
+        def waitForSocket(self, ws, message, private):
+            # the sdk recurses every 0.1 seconds, which overflows the stack during a long outage
+            while not ((not private and self.open) or (private and self.authenticated and self.open)):
+                time.sleep(0.05)
+            
+        def on_error(self, ws, error):
             if "error" in self.callbacks:
                 self.callbacks["error"](error)
             else:
                 errorToConsole(error)
                 
-        def on_close(self):
-            if hasattr(self.ws, "receiveThread"):
-                if hasattr(self.ws.receiveThread, "exit"):
-                    self.ws.receiveThread.exit()
-            else:
-                logger.warning("'receiveThread' object has no attribute 'exit'")
-                # Using closeSocket to ensure proper closure
-                logger.warning("Closing the socket with manual closeSocket method")
-                self.close_socket_safely()
-                
+        def on_close(self, ws, close_status_code=None, close_msg=None):
+            # the receive thread reconnects unless the socket was closed on purpose
+            self.open = False
+            if self.disconnected_at is None:
+                self.disconnected_at = now_ns()
+            logger.warning(f"Bitvavo websocket closed: {close_status_code} {close_msg}")
+            if self.keepAlive and self.disconnect_callback is not None:
+                self.disconnect_callback(self.disconnected_at)
                 
-        def on_open(self):
+        def on_open(self, ws):
             now = int(time.time()*1000)
             self.open = True
-            self.reconnectTimer = 0.5
+            self.reconnectTimer = 0.1
             if(self.APIKEY != ''):
                 self.doSend(self.ws, json.dumps({ 'window':str(self.ACCESSWINDOW), 'action': 'authenticate', 'key': self.APIKEY, 'signature': createSignature(now, 'GET', '/websocket', {}, self.APISECRET), 'timestamp': now }))
             if self.reconnect:
                 debugToConsole("we started reconnecting", self.checkReconnect)
-                thread = threading.Thread(target = self.checkReconnect)
+                thread = threading.Thread(target=self._resubscribe, daemon=True)
                 thread.start()
-            
-        def close_socket_safely(self):
-            if self.ws and hasattr(self.ws, 'close'):
-                try:
-                    self.ws.close()
-                    if hasattr(self.ws, 'keepAlive'):
-                        self.ws.keepAlive = False
-                    
-                    # Check if 'receiveThread' exists and join it to ensure its termination
-                    if hasattr(self.ws, 'receiveThread') and self.ws.receiveThread.is_alive():
-                        self.ws.receiveThread.join()
-                    logger.info("Socket closed safely.")
-                except Exception as e:
-                    logger.error(f"Error while closing socket: {e}")
+                
+        def _resubscribe(self):
+            self.checkReconnect()
+            disconnected_at, self.disconnected_at = self.disconnected_at, None
+            if self.reconnect_callback is not None and disconnected_at is not None:
+                self.reconnect_callback(disconnected_at, now_ns())
         
         def is_socket_closed(self):
-            if not hasattr(self, 'ws'):
-                return True
-            if hasattr(self.ws, 'connected'):
-                return not self.ws.connected
-            if hasattr(self.ws, 'keepAlive'):
-                return not self.ws.keepAlive
-            if hasattr(self.ws, 'closed'):
-                return self.ws.closed
-            if hasattr(self.ws, 'keep_running'):
-                return not self.ws.keep_running
-            return False
+            # a dropped connection is reopened by the receive thread, the socket is closed only if that thread stopped
+            return not self.keepAlive or not self.receiveThread.is_alive()
         
         
 class Bitvavo(ExchangeInterface):
@@ -135,22 +248,32 @@ class Bitvavo(ExchangeInterface):
         self.base_endpoint = config["base_endpoint"]
         self.exchange_info_url = config["exchange_info_url"]
         self.assets_info_url = config["assets_info_url"]
+        self.subscription_batch_size = config["ws_subscription_batch_size"]
+        self.backfill_page_size = config["backfill_page_size"]
+        self.backfill_max_pages = config["backfill_max_pages"]
     
     def _handle_endpoints(self, config):
         for key in ["exchange_info_url", "assets_info_url"]:
             config[key] = config["base_endpoint"] + config[key]
         return config
     
-    @retry_on_failure()
     def _fetch_exchange_info(self):
-        """Fetches the exchange info from the exchange and sets the attributes
+        """Sets the pairs and assets, from the metadata cache if configured
         """
-        self._exchange_info  = self.wrapper.markets({})
-        self._pairs = {pair["market"]: pair for pair in self._exchange_info}
+        self._load_exchange_info(self.config)
+    
+    @retry_on_failure()
+    def _request_exchange_info(self) -> dict:
+        return {"markets": self.wrapper.markets({}), "assets": self.wrapper.assets({})}
+    
+    def _set_exchange_info(self, exchange_info: dict):
+        self._exchange_info  = exchange_info["markets"]
+        pairs = {pair["market"]: pair for pair in self._exchange_info}
         # also add pairidentifier without dash
-        self._pairs_normalized = {k.replace(self.pair_sep, ""): v for k,v in self._pairs.items()}
+        self._pairs_normalized = {k.replace(self.pair_sep, ""): v for k,v in pairs.items()}
+        self._pairs = pairs
         
-        self._assets  = {asset["symbol"]: asset for asset in self.wrapper.assets({})}
+        self._assets  = {asset["symbol"]: asset for asset in exchange_info["assets"]}
         
     def _get_pair(self, pair:str) -> dict:
         # convert to upercase
@@ -191,12 +314,26 @@ class Bitvavo(ExchangeInterface):
         }
     
         
+    def fetch_trades(self, pair: str, since: int = None) -> List[dict]:
+        options = {"start": since} if since is not None else {}
+        fetch_time = now_ns()
+        trades = self.wrapper.publicTrades(self._get_pair_name(pair), options)
+        return [
+            {"event": "trades", "exchange": self.name, "market": pair, "id": trade["id"],
+             "timestamp": trade["timestamp"], "price": trade["price"], "amount": trade["amount"],
+             "side": trade["side"], "fetch_time": fetch_time}
+            # the API returns the newest first
+            for trade in reversed(trades)
+        ]
+
     async def async_fetch_orderbook(self, pair:str, limit: int = None) -> dict:
         pair_name = self._get_pair_name(pair)
         url = self.base_endpoint + f"/{pair_name}/book"
         if limit:
             url += f"?depth={limit}"
         
+        # only the async collection mode needs httpx
+        import httpx
         async with httpx.AsyncClient() as client:
             response = await client.get(url)
             data = response.json()
@@ -232,52 +369,102 @@ class Bitvavo(ExchangeInterface):
         """
         if isinstance(event_types, str):
             event_types = [event_types]
-        if not set(event_types).issubset(["orderbook", "ticker", "trades"]): 
-            logger.error(f"invalid event type {event_types}")
-            raise ValueError
+        self.subscribe_markets({event: pairs for event in event_types})
+        
+    def subscribe_markets(self, subscriptions: Dict[str, List[str]]):
+        """Subscribe to several event types at once. All event types are sent together
+        in batched multi-market messages, so subscribing takes a few round trips instead of one per market.
 
-        fnc_mapping = {
-            "orderbook": self._subscribe_orderbook,
-            "ticker": self._subscribe_ticker,
-            "trades": self._subscribe_trades
-        }
-        for event in event_types:
+        Args:
+            subscriptions (Dict[str, List[str]]): event type -> pairs, such as {"orderbook": ["BTC-EUR"], "trades": ["ETH-EUR"]}
+
+        Raises:
+            ValueError: if event type is not supported
+        """
+        if not set(subscriptions).issubset(CHANNELS): 
+            logger.error(f"invalid event type {list(subscriptions)}")
+            raise ValueError
+        
+        channels = {}
+        for event, pairs in subscriptions.items():
             logger.info(f"subscribing to {event} for pairs:{pairs} in exchange {self.name}")
-            fnc_mapping[event](pairs)
+            pair_names, callback = self._subscribe_ws(event, pairs)
+            channels[CHANNELS[event]] = (pair_names, callback)
+        self.socket.subscribe_channels(channels, self.subscription_batch_size)
             
         # set global error callback
         # since errorCallback is not specific to an event type, we can only set one
-        self.socket.setErrorCallback(self.ws_handlers[event_types[0]].error_callback)
-        
-    def _subscribe_orderbook(self, pairs:List[str]) -> dict:
-        pair_names, callback = self._subscribe_ws("orderbook", pairs)
-        for p in pair_names:
-            self.socket.subscriptionBook(p, callback)
-            time.sleep(0.3)
-    
-    def _subscribe_ticker(self, pairs:List[str]) -> dict:
-        pair_names, callback = self._subscribe_ws("ticker", pairs)
-        for p in pair_names:
-            self.socket.subscriptionTicker(p, callback)
-            time.sleep(0.3)
-    
-    def _subscribe_trades(self, pairs:List[str]) -> dict:
-        pair_names, callback = self._subscribe_ws("trades", pairs)
-        for p in pair_names:
-            self.socket.subscriptionTrades(p, callback)
-            time.sleep(0.3)
+        self.socket.setErrorCallback(self.ws_handlers[next(iter(subscriptions))].error_callback)
 
     def _subscribe_ws(self, event_type:str, pairs:List[str]) -> dict:
-        if self.socket is None:
+        if self.socket is None or self.socket.is_socket_closed():
             self.socket = self.wrapper.newWebsocket()
-        ws_handler = BitvavoWSHandler(event_type, self.socket)
-        # register the handler
-        self.ws_handlers[event_type] = ws_handler
+            self.socket.disconnect_callback = self.on_socket_disconnect
+            self.socket.reconnect_callback = self.on_socket_reconnect
         
         if isinstance(pairs, str):
             pairs = [pairs]
-        pair_names = [self._get_pair_name(pair) for pair in pairs]
+        # the same market may be configured twice, e.g. BTC-EUR and BTC_EUR
+        pair_names = list(dict.fromkeys(self._get_pair_name(pair) for pair in pairs))
+        
+        # keep the existing handler on resubscription so that its buffered data is not orphaned
+        ws_handler = self.ws_handlers.get(event_type)
+        if ws_handler is None:
+            ws_handler = BitvavoWSHandler(event_type, self.socket, pairs=[])
+            self._configure_handler(ws_handler)
+            # register the handler
+            self.ws_handlers[event_type] = ws_handler
+        ws_handler.socket = self.socket
+        ws_handler.pairs = list(dict.fromkeys(ws_handler.pairs + pair_names))
         return pair_names, ws_handler.callback
-
     
-    
\ No newline at end of file
+    def resubscribe(self, event_type: str, pair: str):
+        self.socket.resubscribe_market(CHANNELS[event_type], pair)
+    
+    def backfill(self, event_type: str, pair: str, start: int, end: int) -> bool:
+        """Pushes REST data covering the interval through the websocket handler of the event type.
+        Orderbooks and tickers are filled with a snapshot, trades with the public trades of the interval.
+        """
+        handler = self.ws_handlers[event_type]
+        if event_type == "orderbook":
+            handler.callback(self.wrapper.book(pair, {"depth": handler.limit}))
+        elif event_type == "ticker":
+            book = self.wrapper.tickerBook({"market": pair})
+            handler.callback({"market": pair, "bestBid": book.get("bid"), "bestBidSize": book.get("bidSize"),
+                              "bestAsk": book.get("ask"), "bestAskSize": book.get("askSize")})
+        elif event_type == "trades":
+            trades, complete = self._fetch_trades_between(pair, start // NS_PER_MS, end // NS_PER_MS)
+            for trade in trades:
+                trade["market"] = pair
+                handler.callback(trade)
+            return complete
+        else:
+            return False
+        return True
+    
+    def _fetch_trades_between(self, pair: str, start_ms: int, end_ms: int) -> Tuple[List[dict], bool]:
+        """Pages backwards through the public trades of the interval.
+
+        Returns:
+            Tuple[List[dict], bool]: trades oldest first, and whether the whole interval was fetched
+                within the page limit
+        """
+        trades = {}
+        for _ in range(self.backfill_max_pages):
+            page = self.wrapper.publicTrades(pair, {"start": start_ms, "end": end_ms, "limit": self.backfill_page_size})
+            new = [trade for trade in page if trade["id"] not in trades]
+            trades.update((trade["id"], trade) for trade in new)
+            if len(page) < self.backfill_page_size:
+                complete = True
+                break
+            if not new:
+                # a single millisecond holds more trades than a page, the end cannot be moved back any further
+                complete = False
+                break
+            # newest trades come first, the next page ends at the oldest trade so far
+            end_ms = min(int(trade["timestamp"]) for trade in new)
+        else:
+            complete = False
+        if not complete:
+            logger.warning(f"Trades of {pair} could only be backfilled partially.")
+        return sorted(trades.values(), key=lambda trade: int(trade["timestamp"])), complete
@@ -1,11 +1,13 @@
-from typing import Tuple
+from typing import Tuple, List, Dict
 import base64
 import time
 import hmac
 import hashlib
 import logging
 import os
-import httpx
+import json
+import threading
+import websocket
 
 from src.exchanges.exchange_interface import ExchangeInterface
 from src.utils.config_loader import load_config_by_name
@@ -14,10 +16,139 @@ from src.exchanges.exceptions import (
     MissingApiKeyError, PairNotFoundError, AssetNotFoundError
 )
 from src.utils.http_helpers import fetch_json
+from src.ws_handlers.btcturk import BtcTurkWSHandler
+from src.utils.clock import now_ns, NS_PER_MS
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.WARNING)
 
+
+class BtcTurkWebSocket:
+    """
+    Client for the BtcTurk push feed. Messages are JSON arrays of [type, payload].
+    The socket runs in a daemon thread, reconnects with exponential backoff and
+    resubscribes every registered (event type, pair) when the connection opens again.
+    """
+    # event type -> BtcTurk channel name
+    channels = {"orderbook": "orderbook", "trades": "trade", "ticker": "ticker"}
+    # BtcTurk message type -> event type
+    message_types = {431: "orderbook", 421: "trades", 422: "trades", 402: "ticker"}
+    subscribe_type = 151
+    trade_history_type = 421
+
+    def __init__(self, ws_url: str, ping_interval: int = 5, ping_timeout: int = 3):
+        self.ws_url = ws_url
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        # event type -> {pair symbol: callback}, registered from the caller's thread and read on the receive thread
+        self.callbacks = {}
+        self._callbacks_lock = threading.Lock()
+        self.error_callback = None
+        # called with the disconnect time, and with the disconnect and reconnect times once resubscribed
+        self.disconnect_callback = None
+        self.reconnect_callback = None
+        self.disconnected_at = None
+        self.open = False
+        self.keepAlive = True
+        self.reconnectTimer = 0.1
+        self.start()
+
+    def start(self):
+        self.ws = websocket.WebSocketApp(self.ws_url,
+                                         on_message=self.on_message,
+                                         on_error=self.on_error,
+                                         on_close=self.on_close,
+                                         on_open=self.on_open)
+        self.receiveThread = threading.Thread(target=self._run, daemon=True)
+        self.receiveThread.start()
+
+    def _run(self):
+        while self.keepAlive:
+            self.ws.run_forever(ping_interval=self.ping_interval, ping_timeout=self.ping_timeout)
+            self.open = False
+            if self.keepAlive:
+                time.sleep(self.reconnectTimer)
+                self.reconnectTimer = min(self.reconnectTimer * 2, 60)
+
+    def on_open(self, ws):
+        self.reconnectTimer = 0.1
+        with self._callbacks_lock:
+            self.open = True
+            subscriptions = [(event_type, list(pairs)) for event_type, pairs in self.callbacks.items()]
+        for event_type, pairs in subscriptions:
+            for pair in pairs:
+                self._send_subscription(event_type, pair)
+        disconnected_at, self.disconnected_at = self.disconnected_at, None
+        if self.reconnect_callback is not None and disconnected_at is not None:
+            self.reconnect_callback(disconnected_at, now_ns())
+
+    def on_message(self, ws, message):
+        message_type, payload = json.loads(message)
+        event_type = self.message_types.get(message_type)
+        if event_type is None:
+            return
+        callbacks = self.callbacks.get(event_type, {})
+        if message_type == self.trade_history_type:
+            # snapshot of the recent trades sent right after subscribing
+            items = payload.get("items", [])
+        else:
+            items = [payload]
+        for item in items:
+            callback = callbacks.get(item.get("PS", payload.get("event")))
+            if callback is not None:
+                callback(item)
+
+    def on_error(self, ws, error):
+        if self.error_callback is not None:
+            self.error_callback(error)
+        else:
+            logger.error(f"BtcTurk websocket error: {error}")
+
+    def on_close(self, ws, close_status_code=None, close_msg=None):
+        self.open = False
+        if self.disconnected_at is None:
+            self.disconnected_at = now_ns()
+        logger.warning(f"BtcTurk websocket closed: {close_status_code} {close_msg}")
+        if self.keepAlive and self.disconnect_callback is not None:
+            self.disconnect_callback(self.disconnected_at)
+
+    def _send_subscription(self, event_type: str, pair: str, join: bool = True):
+        message = {"type": self.subscribe_type, "channel": self.channels[event_type], "event": pair, "join": join}
+        self.ws.send(json.dumps([self.subscribe_type, message]))
+
+    def subscription(self, event_type: str, pair: str, callback):
+        """Registers the callback and subscribes, or subscribes on open if the socket is not connected yet.
+
+        Args:
+            event_type (str): "orderbook", "ticker" or "trades"
+            pair (str): BtcTurk pair symbol such as "BTCTRY"
+            callback (callable): called with every payload of the pair
+        """
+        with self._callbacks_lock:
+            self.callbacks.setdefault(event_type, {})[pair] = callback
+            # checked under the lock, otherwise on_open may miss the pair and this call skip sending it
+            send = self.open
+        if send:
+            self._send_subscription(event_type, pair)
+
+    def resubscribe(self, event_type: str, pair: str):
+        """Leaves and joins the channel of a single pair, the other subscriptions are not touched."""
+        self._send_subscription(event_type, pair, join=False)
+        self._send_subscription(event_type, pair)
+
+    def setErrorCallback(self, callback):
+        self.error_callback = callback
+
+    def closeSocket(self):
+        self.keepAlive = False
+        self.ws.close()
+        self.receiveThread.join(timeout=5)
+
+    def is_socket_closed(self) -> bool:
+        # temporary disconnects are handled by the receive thread
+        return not self.keepAlive or not self.receiveThread.is_alive()
+
+
 class BtcTurk(ExchangeInterface):    
     def __init__(self, authenticate: bool = False):
         super(BtcTurk, self).__init__()
@@ -32,6 +163,9 @@ class BtcTurk(ExchangeInterface):
         self._pairs = None
         self._assets = None
         self._fetch_exchange_info()
+        self.socket = None
+        # websocket handlers will be populated if subscriptions are made
+        self.ws_handlers: Dict[str, BtcTurkWSHandler] = {}
         
     def _authenticate(self)-> Tuple[str,str]:
         public_key = os.getenv(f"{self.name.upper()}_PUBLIC_KEY")
@@ -59,32 +193,43 @@ class BtcTurk(ExchangeInterface):
         self.exchange_fiat =  config["exchange_fiat"]
         self.base_endpoint = config["base_endpoint"]
         self.exchange_info_url = config["exchange_info_url"]
-        self.balance = config["balance_url"]
+        self.balance_url = config["balance_url"]
         self.order_url = config["order_url"]
         self.orderbook_url = config["orderbook_url"]
         self.orderbook_limit = config["orderbook_limit"]
+        self.trades_url = config["trades_url"]
+        self.ws_url = config["ws_url"]
+        self.trades_backfill_limit = config["trades_backfill_limit"]
         
     def _handle_endpoints(self, config):
-        for key in ["balance_url", "order_url", "orderbook_url", "exchange_info_url"]:
+        for key in ["balance_url", "order_url", "orderbook_url", "trades_url", "exchange_info_url"]:
             config[key] = config["base_endpoint"] + config[key]
         return config
 
-    @retry_on_failure()
     def _fetch_exchange_info(self) -> None:
-        """Fetches the exchange info from the exchange and sets the attributes
+        """Sets the pairs and assets, from the metadata cache if configured
         """
+        self._load_exchange_info(self.config)
+    
+    @retry_on_failure()
+    def _request_exchange_info(self) -> dict:
+        return fetch_json(self.exchange_info_url)
+    
+    def _set_exchange_info(self, exchange_info: dict) -> None:
         # set exchange info
-        self._exchange_info = fetch_json(self.exchange_info_url)
+        self._exchange_info = exchange_info
         # set pairs-
         symbols = self._exchange_info["data"]["symbols"]
-        self._pairs = {}
-        self._pairs_normalized = {}
+        pairs = {}
+        pairs_normalized = {}
         for symbol in symbols:
-            self._pairs[symbol["name"]] = symbol
-            self._pairs_normalized[symbol["nameNormalized"]] = symbol
+            pairs[symbol["name"]] = symbol
+            pairs_normalized[symbol["nameNormalized"]] = symbol
+        self._pairs, self._pairs_normalized = pairs, pairs_normalized
         # set assets
         assets = self._exchange_info["data"]["currencies"]
-        self.assets = {asset["name"] for asset in assets}
+        # keyed by symbol such as BTC, the asset names of the balances and markets
+        self.assets = {asset["symbol"].upper(): asset for asset in assets}
         
     def _get_pair(self, pair: str) -> dict:
         pair = pair.replace("-", "_").upper()
@@ -100,13 +245,13 @@ class BtcTurk(ExchangeInterface):
     def _get_asset(self, asset: str) -> dict:
         asset = asset.upper()
         if asset not in self.assets:
-            msg = f"asset: {asset} not in assets: {self.assets}"
+            msg = f"asset: {asset} not in assets: {list(self.assets)}"
             logger.error(msg)
             raise AssetNotFoundError(message=msg)
         return self.assets[asset]
     
     def _get_asset_name(self, asset: str) -> str:
-        return self._get_asset(asset)["name"]
+        return self._get_asset(asset)["symbol"]
     
     def fetch_orderbook(self, pair:str, limit: int = None) -> dict:
         """Interface method to fetch the orderbook for a given pair
@@ -130,11 +275,25 @@ class BtcTurk(ExchangeInterface):
             "exchange": self.name
         }
     
+    def fetch_trades(self, pair: str, since: int = None) -> List[dict]:
+        # the endpoint only returns the last trades, since filters them
+        fetch_time = now_ns()
+        data = fetch_json(f"{self.trades_url}?pairSymbol={self._get_pair_name(pair)}&last={self.trades_backfill_limit}")["data"]
+        return [
+            {"event": "trades", "exchange": self.name, "market": pair, "id": str(trade["tid"]),
+             "timestamp": int(trade["date"]), "price": trade["price"], "amount": trade["amount"],
+             "side": trade["side"], "fetch_time": fetch_time}
+            for trade in sorted(data, key=lambda trade: int(trade["date"]))
+            if since is None or int(trade["date"]) >= since
+        ]
+
     async def async_fetch_orderbook(self, pair:str, limit: int = None) -> dict:
         pair_name = self._get_pair_name(pair)
         limit_param = "" if limit is None else f"&limit={limit}"
         url = f"{self.orderbook_url}?pairSymbol={pair_name}&{limit_param}"
         
+        # only the async collection mode needs httpx
+        import httpx
         async with httpx.AsyncClient() as client:
             response = await client.get(url)
             data = response.json()["data"]
@@ -162,6 +321,82 @@ class BtcTurk(ExchangeInterface):
         }
         return balance
     
+    def subscribe(self, event_types: List[str], pairs: List[str]):
+        """Subscribe to events for pairs
+
+        Args:
+            event_types (List[str]): such as ["orderbook", "ticker", "trades"]
+            pairs (List[str]): such as ["BTC-TRY", "ETH-TRY"]
+
+        Raises:
+            ValueError: if event type is not supported
+        """
+        if isinstance(event_types, str):
+            event_types = [event_types]
+        if not set(event_types).issubset(["orderbook", "ticker", "trades"]):
+            logger.error(f"invalid event type {event_types}")
+            raise ValueError
+        if isinstance(pairs, str):
+            pairs = [pairs]
+
+        if self.socket is None or self.socket.is_socket_closed():
+            self.socket = BtcTurkWebSocket(self.ws_url)
+            self.socket.disconnect_callback = self.on_socket_disconnect
+            self.socket.reconnect_callback = self.on_socket_reconnect
+        market_names = {self._get_pair_name(pair): self._get_market_name(pair) for pair in pairs}
+        for event in event_types:
+            logger.info(f"subscribing to {event} for pairs:{pairs} in exchange {self.name}")
+            # keep the existing handler on resubscription so that its buffered data is not orphaned
+            ws_handler = self.ws_handlers.get(event)
+            if ws_handler is None:
+                ws_handler = BtcTurkWSHandler(event, self.socket, limit=self.orderbook_limit, pairs=[])
+                self._configure_handler(ws_handler)
+                self.ws_handlers[event] = ws_handler
+            ws_handler.socket = self.socket
+            ws_handler.pairs = list(dict.fromkeys(ws_handler.pairs + list(market_names)))
+            ws_handler.market_names.update(market_names)
+            for pair_name in market_names:
+                self.socket.subscription(event, pair_name, ws_handler.callback)
+
+        self.socket.setErrorCallback(self.ws_handlers[event_types[0]].error_callback)
+
+    def resubscribe(self, event_type: str, pair: str):
+        self.socket.resubscribe(event_type, pair)
+
+    def backfill(self, event_type: str, pair: str, start: int, end: int) -> bool:
+        """Pushes REST data covering the interval through the websocket handler of the event type.
+        Orderbooks are filled with a snapshot and trades with the latest public trades, which only
+        cover the interval if it is shorter than the last trades_backfill_limit trades.
+        """
+        handler = self.ws_handlers[event_type]
+        if event_type == "orderbook":
+            data = fetch_json(f"{self.orderbook_url}?pairSymbol={pair}&limit={handler.limit}")["data"]
+            handler.callback({"PS": pair,
+                              "BO": [{"P": p, "A": a} for p, a in data["bids"]],
+                              "AO": [{"P": p, "A": a} for p, a in data["asks"]]})
+        elif event_type == "trades":
+            data = fetch_json(f"{self.trades_url}?pairSymbol={pair}&last={self.trades_backfill_limit}")["data"]
+            start_ms = start // NS_PER_MS
+            for trade in reversed(data):
+                if int(trade["date"]) >= start_ms:
+                    handler.callback({"I": trade["tid"], "A": trade["amount"], "P": trade["price"],
+                                      "D": trade["date"], "PS": pair, "S": 0 if trade["side"] == "buy" else 1})
+            # the endpoint has no paging, a full page that does not reach the start leaves a hole
+            if len(data) >= self.trades_backfill_limit and min(int(t["date"]) for t in data) > start_ms:
+                logger.warning(f"Trades of {pair} could only be backfilled partially.")
+                return False
+        else:
+            return False
+        return True
+
+    def market_name(self, pair: str) -> str:
+        return self._get_market_name(pair)
+
+    def _get_market_name(self, pair: str) -> str:
+        """Market name in the BASE-QUOTE format used across exchanges, e.g. BTC-TRY"""
+        pair_info = self._get_pair(pair)
+        return f"{pair_info['numerator']}-{pair_info['denominator']}"
+
     def _get_private_headers(self)-> dict:
         """Private headers required for private endpoints
         """
@@ -1,16 +1,19 @@
-from src.exchanges.bitvavo import Bitvavo
-from src.exchanges.btcturk import BtcTurk
+import importlib
+
 from src.exchanges.exchange_interface import ExchangeInterface
 
+# exchange name -> (module, class), imported on first use so that only the configured exchanges' sdks are loaded
 EXCHANGE_MAPPING = {
-    "bitvavo": Bitvavo,
-    "btcturk": BtcTurk
+    "bitvavo": ("src.exchanges.bitvavo", "Bitvavo"),
+    "btcturk": ("src.exchanges.btcturk", "BtcTurk")
 }
 
 def create_exchange(exchange_name: str, authenticate: bool = False) -> ExchangeInterface:
-    exchange_class = EXCHANGE_MAPPING.get(exchange_name.lower())
+    exchange_path = EXCHANGE_MAPPING.get(exchange_name.lower())
     
-    if not exchange_class:
+    if not exchange_path:
         raise NotImplementedError(f"Exchange {exchange_name} is not implemented.")
     
+    module_name, class_name = exchange_path
+    exchange_class = getattr(importlib.import_module(module_name), class_name)
     return exchange_class(authenticate)
\ No newline at end of file
@@ -1,8 +1,17 @@
 from abc import ABC, abstractmethod
 import os
+import logging
+import threading
+from collections import Counter
 from math import isclose, inf
-from typing import List
+from typing import List, Dict
 
+from src.utils.clock import now_ns
+from src.utils.event_bus import EventBus
+from src.utils.metadata_cache import MetadataCache
+from src.ws_handlers.conflation import OrderbookConflator
+
+logger = logging.getLogger(__name__)
 
 
 class ExchangeInterface(ABC):
@@ -10,7 +19,13 @@ class ExchangeInterface(ABC):
     ws_handlers: None
     
     def __init__(self):
-        pass
+        # intervals in which websocket data is missing, written as the "gaps" event type
+        self.gaps = []
+        self._gaps_lock = threading.Lock()
+        # consumers of the buffered websocket events, also used by handlers created later
+        self.bus = EventBus()
+        # OrderbookConflator arguments of the orderbook handlers, None writes every update
+        self.conflation = None
         # self.set_api_keys(public_key, private_key)
         
     @abstractmethod
@@ -21,13 +36,199 @@ class ExchangeInterface(ABC):
     async def async_fetch_orderbook(self, pair:str, limit: int = None) -> dict:
         pass
     
+    def fetch_trades(self, pair: str, since: int = None) -> List[dict]:
+        """Public trades of a pair from the REST API, normalized like the websocket trades events.
+
+        Args:
+            pair (str): market name, such as BTC-EUR
+            since (int, optional): only trades at or after this exchange timestamp in epoch milliseconds,
+                where the exchange supports it. Defaults to the latest trades.
+
+        Returns:
+            List[dict]: trades oldest first
+        """
+        raise NotImplementedError(f"{self.name} can't fetch trades over REST.")
+
     @abstractmethod
     def subscribe(self, event_types: List[str], pairs: List[str]):
         pass
     
+    def _load_exchange_info(self, config: dict) -> None:
+        """Sets the pairs and assets from the on-disk metadata cache if metadata_cache_dir is configured,
+        otherwise from the exchange. A stale cache is used as is and refreshed in the background."""
+        if config.get("metadata_cache_dir") is None:
+            self._set_exchange_info(self._request_exchange_info())
+            return
+        self._metadata_cache = MetadataCache(self.name, self._request_exchange_info, config["metadata_cache_dir"],
+                                             config.get("metadata_cache_ttl", 86400),
+                                             on_refresh=self._set_exchange_info)
+        self._set_exchange_info(self._metadata_cache.get())
+    
+    def _request_exchange_info(self) -> dict:
+        """Requests the markets and assets from the exchange, the result must be JSON serializable."""
+        raise NotImplementedError
+    
+    def _set_exchange_info(self, exchange_info: dict) -> None:
+        """Sets the pair and asset lookups from the result of _request_exchange_info."""
+        raise NotImplementedError
+    
+    def market_name(self, pair: str) -> str:
+        """Name of the pair in the market column of the collected data, such as "BTC-EUR" for "btc_eur"."""
+        return self._get_pair_name(pair)
+    
+    def subscribe_markets(self, subscriptions: Dict[str, List[str]]):
+        """Subscribe to several event types, each with its own pairs.
+
+        Args:
+            subscriptions (Dict[str, List[str]]): event type -> pairs
+        """
+        for event_type, pairs in subscriptions.items():
+            self.subscribe([event_type], pairs)
+    
     def extract_data(self) -> List[dict]:
-        return {k:v.extract_data() for k, v in self.ws_handlers.items()}
+        data = {k:v.extract_data() for k, v in self.ws_handlers.items()}
+        gaps = self.extract_gaps()
+        if gaps:
+            data["gaps"] = gaps
+        return data
+    
+    def record_gap(self, market: str, event_type: str, gap_start: int, gap_end: int, reason: str, backfilled: bool = False):
+        """Records an interval in which the data of a market is missing or was filled from REST snapshots.
+
+        Args:
+            market (str): such as "BTC-EUR"
+            event_type (str): such as "orderbook"
+            gap_start (int): start of the gap in UTC epoch nanoseconds
+            gap_end (int): end of the gap in UTC epoch nanoseconds
+            reason (str): such as "reconnect" or "stall"
+            backfilled (bool, optional): whether REST data covering the gap was added. Defaults to False.
+        """
+        gap = {
+            "event": "gap", "exchange": self.name, "market": market, "event_type": event_type,
+            "gap_start": gap_start, "gap_end": gap_end, "reason": reason, "backfilled": backfilled,
+            "fetch_time": now_ns(),
+        }
+        with self._gaps_lock:
+            self.gaps.append(gap)
+    
+    def extract_gaps(self) -> List[dict]:
+        with self._gaps_lock:
+            gaps, self.gaps = self.gaps, []
+        return gaps
+    
+    def on_socket_disconnect(self, disconnected_at: int):
+        logger.warning(f"{self.name} websocket disconnected, reconnecting...")
+    
+    def on_socket_reconnect(self, disconnected_at: int, reconnected_at: int):
+        """Called by the socket once it reconnected and resubscribed. Closes the gap in the background
+        so that the receive thread is not blocked by REST requests."""
+        logger.info(f"{self.name} websocket reconnected after {(reconnected_at - disconnected_at) / 1e9:.3f} seconds")
+        threading.Thread(target=self.resync, args=(disconnected_at, reconnected_at), daemon=True).start()
+    
+    def resync(self, gap_start: int, gap_end: int):
+        """Backfills every subscribed market from REST and records the gap.
+
+        Args:
+            gap_start (int): disconnect time in UTC epoch nanoseconds
+            gap_end (int): reconnect time in UTC epoch nanoseconds
+        """
+        for event_type, handler in self.ws_handlers.items():
+            for pair in handler.pairs or []:
+                self.fill_gap(event_type, pair, gap_start, gap_end, "reconnect")
     
+    def fill_gap(self, event_type: str, pair: str, gap_start: int, gap_end: int, reason: str):
+        """Backfills a single stream and records the gap, whether or not the backfill succeeded."""
+        try:
+            backfilled = self.backfill(event_type, pair, gap_start, gap_end)
+        except Exception as e:
+            logger.warning(f"Could not backfill {event_type} of {pair} in {self.name}: {e}")
+            backfilled = False
+        self.record_gap(self.ws_handlers[event_type].market_name(pair), event_type, gap_start, gap_end, reason, backfilled)
+    
+    def on_stream_stall(self, event_type: str, pair: str, last_received: int, detected_at: int):
+        """Called by the stall watchdog when a single stream went quiet while the socket is up.
+        The stream is resubscribed and the gap filled in the background."""
+        logger.warning(f"{event_type} of {pair} in {self.name} stalled for "
+                       f"{(detected_at - last_received) / 1e9:.1f} seconds, resubscribing.")
+        threading.Thread(target=self._recover_stream, args=(event_type, pair, last_received, detected_at),
+                         daemon=True).start()
+    
+    def _recover_stream(self, event_type: str, pair: str, last_received: int, detected_at: int):
+        try:
+            self.resubscribe(event_type, pair)
+        except Exception as e:
+            logger.error(f"Could not resubscribe {event_type} of {pair} in {self.name}: {e}")
+        self.fill_gap(event_type, pair, last_received, detected_at, "stall")
+    
+    def resubscribe(self, event_type: str, pair: str):
+        """Renews the subscription of a single stream without closing the socket.
+
+        Args:
+            event_type (str): such as "orderbook"
+            pair (str): exchange's pair name as subscribed
+        """
+        self.subscribe([event_type], [pair])
+    
+    def backfill(self, event_type: str, pair: str, start: int, end: int) -> bool:
+        """Pushes REST data covering the interval through the websocket handler of the event type.
+
+        Args:
+            event_type (str): such as "orderbook"
+            pair (str): exchange's pair name as subscribed
+            start (int): start of the interval in UTC epoch nanoseconds
+            end (int): end of the interval in UTC epoch nanoseconds
+
+        Returns:
+            bool: whether the interval could be filled
+        """
+        return False
+    
+    def set_bus(self, bus: EventBus):
+        """Publishes the websocket events on a bus shared with other exchanges."""
+        self.bus = bus
+        for handler in self.ws_handlers.values():
+            handler.bus = bus
+
+    def set_conflation(self, conflation: dict):
+        """Conflates the orderbook updates written by the websocket handlers, see OrderbookConflator.
+
+        Args:
+            conflation (dict): OrderbookConflator arguments, None to write every update
+        """
+        self.conflation = conflation
+        for handler in self.ws_handlers.values():
+            self._configure_handler(handler)
+
+    def _configure_handler(self, handler):
+        """Shares the bus and the conflation settings with a websocket handler."""
+        handler.bus = self.bus
+        if handler.event_type == "orderbook" and self.conflation is not None and handler.conflator is None:
+            handler.conflator = OrderbookConflator(**self.conflation)
+
+    def add_listener(self, listener):
+        """Registers a callable with the websocket handlers of every event type, see EventBus.subscribe."""
+        self.bus.subscribe(listener, exchanges=[self.name])
+
+    def latency_stats(self) -> dict:
+        """Latency histograms of the websocket handlers keyed by event type."""
+        return {k: v.latency for k, v in self.ws_handlers.items()}
+    
+    def duplicate_stats(self) -> dict:
+        """Dropped duplicate messages per market keyed by event type."""
+        return {k: dict(v.duplicates) for k, v in self.ws_handlers.items() if v.duplicates}
+    
+    def conflation_stats(self) -> dict:
+        """Received, persisted and conflated orderbook updates keyed by event type."""
+        stats = {k: v.conflation_stats() for k, v in self.ws_handlers.items()}
+        return {k: v for k, v in stats.items() if v is not None}
+
+    def pop_conflated_counts(self) -> Counter:
+        """Conflated updates per market of all handlers since the last call."""
+        counts = Counter()
+        for handler in self.ws_handlers.values():
+            counts.update(handler.pop_conflated_counts())
+        return counts
+
     def clear_ws_data(self) -> None:
         for v in self.ws_handlers.values():
             v.clear_data()
@@ -37,4 +238,4 @@ class ExchangeInterface(ABC):
             self.socket.closeSocket()
         
     def is_socket_closed(self) -> bool:
-        pass
\ No newline at end of file
+        return self.socket is None or self.socket.is_socket_closed()
\ No newline at end of file
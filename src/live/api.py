@@ -0,0 +1,102 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.live.rolling_store import RollingStore
+
+logger = logging.getLogger(__name__)
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+class LiveApi:
+    """
+    Local HTTP API of a RollingStore, served from a daemon thread.
+
+    GET /series
+        the (exchange, market, event type) of every series as JSON
+    GET /query?exchange=bitvavo&market=BTC-EUR&event_type=trades[&start=ns][&end=ns][&format=json]
+        the events of a series as an Arrow IPC stream, or as JSON columns with format=json
+    """
+
+    def __init__(self, store: RollingStore, host: str = "127.0.0.1", port: int = 8765):
+        """
+        Args:
+            store (RollingStore): the store to serve
+            host (str, optional): address to listen on, only local processes by default. Defaults to "127.0.0.1".
+            port (int, optional): port to listen on, 0 picks a free one. Defaults to 8765.
+        """
+        self.store = store
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        """Starts serving. A port in use is logged, the collection continues without the API."""
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                api._handle(self)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.error(f"Live API could not listen on {self.host}:{self.port}: {e}")
+            return
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Live API listening on http://{self.host}:{self.port}")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def _handle(self, request: BaseHTTPRequestHandler):
+        url = urlparse(request.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/series":
+                keys = [{"exchange": e, "market": m, "event_type": t} for e, m, t in self.store.keys()]
+                self._send(request, 200, "application/json", json.dumps(keys).encode())
+            elif url.path == "/query":
+                self._query(request, params)
+            else:
+                self._send(request, 404, "application/json", b'{"error": "not found"}')
+        except (KeyError, ValueError) as e:
+            self._send(request, 400, "application/json", json.dumps({"error": f"invalid query: {e}"}).encode())
+
+    def _query(self, request: BaseHTTPRequestHandler, params: dict):
+        event_type = params["event_type"]
+        if event_type not in self.store.columns:
+            raise ValueError(f"unknown event type {event_type}")
+        start = int(params["start"]) if "start" in params else None
+        end = int(params["end"]) if "end" in params else None
+        if params.get("format") == "json":
+            columns = self.store.query(params["exchange"], params["market"], event_type, start, end)
+            # NaN is not JSON, missing values are null
+            body = json.dumps({name: values.tolist() for name, values in columns.items()}).replace("NaN", "null")
+            self._send(request, 200, "application/json", body.encode())
+            return
+        import pyarrow as pa
+        table = self.store.query_arrow(params["exchange"], params["market"], event_type, start, end)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as stream:
+            stream.write_table(table)
+        self._send(request, 200, ARROW_STREAM, sink.getvalue().to_pybytes())
+
+    @staticmethod
+    def _send(request: BaseHTTPRequestHandler, status: int, content_type: str, body: bytes):
+        request.send_response(status)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
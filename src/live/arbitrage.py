@@ -0,0 +1,236 @@
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from src.utils.utils import parse_levels
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10 ** 9
+
+
+class Curves:
+    """
+    Depth curves of the latest book of a market in its exchange's fiat, net of its commission: the
+    base received for the quote spent on the asks and the quote received for the base sold into the
+    bids, both piecewise linear in the amount given.
+    """
+
+    __slots__ = ("ask_quote", "ask_base", "bid_base", "bid_quote", "fetch_time")
+
+    def __init__(self, event: dict, commission: float = 0):
+        self.bid_quote, self.bid_base = self._cumulative(parse_levels(event.get("bids")))
+        self.ask_quote, self.ask_base = self._cumulative(parse_levels(event.get("asks")))
+        if commission:
+            self.bid_quote *= 1 - commission
+            self.ask_base *= 1 - commission
+        self.fetch_time = event.get("fetch_time")
+
+    @staticmethod
+    def _cumulative(levels: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Quote and base amounts of the levels of a side cumulated from 0."""
+        cumulative = np.zeros((2, len(levels) + 1))
+        np.cumsum(levels[:, 0] * levels[:, 1], out=cumulative[0, 1:])
+        np.cumsum(levels[:, 1], out=cumulative[1, 1:])
+        return cumulative[0], cumulative[1]
+
+
+class ArbitrageScanner:
+    """
+    Scans the books of the base assets listed on several exchanges for buying on one exchange and
+    selling on another, and emits the profitable sizes as the "arbitrage" event type.
+
+    For every size of the ladder, a notional in the common currency, the scanner buys the base with
+    the size on one exchange by walking its asks and sells what it got, after the commission, into
+    the bids of the other exchange after its commission. The spread is the proceeds over the size.
+    Books quoted in another fiat are converted at the mids of the fiat's conversion path. A size the
+    collected depth cannot fill is not executable.
+
+    Each book is kept as cumulative base and quote depth curves, the whole ladder is costed at once
+    by interpolating them. A book update re-evaluates the exchange pairs of its asset only, a
+    conversion market update the assets quoted in the fiats it converts.
+    """
+
+    event_type = "arbitrage"
+
+    def __init__(self, currency: str = "EUR", fiats: Dict[str, str] = None, commissions: Dict[str, float] = None,
+                 conversions: Dict[str, Sequence[Sequence[str]]] = None, sizes: Sequence[float] = (100, 1000, 10000),
+                 min_spread_bps: float = 0, emit_interval: float = 1, max_book_age: float = 5,
+                 publish: Optional[Callable[[dict], None]] = None):
+        """
+        Args:
+            currency (str, optional): currency of the sizes and spreads. Defaults to "EUR".
+            fiats (Dict[str, str], optional): quote asset of the scanned markets by exchange, its
+                exchange_fiat. Defaults to the currency for every exchange.
+            commissions (Dict[str, float], optional): taker commission by exchange. Defaults to 0.
+            conversions (Dict[str, Sequence[Sequence[str]]], optional): path of [exchange, market] legs
+                converting a fiat to the currency by fiat, such as {"TRY": [["btcturk", "USDT-TRY"],
+                ["bitvavo", "USDT-EUR"]]}. Defaults to None.
+            sizes (Sequence[float], optional): ladder of notionals in the currency. Defaults to (100, 1000, 10000).
+            min_spread_bps (float, optional): spread after commissions from which a size is an
+                opportunity. Defaults to 0.
+            emit_interval (float, optional): seconds between two emits of a lasting opportunity, a new
+                one is emitted right away. Defaults to 1.
+            max_book_age (float, optional): seconds a book may be older than the updated one to be
+                compared with it. Defaults to 5.
+            publish (Callable[[dict], None], optional): called with every emitted row, outside the
+                scanner's lock, such as EventBus.publish. Defaults to None.
+        """
+        self.currency = currency
+        self.fiats = dict(fiats or {})
+        self.commissions = dict(commissions or {})
+        self.conversions = {fiat: [tuple(leg) for leg in path] for fiat, path in (conversions or {}).items()}
+        self.sizes = np.asarray(sizes, dtype=float)
+        # proceeds from which a size is an opportunity
+        self.thresholds = self.sizes * (1 + min_spread_bps / 10000)
+        self.emit_interval_ns = int(emit_interval * NS_PER_SECOND)
+        self.max_book_age_ns = int(max_book_age * NS_PER_SECOND)
+        self.publish = publish
+        # fiats converted with a market by (exchange, market) and the mids of the conversion markets
+        self.converts: Dict[Tuple[str, str], List[str]] = {}
+        for fiat, path in self.conversions.items():
+            for leg in path:
+                self.converts.setdefault(leg, []).append(fiat)
+        self.mids: Dict[Tuple[str, str], float] = {}
+        # mid rates of the fiats, refreshed when a mid of their conversion path changes, with the
+        # sizes and the proceeds that are opportunities in every fiat whose rate is known
+        self.rates: Dict[str, float] = {}
+        self.spends: Dict[str, np.ndarray] = {}
+        self.targets: Dict[str, np.ndarray] = {}
+        self._set_rate(currency)
+        # depth curves by base asset and exchange
+        self.curves: Dict[str, Dict[str, Curves]] = {}
+        # profitable rows and last emit time by (asset, buy exchange, sell exchange)
+        self.opportunities: Dict[Tuple[str, str, str], List[dict]] = {}
+        self.last_emit: Dict[Tuple[str, str, str], int] = {}
+        self.buffer: List[dict] = []
+        self.lock = threading.Lock()
+
+    def _fiat(self, exchange: str) -> str:
+        return self.fiats.get(exchange, self.currency)
+
+    def rate(self, fiat: str) -> float:
+        """Mid rate of a fiat in the currency, NaN if a book of its conversion path is missing."""
+        if fiat == self.currency:
+            return 1.0
+        path = self.conversions.get(fiat)
+        if path is None:
+            return math.nan
+        held, rate = fiat, 1.0
+        for leg in path:
+            mid = self.mids.get(leg, math.nan)
+            base, quote = leg[1].split("-")
+            if held == quote:
+                rate, held = rate / mid, base
+            elif held == base:
+                rate, held = rate * mid, quote
+            else:
+                return math.nan
+        return rate if held == self.currency else math.nan
+
+    def _set_rate(self, fiat: str):
+        rate = self.rates[fiat] = self.rate(fiat)
+        if math.isfinite(rate) and rate > 0:
+            self.spends[fiat], self.targets[fiat] = self.sizes / rate, self.thresholds / rate
+        else:
+            self.spends.pop(fiat, None)
+            self.targets.pop(fiat, None)
+
+    def update(self, event: dict):
+        """
+        Consumer of the event bus, re-evaluates the assets whose books or conversions an orderbook
+        event changes. Other events are ignored.
+
+        Args:
+            event (dict): normalized orderbook with exchange, market, fetch_time, bids and asks
+        """
+        if event.get("event") != "orderbook":
+            return
+        exchange, market = event.get("exchange"), event.get("market") or ""
+        base, _, quote = market.partition("-")
+        key = (exchange, market)
+        time_ns = event.get("fetch_time")
+        rows = []
+        with self.lock:
+            affected = []
+            if key in self.converts:
+                bids, asks = event.get("bids"), event.get("asks")
+                self.mids[key] = (float(bids[0][0]) + float(asks[0][0])) / 2 if bids and asks else math.nan
+                fiats = set(self.converts[key])
+                for fiat in fiats:
+                    self._set_rate(fiat)
+                affected = [asset for asset, books in self.curves.items()
+                            if any(self._fiat(name) in fiats for name in books)]
+            if quote and quote == self._fiat(exchange):
+                self.curves.setdefault(base, {})[exchange] = Curves(event, self.commissions.get(exchange, 0))
+                if base not in affected:
+                    affected.append(base)
+            # a book without a receive time can't be compared by age
+            for asset in affected if time_ns is not None else ():
+                rows.extend(self._evaluate(asset, time_ns))
+            self.buffer.extend(rows)
+        if self.publish is not None:
+            for row in rows:
+                self.publish(row)
+
+    def _evaluate(self, asset: str, time_ns: int) -> List[dict]:
+        """Re-evaluates buying the asset on one exchange and selling it on another, returns the rows to emit."""
+        books = [(name, curves, self._fiat(name)) for name, curves in self.curves[asset].items()
+                 if curves.fetch_time is not None and time_ns - curves.fetch_time <= self.max_book_age_ns
+                 and self._fiat(name) in self.spends]
+        rows = []
+        for buy, buy_book, buy_fiat in books:
+            for sell, sell_book, sell_fiat in books:
+                if buy == sell:
+                    continue
+                key = (asset, buy, sell)
+                # base bought with the sizes and the proceeds of selling it, NaN beyond the depth
+                amount = np.interp(self.spends[buy_fiat], buy_book.ask_quote, buy_book.ask_base, right=math.nan)
+                proceeds = np.interp(amount, sell_book.bid_base, sell_book.bid_quote, right=math.nan)
+                profitable = proceeds >= self.targets[sell_fiat]
+                if not profitable.any():
+                    self.opportunities.pop(key, None)
+                    self.last_emit.pop(key, None)
+                    continue
+                rate = self.rates[sell_fiat]
+                opportunity = [self._row(key, time_ns, float(self.sizes[i]), float(amount[i]), float(proceeds[i] * rate))
+                               for i in np.flatnonzero(profitable)]
+                self.opportunities[key] = opportunity
+                last = self.last_emit.get(key)
+                if last is None or time_ns - last >= self.emit_interval_ns:
+                    self.last_emit[key] = time_ns
+                    rows.extend(opportunity)
+        return rows
+
+    def _row(self, key: Tuple[str, str, str], time_ns: int, size: float, amount: float, proceeds: float) -> dict:
+        asset, buy, sell = key
+        return {"event": self.event_type, "exchange": buy, "market": asset, "fetch_time": time_ns,
+                "sell_exchange": sell, "currency": self.currency, "size": size,
+                "spread_bps": (proceeds / size - 1) * 10000, "profit": proceeds - size, "amount": amount,
+                "buy_price": size / amount, "sell_price": proceeds / amount}
+
+    def current(self) -> List[dict]:
+        """Rows of the opportunities found by the latest evaluation of every asset."""
+        with self.lock:
+            return [row for rows in self.opportunities.values() for row in rows]
+
+    def extract_data(self) -> List[dict]:
+        """Removes and returns the rows emitted since the last call."""
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        return rows
+
+    @staticmethod
+    def schema() -> "pa.Schema":
+        """Arrow schema of the arbitrage event type, exchange buys and sell_exchange sells market's base asset."""
+        import pyarrow as pa
+        from src.writer.schemas import COMMON_FIELDS
+        return pa.schema(COMMON_FIELDS + [pa.field("sell_exchange", pa.string()), pa.field("currency", pa.string())]
+                         + [pa.field(name, pa.float64()) for name in
+                            ("size", "spread_bps", "profit", "amount", "buy_price", "sell_price")])
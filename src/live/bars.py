@@ -0,0 +1,211 @@
+import logging
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from src.utils.clock import NS_PER_MS, now_ns
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+UNITS_NS = {"s": 10 ** 9, "m": 60 * 10 ** 9, "h": 3600 * 10 ** 9, "d": 86400 * 10 ** 9}
+
+
+def parse_interval(interval: str) -> int:
+    """Length of an interval such as "1s", "5m", "1h" or "1d" in nanoseconds."""
+    try:
+        length = int(interval[:-1]) * UNITS_NS[interval[-1]]
+    except (KeyError, ValueError):
+        raise ValueError(f"Invalid bar interval {interval}, expected a number followed by s, m, h or d")
+    if length <= 0:
+        raise ValueError(f"Invalid bar interval {interval}, the length must be positive")
+    return length
+
+
+class Bar:
+    """OHLCV state of an open bar, first and last are the times of its open and close trades."""
+
+    __slots__ = ("first", "last", "open", "high", "low", "close", "volume", "notional", "buy_volume", "trades")
+
+    def __init__(self, time_ns: int, price: float):
+        self.first = self.last = time_ns
+        self.open = self.high = self.low = self.close = price
+        self.volume = self.notional = self.buy_volume = 0.0
+        self.trades = 0
+
+    def add(self, time_ns: int, price: float, amount: float, buy: bool):
+        if price > self.high:
+            self.high = price
+        if price < self.low:
+            self.low = price
+        # a late trade changes the open or close only if it is older or newer than theirs
+        if time_ns < self.first:
+            self.open, self.first = price, time_ns
+        if time_ns >= self.last:
+            self.close, self.last = price, time_ns
+        self.volume += amount
+        self.notional += price * amount
+        if buy:
+            self.buy_volume += amount
+        self.trades += 1
+
+
+class BarAggregator:
+    """
+    Builds OHLCV bars per market from the trades events and emits every completed bar as the "bars"
+    event type.
+
+    Time bars cover [start, start + interval) of the exchange's trade time. A time bar is completed
+    once the watermark of its market, the newest trade time seen minus allowed_lateness, passed its
+    end. The watermark of a market that went quiet advances with the wall clock behind its receive
+    lag, how far the exchange time of its latest trade was behind its receive time, so that the bars
+    of a market whose trades arrive late, backfilled or skewed, are not completed early. Trades up to
+    allowed_lateness late still go into their bar, later ones are counted in late_trades and
+    dropped. Volume and notional bars close in arrival order once their base or quote amount
+    reaches the market's threshold.
+
+    Each trade updates one open bar per configured bar, O(1).
+    """
+
+    event_type = "bars"
+
+    def __init__(self, intervals: Sequence[str] = ("1s", "1m"), volume: Dict[str, float] = None,
+                 notional: Dict[str, float] = None, allowed_lateness: float = 5):
+        """
+        Args:
+            intervals (Sequence[str], optional): time bar intervals, such as "1s", "1m" or "1h". Defaults to ("1s", "1m").
+            volume (Dict[str, float], optional): base amount per volume bar by market, "default" for
+                all other markets. Defaults to no volume bars.
+            notional (Dict[str, float], optional): quote amount per notional bar by market, "default"
+                for all other markets. Defaults to no notional bars.
+            allowed_lateness (float, optional): seconds a trade may arrive after newer trades and
+                still be added to its time bar. Defaults to 5.
+        """
+        self.intervals = {interval: parse_interval(interval) for interval in intervals}
+        self.thresholds = {"volume": dict(volume or {}), "notional": dict(notional or {})}
+        self.allowed_lateness_ns = int(allowed_lateness * 10 ** 9)
+        # (exchange, market, "time", interval) -> open time bars by start
+        self.open_bars: Dict[Tuple[str, str, str, str], Dict[int, Bar]] = {}
+        # (exchange, market, "volume" or "notional", threshold) -> open bar
+        self.threshold_bars: Dict[Tuple[str, str, str, str], Bar] = {}
+        self.watermarks: Dict[Tuple[str, str], int] = {}
+        # receive time minus exchange time of the latest trade by market
+        self.lags: Dict[Tuple[str, str], int] = {}
+        self.late_trades = Counter()
+        self.buffer: List[dict] = []
+        self.lock = threading.Lock()
+
+    def _threshold(self, bar_type: str, market: str) -> Optional[float]:
+        thresholds = self.thresholds[bar_type]
+        return thresholds.get(market, thresholds.get("default"))
+
+    def update(self, event: dict):
+        """
+        Consumer of the event bus, adds a trades event. Other events are ignored.
+
+        Args:
+            event (dict): normalized trade with exchange, market, timestamp (ms), price, amount and side
+        """
+        if event.get("event") != "trades":
+            return
+        try:
+            price, amount = float(event["price"]), float(event["amount"])
+            timestamp = event.get("timestamp")
+            receive_ns = event.get("fetch_time")
+            time_ns = int(float(timestamp)) * NS_PER_MS if timestamp not in (None, "") else int(receive_ns)
+        except (KeyError, TypeError, ValueError):
+            return
+        exchange, market = event.get("exchange"), event.get("market")
+        buy = event.get("side") == "buy"
+        with self.lock:
+            if receive_ns is not None:
+                self.lags[(exchange, market)] = max(int(receive_ns) - time_ns, 0)
+            watermark = self.watermarks.get((exchange, market))
+            if watermark is not None and time_ns < watermark:
+                # its bars may have been emitted already
+                self.late_trades[(exchange, market)] += 1
+                return
+            for interval, length in self.intervals.items():
+                bars = self.open_bars.setdefault((exchange, market, "time", interval), {})
+                start = time_ns - time_ns % length
+                bar = bars.get(start)
+                if bar is None:
+                    bar = bars[start] = Bar(time_ns, price)
+                bar.add(time_ns, price, amount, buy)
+            for bar_type in ("volume", "notional"):
+                threshold = self._threshold(bar_type, market)
+                if threshold:
+                    self._add_to_threshold_bar(exchange, market, bar_type, threshold, time_ns, price, amount, buy)
+            new_watermark = time_ns - self.allowed_lateness_ns
+            if watermark is None or new_watermark > watermark:
+                self.watermarks[(exchange, market)] = new_watermark
+                self._close_time_bars(exchange, market, new_watermark)
+
+    def _add_to_threshold_bar(self, exchange: str, market: str, bar_type: str, threshold: float, time_ns: int,
+                              price: float, amount: float, buy: bool):
+        key = (exchange, market, bar_type, f"{threshold:g}")
+        bar = self.threshold_bars.get(key)
+        if bar is None:
+            bar = self.threshold_bars[key] = Bar(time_ns, price)
+        bar.add(time_ns, price, amount, buy)
+        if (bar.volume if bar_type == "volume" else bar.notional) >= threshold:
+            del self.threshold_bars[key]
+            self.buffer.append(self._row(key, bar, bar.first, bar.last))
+
+    def _close_time_bars(self, exchange: str, market: str, watermark: int):
+        for interval, length in self.intervals.items():
+            key = (exchange, market, "time", interval)
+            bars = self.open_bars.get(key)
+            if not bars:
+                continue
+            for start in sorted(start for start in bars if start + length <= watermark):
+                self.buffer.append(self._row(key, bars.pop(start), start, start + length))
+
+    @staticmethod
+    def _row(key: Tuple[str, str, str, str], bar: Bar, start: int, end: int) -> dict:
+        exchange, market, bar_type, bar_size = key
+        return {
+            "event": "bars", "exchange": exchange, "market": market, "fetch_time": now_ns(),
+            "timestamp": start // NS_PER_MS, "bar_type": bar_type, "bar_size": bar_size,
+            "start_time": start, "end_time": end, "open": bar.open, "high": bar.high, "low": bar.low,
+            "close": bar.close, "volume": bar.volume, "notional": bar.notional,
+            "vwap": bar.notional / bar.volume if bar.volume else math.nan,
+            "buy_volume": bar.buy_volume, "trades": bar.trades,
+        }
+
+    def extract_data(self, time_ns: int = None) -> List[dict]:
+        """
+        Removes and returns the completed bars, first completing the time bars of quiet markets.
+
+        Args:
+            time_ns (int, optional): current time in UTC epoch nanoseconds. Defaults to now.
+        """
+        time_ns = (now_ns() if time_ns is None else time_ns) - self.allowed_lateness_ns
+        with self.lock:
+            for exchange, market in list(self.watermarks):
+                watermark = time_ns - self.lags.get((exchange, market), 0)
+                if watermark > self.watermarks[(exchange, market)]:
+                    self.watermarks[(exchange, market)] = watermark
+                    self._close_time_bars(exchange, market, watermark)
+            rows, self.buffer = self.buffer, []
+        if self.late_trades:
+            logger.debug(f"Trades later than the allowed lateness: {dict(self.late_trades)}")
+        return rows
+
+    @staticmethod
+    def schema() -> "pa.Schema":
+        """Arrow schema of the bars event type, timestamp is the bar's start in epoch milliseconds."""
+        import pyarrow as pa
+        from src.writer.schemas import COMMON_FIELDS
+        return pa.schema(COMMON_FIELDS + [
+            pa.field("timestamp", pa.int64()),
+            pa.field("bar_type", pa.string()),
+            pa.field("bar_size", pa.string()),
+            pa.field("start_time", pa.int64()),
+            pa.field("end_time", pa.int64()),
+        ] + [pa.field(name, pa.float64()) for name in
+             ("open", "high", "low", "close", "volume", "notional", "vwap", "buy_volume")]
+          + [pa.field("trades", pa.int64())])
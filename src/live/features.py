@@ -0,0 +1,212 @@
+import logging
+import math
+import threading
+from itertools import accumulate
+from typing import Dict, List, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10 ** 9
+# stamp of a bucket that was never written
+EMPTY = np.iinfo(np.int64).min
+BUCKET_STATS = ("notional", "volume", "signed_volume", "trades", "squared_returns")
+
+
+def _to_float(value) -> float:
+    return math.nan if value is None or value == "" else float(value)
+
+
+class FeatureEngine:
+    """
+    Computes microstructure features per market from the orderbook and trades events and emits them
+    as the "features" event type, one row per market every emit_interval seconds.
+
+    Book features are those of the latest book: mid, spread, microprice and the depth imbalance
+    (bid size - ask size) / (bid size + ask size) over the first n levels. Window features are
+    kept in a ring of bucket_seconds buckets per market: the trade VWAP, volume, signed volume
+    (buys positive), number of trades and the realized volatility, the root of the summed squared
+    log returns of the mid. An update touches one bucket, O(1). Emitting sums the buckets of all
+    markets at once with NumPy.
+
+    Times are receive times, fetch_time in UTC epoch nanoseconds, so that windows are comparable
+    across exchanges with different clocks. The books and trades of every collection mode are
+    consumed, the REST ones are published by the data collector as they are polled.
+    """
+
+    event_type = "features"
+
+    def __init__(self, windows: Sequence[float] = (10, 60, 300), depth_levels: Sequence[int] = (1, 5, 10),
+                 emit_interval: float = 1, bucket_seconds: float = 1, initial_markets: int = 64):
+        """
+        Args:
+            windows (Sequence[float], optional): window lengths in seconds. Defaults to (10, 60, 300).
+            depth_levels (Sequence[int], optional): levels the depth imbalance is computed over.
+                Defaults to (1, 5, 10).
+            emit_interval (float, optional): seconds between two rows of a market. Defaults to 1.
+            bucket_seconds (float, optional): resolution of the windows. Defaults to 1.
+            initial_markets (int, optional): markets the arrays are sized for, they grow as needed. Defaults to 64.
+        """
+        self.windows = list(windows)
+        self.depth_levels = list(depth_levels)
+        self.max_depth = max(self.depth_levels)
+        self.emit_interval_ns = int(emit_interval * NS_PER_SECOND)
+        self.bucket_ns = int(bucket_seconds * NS_PER_SECOND)
+        self.window_buckets = [max(1, math.ceil(w / bucket_seconds)) for w in self.windows]
+        self.num_buckets = max(self.window_buckets)
+        self.markets: Dict[Tuple[str, str], int] = {}
+        self.capacity = 0
+        self._allocate(max(initial_markets, 1))
+        self.last_emit = None
+        self.buffer: List[dict] = []
+        self.lock = threading.Lock()
+
+    def _allocate(self, capacity: int):
+        def grow(array, fill):
+            new = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            new[:self.capacity] = array[:self.capacity]
+            return new
+
+        if self.capacity == 0:
+            self.book = {name: np.full(0, math.nan) for name in ("mid", "spread", "microprice", "last_mid")}
+            self.imbalance = np.full((0, len(self.depth_levels)), math.nan)
+            self.stamps = np.full((0, self.num_buckets), EMPTY, dtype=np.int64)
+            self.buckets = {name: np.zeros((0, self.num_buckets)) for name in BUCKET_STATS}
+        self.book = {name: grow(array, math.nan) for name, array in self.book.items()}
+        self.imbalance = grow(self.imbalance, math.nan)
+        self.stamps = grow(self.stamps, EMPTY)
+        self.buckets = {name: grow(array, 0) for name, array in self.buckets.items()}
+        self.capacity = capacity
+
+    def _market_index(self, event: dict) -> int:
+        key = (event.get("exchange"), event.get("market"))
+        index = self.markets.get(key)
+        if index is None:
+            index = self.markets[key] = len(self.markets)
+            if index >= self.capacity:
+                self._allocate(self.capacity * 2)
+        return index
+
+    def _bucket(self, index: int, time_ns: int) -> int:
+        """Slot of the bucket of a time, reset if it still holds an older bucket."""
+        bucket = time_ns // self.bucket_ns
+        slot = bucket % self.num_buckets
+        if self.stamps[index, slot] != bucket:
+            self.stamps[index, slot] = bucket
+            for array in self.buckets.values():
+                array[index, slot] = 0
+        return slot
+
+    def update(self, event: dict):
+        """
+        Consumer of the event bus, adds an orderbook or trades event. Other events are ignored.
+
+        Args:
+            event (dict): normalized event with exchange, market and fetch_time keys
+        """
+        event_type = event.get("event")
+        if event_type not in ("orderbook", "trades"):
+            return
+        time_ns = event.get("fetch_time")
+        with self.lock:
+            index = self._market_index(event)
+            if event_type == "orderbook":
+                self._update_book(index, event, time_ns)
+            else:
+                self._update_trade(index, event, time_ns)
+            if self.last_emit is None:
+                self.last_emit = time_ns
+            elif time_ns - self.last_emit >= self.emit_interval_ns:
+                self.buffer.extend(self._emit(time_ns))
+                self.last_emit = time_ns
+
+    def _update_book(self, index: int, event: dict, time_ns: int):
+        # a few levels, plain floats are cheaper than NumPy arrays here
+        bids = (event.get("bids") or [])[:self.max_depth]
+        asks = (event.get("asks") or [])[:self.max_depth]
+        if not bids or not asks:
+            return
+        bid, bid_size, ask, ask_size = float(bids[0][0]), float(bids[0][1]), float(asks[0][0]), float(asks[0][1])
+        mid = (bid + ask) / 2
+        book = self.book
+        book["mid"][index] = mid
+        book["spread"][index] = ask - bid
+        size = bid_size + ask_size
+        # undefined for levels without size, written as null
+        book["microprice"][index] = (bid * ask_size + ask * bid_size) / size if size else math.nan
+        bid_depth = list(accumulate(float(level[1]) for level in bids))
+        ask_depth = list(accumulate(float(level[1]) for level in asks))
+        for i, levels in enumerate(self.depth_levels):
+            b, a = bid_depth[min(levels, len(bid_depth)) - 1], ask_depth[min(levels, len(ask_depth)) - 1]
+            self.imbalance[index, i] = (b - a) / (b + a) if b + a else math.nan
+        last_mid = book["last_mid"][index]
+        book["last_mid"][index] = mid
+        if last_mid > 0 and mid > 0:
+            slot = self._bucket(index, time_ns)
+            self.buckets["squared_returns"][index, slot] += math.log(mid / last_mid) ** 2
+
+    def _update_trade(self, index: int, event: dict, time_ns: int):
+        price, amount = _to_float(event.get("price")), _to_float(event.get("amount"))
+        if math.isnan(price) or math.isnan(amount):
+            return
+        slot = self._bucket(index, time_ns)
+        buckets = self.buckets
+        buckets["notional"][index, slot] += price * amount
+        buckets["volume"][index, slot] += amount
+        buckets["signed_volume"][index, slot] += amount if event.get("side") == "buy" else -amount
+        buckets["trades"][index, slot] += 1
+
+    def window_features(self, time_ns: int) -> Dict[str, np.ndarray]:
+        """Window features of every market at a time, arrays indexed like markets."""
+        count = len(self.markets)
+        stamps = self.stamps[:count]
+        current = time_ns // self.bucket_ns
+        features = {}
+        for window, buckets in zip(self.windows, self.window_buckets):
+            inside = (stamps > current - buckets) & (stamps <= current)
+            sums = {name: np.where(inside, array[:count], 0).sum(axis=1) for name, array in self.buckets.items()}
+            with np.errstate(invalid="ignore", divide="ignore"):
+                features[f"vwap_{window}s"] = np.where(sums["volume"] > 0, sums["notional"] / sums["volume"], np.nan)
+            features[f"volume_{window}s"] = sums["volume"]
+            features[f"signed_volume_{window}s"] = sums["signed_volume"]
+            features[f"trades_{window}s"] = sums["trades"].astype(np.int64)
+            features[f"realized_vol_{window}s"] = np.sqrt(sums["squared_returns"])
+        return features
+
+    def _emit(self, time_ns: int) -> List[dict]:
+        count = len(self.markets)
+        columns = {name: self.book[name][:count] for name in ("mid", "spread", "microprice")}
+        for i, levels in enumerate(self.depth_levels):
+            columns[f"imbalance_{levels}"] = self.imbalance[:count, i]
+        columns.update(self.window_features(time_ns))
+        # NaN is written as null
+        values = {name: [None if isinstance(v, float) and math.isnan(v) else v for v in array.tolist()]
+                  for name, array in columns.items()}
+        rows = []
+        for (exchange, market), index in self.markets.items():
+            row = {"event": self.event_type, "exchange": exchange, "market": market, "fetch_time": time_ns}
+            row.update({name: column[index] for name, column in values.items()})
+            rows.append(row)
+        return rows
+
+    def extract_data(self) -> List[dict]:
+        """Removes and returns the rows emitted since the last call."""
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        return rows
+
+    def schema(self) -> "pa.Schema":
+        """Arrow schema of the features event type with the configured windows and levels."""
+        import pyarrow as pa
+        from src.writer.schemas import COMMON_FIELDS
+        fields = [pa.field(name, pa.float64()) for name in ("mid", "spread", "microprice")]
+        fields += [pa.field(f"imbalance_{levels}", pa.float64()) for levels in self.depth_levels]
+        for window in self.windows:
+            fields += [pa.field(f"vwap_{window}s", pa.float64()), pa.field(f"volume_{window}s", pa.float64()),
+                       pa.field(f"signed_volume_{window}s", pa.float64()), pa.field(f"trades_{window}s", pa.int64()),
+                       pa.field(f"realized_vol_{window}s", pa.float64())]
+        return pa.schema(COMMON_FIELDS + fields)
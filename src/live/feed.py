@@ -0,0 +1,319 @@
+import json
+import logging
+import math
+import os
+import queue
+import socket
+import struct
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ["orderbook", "trades", "ticker"]
+SIDES = {"buy": 1, "sell": -1}
+SIDE_NAMES = {1: "buy", -1: "sell", 0: None}
+
+# frame: payload length, frame type, subscriber sequence number, payload
+FRAME = struct.Struct("<IBQ")
+FRAME_EVENT = 1
+FRAME_SUBSCRIBE = 2
+# event header: event type, fetch time, exchange and market lengths
+EVENT_HEADER = struct.Struct("<BqBB")
+# trade: timestamp, price, amount, side and id length
+TRADE = struct.Struct("<qddbH")
+TICKER = struct.Struct("<ddddd")
+ORDERBOOK = struct.Struct("<qqHH")
+MAX_SEND_BATCH = 256
+
+
+def _to_float(value) -> float:
+    return math.nan if value is None or value == "" else float(value)
+
+
+def _to_int(value) -> int:
+    return 0 if value is None or value == "" else int(float(value))
+
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+def encode_event(event: dict) -> bytes:
+    """
+    Binary form of a normalized event, see decode_event. Numbers are sent as doubles, the exchange
+    timestamp and the nonce as integers.
+
+    Args:
+        event (dict): orderbook, trades or ticker event with exchange, market and fetch_time keys
+
+    Returns:
+        bytes: the payload of an event frame
+    """
+    event_type = event["event"]
+    exchange, market = event["exchange"].encode(), event["market"].encode()
+    parts = [EVENT_HEADER.pack(EVENT_TYPES.index(event_type), event.get("fetch_time") or 0, len(exchange),
+                               len(market)), exchange, market]
+    if event_type == "trades":
+        trade_id = str(event.get("id", "")).encode()
+        parts += [TRADE.pack(_to_int(event.get("timestamp")), _to_float(event.get("price")),
+                             _to_float(event.get("amount")), SIDES.get(event.get("side"), 0), len(trade_id)),
+                  trade_id]
+    elif event_type == "ticker":
+        parts.append(TICKER.pack(*(_to_float(event.get(name)) for name in
+                                   ("bestBid", "bestBidSize", "bestAsk", "bestAskSize", "lastPrice"))))
+    else:
+        bids, asks = event.get("bids") or [], event.get("asks") or []
+        parts.append(ORDERBOOK.pack(_to_int(event.get("timestamp")), _to_int(event.get("nonce")), len(bids), len(asks)))
+        levels = [_to_float(value) for level in bids + asks for value in level[:2]]
+        parts.append(struct.pack(f"<{len(levels)}d", *levels))
+    return b"".join(parts)
+
+
+def decode_event(payload: bytes) -> dict:
+    """Normalized event of an event frame's payload, prices and amounts as floats, missing ones None."""
+    type_index, fetch_time, exchange_length, market_length = EVENT_HEADER.unpack_from(payload)
+    offset = EVENT_HEADER.size
+    exchange = payload[offset:offset + exchange_length].decode()
+    offset += exchange_length
+    market = payload[offset:offset + market_length].decode()
+    offset += market_length
+    event = {"event": EVENT_TYPES[type_index], "exchange": exchange, "market": market, "fetch_time": fetch_time}
+    if event["event"] == "trades":
+        timestamp, price, amount, side, id_length = TRADE.unpack_from(payload, offset)
+        offset += TRADE.size
+        event.update(timestamp=timestamp, price=_optional(price), amount=_optional(amount),
+                     side=SIDE_NAMES[side], id=payload[offset:offset + id_length].decode())
+    elif event["event"] == "ticker":
+        values = TICKER.unpack_from(payload, offset)
+        event.update(zip(("bestBid", "bestBidSize", "bestAsk", "bestAskSize", "lastPrice"), map(_optional, values)))
+    else:
+        timestamp, nonce, n_bids, n_asks = ORDERBOOK.unpack_from(payload, offset)
+        offset += ORDERBOOK.size
+        levels = struct.unpack_from(f"<{2 * (n_bids + n_asks)}d", payload, offset)
+        pairs = [[levels[i], levels[i + 1]] for i in range(0, len(levels), 2)]
+        event.update(timestamp=timestamp, nonce=nonce, bids=pairs[:n_bids], asks=pairs[n_bids:])
+    return event
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> Optional[bytes]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def read_frame(sock: socket.socket):
+    """(frame type, sequence number, payload) of the next frame, None once the peer closed the socket."""
+    header = _recv_exactly(sock, FRAME.size)
+    if header is None:
+        return None
+    length, frame_type, seq = FRAME.unpack(header)
+    payload = _recv_exactly(sock, length)
+    return None if payload is None else (frame_type, seq, payload)
+
+
+class Subscriber:
+    """A connected client with its filter, its bounded queue of frames and the thread sending them."""
+
+    def __init__(self, server: "FeedServer", sock: socket.socket, max_queue: int):
+        self.server = server
+        self.sock = sock
+        self.queue = queue.Queue(max_queue)
+        self.exchanges = self.markets = self.event_types = None
+        self.seq = 0
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+        # handlers of several event types publish from their own threads
+        self.lock = threading.Lock()
+
+    def matches(self, event: dict) -> bool:
+        return (self.event_types is None or event.get("event") in self.event_types) \
+            and (self.exchanges is None or event.get("exchange") in self.exchanges) \
+            and (self.markets is None or event.get("market") in self.markets)
+
+    def offer(self, payload: bytes):
+        # the sequence number counts dropped frames too, the client sees the gap
+        with self.lock:
+            self.seq += 1
+            try:
+                self.queue.put_nowait((self.seq, payload))
+            except queue.Full:
+                self.dropped += 1
+
+    def run(self):
+        try:
+            subscription = read_frame(self.sock)
+            if subscription is None or subscription[0] != FRAME_SUBSCRIBE:
+                return
+            filters = json.loads(subscription[2] or b"{}")
+            self.exchanges, self.markets, self.event_types = (
+                set(filters[name]) if filters.get(name) else None for name in ("exchanges", "markets", "event_types"))
+            self.server._register(self)
+            while not self.closed:
+                frames = [self.queue.get()]
+                # one system call for everything queued meanwhile
+                while len(frames) < MAX_SEND_BATCH and not self.queue.empty():
+                    frames.append(self.queue.get_nowait())
+                if any(frame is None for frame in frames):
+                    break
+                self.sock.sendall(b"".join(FRAME.pack(len(payload), FRAME_EVENT, seq) + payload
+                                           for seq, payload in frames))
+                self.sent += len(frames)
+        except (OSError, ValueError) as e:
+            logger.info(f"Feed subscriber disconnected: {e}")
+        finally:
+            self.server._unregister(self)
+            self.sock.close()
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            self.sock.shutdown(socket.SHUT_RDWR)
+
+
+class FeedServer:
+    """
+    Publishes the collected events to local processes over a Unix domain socket.
+
+    A client connects, sends a subscribe frame with a JSON filter of exchanges, markets and event
+    types, and receives event frames: payload length (uint32), frame type (uint8) and sequence
+    number (uint64), little endian, followed by the encode_event payload. Each event is encoded
+    once for all subscribers. publish only queues frames, a thread per subscriber sends them. A
+    subscriber whose queue of max_queue frames is full misses the frames until it catches up, the
+    collection is never blocked, and sees the gap in the sequence numbers.
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000):
+        """
+        Args:
+            path (str): path of the socket file
+            max_queue (int, optional): frames queued per subscriber before frames are dropped. Defaults to 10000.
+        """
+        self.path = path
+        self.max_queue = max_queue
+        self.subscribers: List[Subscriber] = []
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def start(self):
+        """Starts accepting subscribers. A path in use is logged, the collection continues without the feed."""
+        try:
+            if os.path.exists(self.path):
+                # left by a collector that did not shut down
+                os.remove(self.path)
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.bind(self.path)
+            self.sock.listen()
+        except OSError as e:
+            logger.error(f"Feed could not listen on {self.path}: {e}")
+            self.sock = None
+            return
+        threading.Thread(target=self._accept, daemon=True).start()
+        logger.info(f"Feed listening on {self.path}")
+
+    def _accept(self):
+        while self.sock is not None:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                break
+            subscriber = Subscriber(self, client, self.max_queue)
+            threading.Thread(target=subscriber.run, daemon=True).start()
+
+    def _register(self, subscriber: Subscriber):
+        with self.lock:
+            # replaced rather than appended to, publish iterates without the lock
+            self.subscribers = self.subscribers + [subscriber]
+
+    def _unregister(self, subscriber: Subscriber):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s is not subscriber]
+        if subscriber.dropped:
+            logger.warning(f"Feed subscriber dropped {subscriber.dropped} of {subscriber.seq} frames")
+
+    def publish(self, event: dict):
+        """
+        Listener of the websocket handlers, queues an event for every subscriber whose filter it matches.
+
+        Args:
+            event (dict): normalized event, events of other types are ignored
+        """
+        if event.get("event") not in EVENT_TYPES:
+            return
+        payload = None
+        for subscriber in self.subscribers:
+            if subscriber.matches(event):
+                if payload is None:
+                    payload = encode_event(event)
+                subscriber.offer(payload)
+
+    def stats(self) -> List[dict]:
+        """Frames queued, sent and dropped per subscriber."""
+        return [{"queued": s.queue.qsize(), "sent": s.sent, "dropped": s.dropped} for s in self.subscribers]
+
+    def stop(self):
+        if self.sock is None:
+            return
+        sock, self.sock = self.sock, None
+        sock.close()
+        for subscriber in self.subscribers:
+            subscriber.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class FeedClient:
+    """
+    Subscribes to a FeedServer, iterating yields the decoded events.
+
+    Example:
+        for event in FeedClient("/tmp/collector-feed.sock", markets=["BTC-EUR"], event_types=["trades"]):
+            ...
+    """
+
+    def __init__(self, path: str, exchanges: Iterable[str] = None, markets: Iterable[str] = None,
+                 event_types: Iterable[str] = None):
+        """
+        Args:
+            path (str): path of the server's socket file
+            exchanges (Iterable[str], optional): exchanges to receive. Defaults to all.
+            markets (Iterable[str], optional): markets to receive. Defaults to all.
+            event_types (Iterable[str], optional): event types to receive. Defaults to all.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        filters = json.dumps({"exchanges": list(exchanges or []), "markets": list(markets or []),
+                              "event_types": list(event_types or [])}).encode()
+        self.sock.sendall(FRAME.pack(len(filters), FRAME_SUBSCRIBE, 0) + filters)
+        self.seq = 0
+        # frames the server dropped because this client was too slow
+        self.missed = 0
+
+    def recv(self) -> Optional[dict]:
+        """The next event, None once the server closed the connection."""
+        frame = read_frame(self.sock)
+        if frame is None:
+            return None
+        _, seq, payload = frame
+        self.missed += seq - self.seq - 1
+        self.seq = seq
+        return decode_event(payload)
+
+    def __iter__(self) -> Iterator[dict]:
+        while True:
+            event = self.recv()
+            if event is None:
+                return
+            yield event
+
+    def close(self):
+        self.sock.close()
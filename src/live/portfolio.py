@@ -0,0 +1,234 @@
+import logging
+import math
+import threading
+from typing import Dict, List, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from src.utils.utils import merge_dicts, parse_levels, walk_book
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10 ** 9
+
+
+class PortfolioValuation:
+    """
+    Values the balances of all exchanges with the live orderbooks in a common currency and emits the
+    valuation as the "portfolio" event type, one row per exchange and one for all of them every
+    emit_interval seconds.
+
+    A holding of an asset on an exchange is valued in the exchange's fiat with the book of its
+    ASSET-FIAT market: marked at the mid, and liquidated by selling it into the bids after the
+    exchange's commission. The part the collected depth cannot absorb is the shortfall, valued at
+    zero in the liquidation value. Fiat totals are converted to the common currency through the
+    configured conversion path, at the mids for the mark value and by walking the books after
+    commission for the liquidation value.
+
+    A book update revalues only the holdings of its market, the totals are summed over the holding
+    arrays when emitting.
+    """
+
+    event_type = "portfolio"
+
+    def __init__(self, currency: str = "EUR", fiats: Dict[str, str] = None, commissions: Dict[str, float] = None,
+                 conversions: Dict[str, Sequence[Sequence[str]]] = None, emit_interval: float = 1):
+        """
+        Args:
+            currency (str, optional): currency the portfolio is valued in. Defaults to "EUR".
+            fiats (Dict[str, str], optional): fiat the holdings of an exchange are valued in by exchange,
+                its exchange_fiat. Defaults to the currency for every exchange.
+            commissions (Dict[str, float], optional): taker commission by exchange. Defaults to 0.
+            conversions (Dict[str, Sequence[Sequence[str]]], optional): path of [exchange, market] legs
+                converting a fiat to the currency by fiat, such as {"TRY": [["btcturk", "USDT-TRY"],
+                ["bitvavo", "USDT-EUR"]]}. Defaults to None.
+            emit_interval (float, optional): seconds between two valuations. Defaults to 1.
+        """
+        self.currency = currency
+        self.fiats = dict(fiats or {})
+        self.commissions = dict(commissions or {})
+        self.conversions = {fiat: [tuple(leg) for leg in path] for fiat, path in (conversions or {}).items()}
+        self.emit_interval_ns = int(emit_interval * NS_PER_SECOND)
+        # balances by exchange as returned by fetch_balance
+        self.balances: Dict[str, Dict[str, dict]] = {}
+        # latest bids and asks of the valuation and conversion markets
+        self.books: Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]] = {}
+        self.conversion_markets = {leg for path in self.conversions.values() for leg in path}
+        self._set_holdings([])
+        self.last_emit = None
+        self.buffer: List[dict] = []
+        self.lock = threading.Lock()
+
+    def _fiat(self, exchange: str) -> str:
+        return self.fiats.get(exchange, self.currency)
+
+    def _set_holdings(self, holdings: List[Tuple[str, str, float]]):
+        """Replaces the holdings, (exchange, asset, amount) each, and revalues them with the latest books."""
+        self.holdings = holdings
+        self.exchange_names = list(dict.fromkeys(exchange for exchange, _, _ in holdings))
+        exchange_index = {name: i for i, name in enumerate(self.exchange_names)}
+        count = len(holdings)
+        self.exchange_index = np.array([exchange_index[exchange] for exchange, _, _ in holdings], dtype=np.int64)
+        self.amount = np.array([amount for _, _, amount in holdings], dtype=float)
+        self.mark = np.full(count, math.nan)
+        self.liquidation = np.full(count, math.nan)
+        self.shortfall = np.zeros(count)
+        # holding indices by (exchange, market) of their book
+        self.by_market: Dict[Tuple[str, str], List[int]] = {}
+        for i, (exchange, asset, amount) in enumerate(holdings):
+            fiat = self._fiat(exchange)
+            if asset == fiat:
+                self.mark[i] = self.liquidation[i] = amount
+                continue
+            key = (exchange, f"{asset}-{fiat}")
+            self.by_market.setdefault(key, []).append(i)
+            if key in self.books:
+                self._revalue(i, *self.books[key])
+
+    def set_balances(self, exchange: str, balances: Dict[str, dict]):
+        """
+        Replaces the balances of an exchange.
+
+        Args:
+            exchange (str): exchange name
+            balances (Dict[str, dict]): {"total", "available"} amounts by asset as returned by fetch_balance
+        """
+        with self.lock:
+            self.balances[exchange] = balances
+            holdings = [(name, asset, float(balance["total"])) for name, assets in self.balances.items()
+                        for asset, balance in assets.items() if float(balance["total"]) > 0]
+            self._set_holdings(holdings)
+
+    def positions(self) -> Dict[str, dict]:
+        """Total and available amounts by asset summed over the exchanges."""
+        with self.lock:
+            return merge_dicts([{asset: dict(balance) for asset, balance in assets.items()}
+                                for assets in self.balances.values()])
+
+    def _revalue(self, i: int, bids: np.ndarray, asks: np.ndarray):
+        amount = self.amount[i]
+        if not len(bids) or not len(asks):
+            self.mark[i] = self.liquidation[i] = math.nan
+            return
+        exchange = self.holdings[i][0]
+        self.mark[i] = amount * (bids[0, 0] + asks[0, 0]) / 2
+        proceeds, sold = walk_book(bids, amount)
+        self.liquidation[i] = proceeds * (1 - self.commissions.get(exchange, 0))
+        self.shortfall[i] = amount - sold
+
+    def update(self, event: dict):
+        """
+        Consumer of the event bus, revalues the holdings of an orderbook event's market. Other events
+        are ignored.
+
+        Args:
+            event (dict): normalized orderbook with exchange, market, fetch_time, bids and asks
+        """
+        if event.get("event") != "orderbook":
+            return
+        key = (event.get("exchange"), event.get("market"))
+        time_ns = event.get("fetch_time")
+        with self.lock:
+            holdings = self.by_market.get(key)
+            if holdings is None and key not in self.conversion_markets:
+                return
+            bids = parse_levels(event.get("bids"))
+            # the holdings need the best ask only, the conversions walk the asks
+            if key in self.conversion_markets:
+                asks = parse_levels(event.get("asks"))
+            else:
+                asks = parse_levels((event.get("asks") or [])[:1])
+            self.books[key] = (bids, asks)
+            for i in holdings or ():
+                self._revalue(i, bids, asks)
+            if self.last_emit is None:
+                self.last_emit = time_ns
+            elif time_ns - self.last_emit >= self.emit_interval_ns:
+                self.buffer.extend(self._emit(time_ns))
+                self.last_emit = time_ns
+
+    def _convert(self, fiat: str, amount: float, liquidate: bool) -> float:
+        """An amount of a fiat in the currency, NaN if a book of the path is missing."""
+        if fiat == self.currency:
+            return amount
+        path = self.conversions.get(fiat)
+        if path is None:
+            return math.nan
+        held = fiat
+        for exchange, market in path:
+            book = self.books.get((exchange, market))
+            if book is None or not len(book[0]) or not len(book[1]):
+                return math.nan
+            bids, asks = book
+            base, quote = market.split("-")
+            fee = 1 - self.commissions.get(exchange, 0)
+            if held == quote:
+                # buys the base
+                amount = walk_book(asks, amount, quote=True)[0] * fee if liquidate \
+                    else amount / ((bids[0, 0] + asks[0, 0]) / 2)
+                held = base
+            elif held == base:
+                amount = walk_book(bids, amount)[0] * fee if liquidate else amount * (bids[0, 0] + asks[0, 0]) / 2
+                held = quote
+            else:
+                raise ValueError(f"Conversion leg {exchange} {market} does not trade {held}")
+        return amount
+
+    def valuation(self) -> List[dict]:
+        """Values of the exchanges and of all of them in the currency, see schema for the fields."""
+        with self.lock:
+            return self._valuation()
+
+    def _valuation(self) -> List[dict]:
+        exchanges = len(self.exchange_names)
+        priced = ~np.isnan(self.mark)
+
+        def by_exchange(values: np.ndarray) -> np.ndarray:
+            return np.bincount(self.exchange_index[priced], weights=values[priced], minlength=exchanges)
+
+        mark, liquidation = by_exchange(self.mark), by_exchange(self.liquidation)
+        mid = np.divide(self.mark, self.amount, out=np.zeros_like(self.mark), where=self.amount > 0)
+        shortfall = by_exchange(self.shortfall * mid)
+        unpriced = np.bincount(self.exchange_index[~priced], minlength=exchanges)
+        rows = []
+        for i, exchange in enumerate(self.exchange_names):
+            fiat = self._fiat(exchange)
+            rate = self._convert(fiat, 1.0, liquidate=False)
+            rows.append({"exchange": exchange, "mark_value": mark[i] * rate,
+                         "liquidation_value": self._convert(fiat, liquidation[i], liquidate=True),
+                         "shortfall_value": shortfall[i] * rate, "unpriced": int(unpriced[i])})
+        total = {"exchange": "all", "unpriced": int(unpriced.sum())}
+        for name in ("mark_value", "liquidation_value", "shortfall_value"):
+            total[name] = sum(row[name] for row in rows)
+        rows.append(total)
+        for row in rows:
+            row.update({"event": self.event_type, "market": self.currency})
+        return rows
+
+    def _emit(self, time_ns: int) -> List[dict]:
+        rows = self._valuation()
+        for row in rows:
+            row["fetch_time"] = time_ns
+            # NaN is written as null
+            for name in ("mark_value", "liquidation_value", "shortfall_value"):
+                if math.isnan(row[name]):
+                    row[name] = None
+        return rows
+
+    def extract_data(self) -> List[dict]:
+        """Removes and returns the rows emitted since the last call."""
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+        return rows
+
+    @staticmethod
+    def schema() -> "pa.Schema":
+        """Arrow schema of the portfolio event type, market is the valuation currency."""
+        import pyarrow as pa
+        from src.writer.schemas import COMMON_FIELDS
+        return pa.schema(COMMON_FIELDS + [pa.field(name, pa.float64()) for name in
+                                          ("mark_value", "liquidation_value", "shortfall_value")]
+                         + [pa.field("unpriced", pa.int64())])
@@ -0,0 +1,216 @@
+import logging
+import math
+import threading
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from src.utils.clock import now_ns
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10 ** 9
+SIDES = {"buy": 1, "sell": -1}
+
+
+def _to_float(value) -> float:
+    # exchanges send numbers as strings, a missing value is NaN
+    return math.nan if value is None or value == "" else float(value)
+
+
+def _to_int(value) -> int:
+    return 0 if value is None or value == "" else int(float(value))
+
+
+class RingBuffer:
+    """
+    Columnar ring buffer of one series. Each column is a NumPy array, rows are appended in receive
+    order and overwrite the oldest rows once the buffer is full. A buffer whose oldest row is still
+    inside the window doubles its capacity instead, up to max_capacity.
+    """
+
+    def __init__(self, columns: Dict[str, Tuple[np.dtype, tuple]], capacity: int, max_capacity: int):
+        """
+        Args:
+            columns (Dict[str, Tuple[np.dtype, tuple]]): column name to dtype and shape of one value
+            capacity (int): initial number of rows
+            max_capacity (int): rows the buffer grows to at most
+        """
+        self.columns = columns
+        self.capacity = capacity
+        self.max_capacity = max(capacity, max_capacity)
+        self.arrays = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, (dtype, shape) in columns.items()}
+        # number of rows appended so far, the next row goes to head % capacity
+        self.head = 0
+
+    def __len__(self) -> int:
+        return min(self.head, self.capacity)
+
+    def _grow(self):
+        ordered = self._ordered()
+        self.capacity = min(self.capacity * 2, self.max_capacity)
+        for name, (dtype, shape) in self.columns.items():
+            array = np.zeros((self.capacity,) + shape, dtype=dtype)
+            array[:len(ordered[name])] = ordered[name]
+            self.arrays[name] = array
+        self.head = len(ordered["fetch_time"])
+
+    def append(self, row: dict, oldest_kept: int):
+        """
+        Adds a row.
+
+        Args:
+            row (dict): value per column
+            oldest_kept (int): receive time the window starts at, an older row may be overwritten
+        """
+        if self.head >= self.capacity and self.capacity < self.max_capacity \
+                and self.arrays["fetch_time"][self.head % self.capacity] >= oldest_kept:
+            self._grow()
+        index = self.head % self.capacity
+        for name, value in row.items():
+            self.arrays[name][index] = value
+        self.head += 1
+
+    def _ordered(self) -> Dict[str, np.ndarray]:
+        if self.head <= self.capacity:
+            return {name: array[:self.head] for name, array in self.arrays.items()}
+        start = self.head % self.capacity
+        return {name: np.concatenate((array[start:], array[:start])) for name, array in self.arrays.items()}
+
+    def slice(self, start_ns: int, end_ns: int) -> Dict[str, np.ndarray]:
+        """
+        Copies of the rows received from start_ns to end_ns, oldest first.
+
+        Args:
+            start_ns (int): first receive time in UTC epoch nanoseconds
+            end_ns (int): last receive time in UTC epoch nanoseconds, inclusive
+        """
+        ordered = self._ordered()
+        times = ordered["fetch_time"]
+        first, last = np.searchsorted(times, start_ns, "left"), np.searchsorted(times, end_ns, "right")
+        return {name: np.array(array[first:last]) for name, array in ordered.items()}
+
+
+class RollingStore:
+    """
+    Keeps the last window_seconds of the collected events in memory, one columnar ring buffer per
+    (exchange, market, event type), so that live consumers query fresh data without waiting for
+    the parquet files. Registered as a listener of the websocket handlers, appending is O(1).
+
+    Columns, times in UTC epoch nanoseconds except the exchange timestamp in milliseconds:
+        trades: fetch_time, timestamp, price, amount, side (1 buy, -1 sell)
+        ticker: fetch_time, bestBid, bestBidSize, bestAsk, bestAskSize, lastPrice
+        orderbook: fetch_time, timestamp, nonce, bids and asks of shape (depth, 2) as price, amount
+    Missing prices and amounts are NaN.
+    """
+
+    def __init__(self, window_seconds: float = 300, orderbook_depth: int = 10, initial_capacity: int = 1024,
+                 max_capacity: int = 1_000_000):
+        """
+        Args:
+            window_seconds (float, optional): seconds of data kept per series. Defaults to 300.
+            orderbook_depth (int, optional): price levels kept per side of a book. Defaults to 10.
+            initial_capacity (int, optional): rows a new series starts with. Defaults to 1024.
+            max_capacity (int, optional): rows a series grows to at most, bounding the memory of a
+                series whose rate exceeds max_capacity per window. Defaults to 1000000.
+        """
+        self.window_ns = int(window_seconds * NS_PER_SECOND)
+        self.orderbook_depth = orderbook_depth
+        self.initial_capacity = initial_capacity
+        self.max_capacity = max_capacity
+        self.columns = {
+            "trades": {"fetch_time": (np.int64, ()), "timestamp": (np.int64, ()), "price": (np.float64, ()),
+                       "amount": (np.float64, ()), "side": (np.int8, ())},
+            "ticker": {"fetch_time": (np.int64, ()), "bestBid": (np.float64, ()), "bestBidSize": (np.float64, ()),
+                       "bestAsk": (np.float64, ()), "bestAskSize": (np.float64, ()), "lastPrice": (np.float64, ())},
+            "orderbook": {"fetch_time": (np.int64, ()), "timestamp": (np.int64, ()), "nonce": (np.int64, ()),
+                          "bids": (np.float64, (orderbook_depth, 2)), "asks": (np.float64, (orderbook_depth, 2))},
+        }
+        self.series: Dict[Tuple[str, str, str], RingBuffer] = {}
+        self.lock = threading.Lock()
+
+    def _levels(self, levels) -> np.ndarray:
+        array = np.full((self.orderbook_depth, 2), np.nan)
+        for i, level in enumerate((levels or [])[:self.orderbook_depth]):
+            array[i, 0], array[i, 1] = _to_float(level[0]), _to_float(level[1])
+        return array
+
+    def _row(self, event_type: str, event: dict) -> dict:
+        row = {"fetch_time": event.get("fetch_time") or now_ns()}
+        if event_type == "trades":
+            row.update(timestamp=_to_int(event.get("timestamp")), price=_to_float(event.get("price")),
+                       amount=_to_float(event.get("amount")), side=SIDES.get(event.get("side"), 0))
+        elif event_type == "ticker":
+            for name in ("bestBid", "bestBidSize", "bestAsk", "bestAskSize", "lastPrice"):
+                row[name] = _to_float(event.get(name))
+        else:
+            row.update(timestamp=_to_int(event.get("timestamp")), nonce=_to_int(event.get("nonce")),
+                       bids=self._levels(event.get("bids")), asks=self._levels(event.get("asks")))
+        return row
+
+    def append(self, event: dict):
+        """
+        Adds a normalized event from a websocket handler. Events of other types are ignored.
+
+        Args:
+            event (dict): event with event, exchange, market and fetch_time keys
+        """
+        event_type = event.get("event")
+        if event_type not in self.columns:
+            return
+        row = self._row(event_type, event)
+        key = (event.get("exchange"), event.get("market"), event_type)
+        with self.lock:
+            buffer = self.series.get(key)
+            if buffer is None:
+                buffer = self.series[key] = RingBuffer(self.columns[event_type], self.initial_capacity,
+                                                       self.max_capacity)
+            buffer.append(row, row["fetch_time"] - self.window_ns)
+
+    def keys(self) -> List[Tuple[str, str, str]]:
+        """The (exchange, market, event type) of every series."""
+        with self.lock:
+            return list(self.series)
+
+    def query(self, exchange: str, market: str, event_type: str, start_ns: Optional[int] = None,
+              end_ns: Optional[int] = None) -> Dict[str, np.ndarray]:
+        """
+        Events of a series received from start_ns to end_ns, limited to the window.
+
+        Args:
+            exchange (str): such as "bitvavo"
+            market (str): such as "BTC-EUR"
+            event_type (str): "orderbook", "trades" or "ticker"
+            start_ns (int, optional): first receive time in UTC epoch nanoseconds. Defaults to the window start.
+            end_ns (int, optional): last receive time in UTC epoch nanoseconds. Defaults to now.
+
+        Returns:
+            Dict[str, np.ndarray]: column name to a copy of its values, oldest first, empty columns
+                if the series has no data
+        """
+        end_ns = now_ns() if end_ns is None else end_ns
+        start_ns = max(start_ns or 0, now_ns() - self.window_ns)
+        with self.lock:
+            buffer = self.series.get((exchange, market, event_type))
+            if buffer is not None:
+                return buffer.slice(start_ns, end_ns)
+        return {name: np.zeros((0,) + shape, dtype=dtype) for name, (dtype, shape) in self.columns[event_type].items()}
+
+    def query_arrow(self, exchange: str, market: str, event_type: str, start_ns: Optional[int] = None,
+                    end_ns: Optional[int] = None) -> "pa.Table":
+        """Same as query as an Arrow table, the price levels of a book as fixed size lists."""
+        import pyarrow as pa
+        columns = self.query(exchange, market, event_type, start_ns, end_ns)
+        arrays = {}
+        for name, values in columns.items():
+            if values.ndim == 3:
+                # (rows, depth, 2) -> list of depth [price, amount] pairs
+                flat = pa.array(values.reshape(-1))
+                pairs = pa.FixedSizeListArray.from_arrays(flat, 2)
+                arrays[name] = pa.FixedSizeListArray.from_arrays(pairs, values.shape[1])
+            else:
+                arrays[name] = pa.array(values)
+        return pa.table(arrays)
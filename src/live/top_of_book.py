@@ -0,0 +1,209 @@
+import logging
+import math
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = 0x544F4231  # "TOB1"
+VERSION = 1
+
+HEADER = np.dtype([("magic", "<u4"), ("version", "<u4"), ("capacity", "<u4"), ("count", "<u4")])
+NAMES = np.dtype([("exchange", "S16"), ("market", "S32")])
+# one row per instrument, 64 bytes so that a row is a single cache line
+ROW = np.dtype([("seq", "<u8"), ("bid", "<f8"), ("bid_size", "<f8"), ("ask", "<f8"), ("ask_size", "<f8"),
+                ("exchange_time", "<i8"), ("fetch_time", "<i8"), ("updates", "<u8")])
+
+
+def instruments_from_config(config: dict) -> List[Tuple[str, str]]:
+    """(exchange, market) of every configured pair in a stable order, its index is the instrument ID.
+
+    Args:
+        config (dict): data collector config with pairs normalized to market names
+    """
+    return sorted({(exchange, pair) for exchange, pairs in config["pairs"].items() for pair in pairs})
+
+
+def _to_float(value) -> Optional[float]:
+    return None if value is None or value == "" else float(value)
+
+
+class TopOfBook:
+    """
+    Best bid and ask per instrument in a named shared-memory segment, written by the collector and
+    read by any process on the host without a socket of its own.
+
+    The segment holds a header, the (exchange, market) name of each instrument ID and a NumPy
+    struct array with one row per instrument. Rows are written under a seqlock: the writer makes
+    the sequence odd, writes the fields and makes it even again, a reader copies the row and
+    retries when the sequence was odd or changed meanwhile. A row has one writer, the process
+    collecting its market. A writer that starts on an odd sequence, left behind by a writer that
+    was killed mid-update, still ends on an even one.
+
+    Prices and sizes are NaN until the first update. exchange_time is the exchange timestamp in
+    milliseconds, 0 if the event has none, and fetch_time the receive time in UTC epoch nanoseconds.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)
+        capacity = int(self.header["capacity"][0])
+        self.names = np.ndarray((capacity,), dtype=NAMES, buffer=shm.buf, offset=HEADER.itemsize)
+        self.rows = np.ndarray((capacity,), dtype=ROW, buffer=shm.buf,
+                               offset=self._rows_offset(capacity))
+        self._ids: Dict[Tuple[str, str], int] = {}
+
+    @staticmethod
+    def _rows_offset(capacity: int) -> int:
+        offset = HEADER.itemsize + NAMES.itemsize * capacity
+        # rows start on a cache line
+        return -(-offset // 64) * 64
+
+    @classmethod
+    def create(cls, name: str, instruments: Iterable[Tuple[str, str]]) -> "TopOfBook":
+        """
+        Creates the segment, replacing a stale one of the same name left by a crashed collector.
+
+        Args:
+            name (str): segment name, readers attach with it
+            instruments (Iterable[Tuple[str, str]]): (exchange, market) per instrument ID
+
+        Returns:
+            TopOfBook: the table, unlinked by its owner
+        """
+        instruments = list(instruments)
+        capacity = max(len(instruments), 1)
+        size = cls._rows_offset(capacity) + ROW.itemsize * capacity
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)
+        header[0] = (0, VERSION, capacity, len(instruments))
+        book = cls(shm, owner=True)
+        for i, (exchange, market) in enumerate(instruments):
+            book.names[i] = (exchange.encode(), market.encode())
+        book.rows[:] = np.zeros(1, dtype=ROW)
+        for field in ("bid", "bid_size", "ask", "ask_size"):
+            book.rows[field] = np.nan
+        # readers check the magic last, the table is complete once it is set
+        header["magic"] = MAGIC
+        return book
+
+    @classmethod
+    def attach(cls, name: str) -> "TopOfBook":
+        """
+        Attaches to an existing segment without copying it.
+
+        Args:
+            name (str): segment name
+
+        Raises:
+            FileNotFoundError: If no collector created the segment.
+            ValueError: If the segment is not a top-of-book table of this version.
+        """
+        from multiprocessing import resource_tracker
+        # workers of the collector share its resource tracker, a process that starts its own tracker
+        # here has to unregister the segment or the tracker unlinks it when the process exits
+        own_tracker = getattr(resource_tracker._resource_tracker, "_fd", None) is None
+        shm = shared_memory.SharedMemory(name=name)
+        if own_tracker:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        header = np.ndarray((1,), dtype=HEADER, buffer=shm.buf)
+        if header["magic"][0] != MAGIC or header["version"][0] != VERSION:
+            shm.close()
+            raise ValueError(f"Shared memory {name} is not a top-of-book table of version {VERSION}")
+        return cls(shm, owner=False)
+
+    def instruments(self) -> List[Tuple[str, str]]:
+        """(exchange, market) per instrument ID."""
+        count = int(self.header["count"][0])
+        return [(n["exchange"].decode(), n["market"].decode()) for n in self.names[:count]]
+
+    def instrument_id(self, exchange: str, market: str) -> Optional[int]:
+        """ID of an instrument, None if the table has no such instrument."""
+        if not self._ids:
+            self._ids = {instrument: i for i, instrument in enumerate(self.instruments())}
+        return self._ids.get((exchange, market))
+
+    def write(self, instrument_id: int, bid: float = None, bid_size: float = None, ask: float = None,
+              ask_size: float = None, exchange_time: int = 0, fetch_time: int = 0):
+        """Updates a row, a side given as None keeps its previous values."""
+        rows = self.rows
+        seq = int(rows["seq"][instrument_id])
+        start = seq + 1 if seq % 2 == 0 else seq + 2
+        rows["seq"][instrument_id] = start
+        if bid is not None:
+            rows["bid"][instrument_id] = bid
+            rows["bid_size"][instrument_id] = math.nan if bid_size is None else bid_size
+        if ask is not None:
+            rows["ask"][instrument_id] = ask
+            rows["ask_size"][instrument_id] = math.nan if ask_size is None else ask_size
+        rows["exchange_time"][instrument_id] = exchange_time or 0
+        rows["fetch_time"][instrument_id] = fetch_time or 0
+        rows["updates"][instrument_id] += 1
+        rows["seq"][instrument_id] = start + 1
+
+    def update(self, event: dict):
+        """
+        Listener of the websocket handlers, updates the row of the event's market from an orderbook
+        or ticker event. Other events and markets without an ID are ignored.
+        """
+        event_type = event.get("event")
+        if event_type == "orderbook":
+            bids, asks = event.get("bids") or [], event.get("asks") or []
+            bid, bid_size = (_to_float(bids[0][0]), _to_float(bids[0][1])) if bids else (None, None)
+            ask, ask_size = (_to_float(asks[0][0]), _to_float(asks[0][1])) if asks else (None, None)
+        elif event_type == "ticker":
+            bid, bid_size = _to_float(event.get("bestBid")), _to_float(event.get("bestBidSize"))
+            ask, ask_size = _to_float(event.get("bestAsk")), _to_float(event.get("bestAskSize"))
+        else:
+            return
+        instrument_id = self.instrument_id(event.get("exchange"), event.get("market"))
+        if instrument_id is None:
+            return
+        timestamp = event.get("timestamp")
+        self.write(instrument_id, bid, bid_size, ask, ask_size,
+                   int(float(timestamp)) if timestamp not in (None, "") else 0, event.get("fetch_time"))
+
+    def read(self, instrument_id: int, max_retries: int = 10000) -> Optional[np.void]:
+        """
+        Consistent copy of a row.
+
+        Args:
+            instrument_id (int): row to read
+            max_retries (int, optional): attempts while the row is being written. Defaults to 10000.
+
+        Returns:
+            Optional[np.void]: the row with the fields of ROW, None if no consistent copy was read,
+                e.g. because its writer died mid-update
+        """
+        rows = self.rows
+        for _ in range(max_retries):
+            seq = rows["seq"][instrument_id]
+            if seq % 2:
+                continue
+            row = rows[instrument_id].copy()
+            if rows["seq"][instrument_id] == seq:
+                return row
+        return None
+
+    def read_market(self, exchange: str, market: str) -> Optional[np.void]:
+        """Consistent copy of the row of a market, None if the table has no such market."""
+        instrument_id = self.instrument_id(exchange, market)
+        return None if instrument_id is None else self.read(instrument_id)
+
+    def close(self):
+        """Detaches from the segment, the owner also removes it."""
+        # views into the buffer have to be released before it can be closed
+        self.header = self.names = self.rows = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
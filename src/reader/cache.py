@@ -0,0 +1,334 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterable, Optional, TYPE_CHECKING
+
+from src.utils.config_loader import load_config_by_name
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+class ParquetCache:
+    """
+    Read-through disk cache of the collector's parquet objects on S3, bounded by bytes with
+    least recently used eviction.
+
+    A cached object is served without a request while it was validated within revalidate_after
+    seconds, after that its ETag is compared with a HEAD request and the object is only downloaded
+    again if it changed. Downloads are verified against the ETag, part by part for multipart uploads,
+    those whose part size S3 does not report are counted as unverified. Several threads and processes
+    can share a cache directory: the index is an sqlite database, concurrent downloads of the same
+    object wait for each other and an evicted file stays readable for whoever has it open.
+    """
+
+    def __init__(self, bucket: str, directory: str, max_bytes: int, prefix: str = "",
+                 get_client: Callable = None, revalidate_after: float = 3600):
+        """
+        Args:
+            bucket (str): S3 bucket name
+            directory (str): local cache directory, e.g. on a local NVMe disk
+            max_bytes (int): size the cached files are kept under
+            prefix (str, optional): key prefix of the collector's data, such as "data/prod". Defaults to "".
+            get_client (Callable, optional): returns a boto3 S3 client. Defaults to a client with the
+                credentials the writer uses.
+            revalidate_after (float, optional): seconds a validated object is served without asking S3.
+                Defaults to 3600.
+        """
+        self.bucket = bucket
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.prefix = prefix.rstrip("/")
+        self.get_client = get_client or self._default_client
+        self.revalidate_after = revalidate_after
+        self._client = None
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidations": 0, "changed": 0, "evictions": 0,
+                      "unverified": 0, "bytes_downloaded": 0, "bytes_saved": 0}
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "locks"), exist_ok=True)
+        with self._db() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS objects (key TEXT PRIMARY KEY, etag TEXT, size INTEGER, "
+                       "file TEXT, last_access REAL, validated_at REAL)")
+
+    def _default_client(self):
+        with self._lock:
+            if self._client is None:
+                import boto3
+                self._client = boto3.client(
+                    "s3",
+                    aws_access_key_id=os.environ.get('aws_access_key_id'),
+                    aws_secret_access_key=os.environ.get('aws_secret_access_key'),
+                )
+            return self._client
+
+    @contextmanager
+    def _db(self):
+        # a connection per use, sqlite connections can't be shared between threads
+        db = sqlite3.connect(os.path.join(self.directory, "index.sqlite"), timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    @contextmanager
+    def _key_lock(self, key: str):
+        import fcntl
+        path = os.path.join(self.directory, "locks", hashlib.sha256(key.encode()).hexdigest())
+        with open(path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _count(self, name: str, value: int = 1):
+        with self._lock:
+            self.stats[name] += value
+
+    def _full_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def open(self, key: str) -> BinaryIO:
+        """
+        Opens a cached object, downloading it first if needed.
+
+        Args:
+            key (str): object key relative to the prefix, e.g. the path of a manifest entry
+
+        Returns:
+            BinaryIO: the local file opened for reading
+        """
+        first = self._lookup(key)
+        if first is not None:
+            f = self._open_cached(key, first)
+            if f is not None:
+                return f
+        with self._key_lock(key):
+            # another thread or process may have downloaded it while this one waited
+            row = self._lookup(key)
+            if row is not None and (first is None or row[2] != first[2]):
+                f = self._open_cached(key, row)
+                if f is not None:
+                    return f
+            return self._download(key)
+
+    def _lookup(self, key: str):
+        with self._db() as db:
+            row = db.execute("SELECT etag, size, file, validated_at FROM objects WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                db.execute("UPDATE objects SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def _open_cached(self, key: str, row) -> Optional[BinaryIO]:
+        etag, size, file, validated_at = row
+        if time.time() - validated_at > self.revalidate_after:
+            self._count("revalidations")
+            head = self.get_client().head_object(Bucket=self.bucket, Key=self._full_key(key))
+            if head["ETag"] != etag:
+                self._count("changed")
+                return None
+            with self._db() as db:
+                db.execute("UPDATE objects SET validated_at = ? WHERE key = ?", (time.time(), key))
+        try:
+            f = open(os.path.join(self.directory, "objects", file), "rb")
+        except FileNotFoundError:
+            # evicted since the lookup
+            return None
+        self._count("hits")
+        self._count("bytes_saved", size)
+        return f
+
+    def _download(self, key: str) -> BinaryIO:
+        client = self.get_client()
+        head = client.head_object(Bucket=self.bucket, Key=self._full_key(key))
+        etag, size = head["ETag"], head["ContentLength"]
+        # a changed object gets a new file, readers of the old one keep reading it
+        file = f"{hashlib.sha256(key.encode()).hexdigest()[:32]}-{uuid.uuid4().hex[:8]}.parquet"
+        path = os.path.join(self.directory, "objects", file)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                client.download_fileobj(self.bucket, self._full_key(key), f)
+            # also fails if the object changed since the HEAD request
+            verified = self._verify(tmp_path, etag, size, self._part_size(client, key, etag))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        f = open(path, "rb")
+
+        now = time.time()
+        with self._db() as db:
+            old = db.execute("SELECT file FROM objects WHERE key = ?", (key,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)", (key, etag, size, file, now, now))
+            if old is not None:
+                self._remove_file(old[0])
+            self._evict(db, key)
+        self._count("misses")
+        self._count("bytes_downloaded", size)
+        if not verified:
+            self._count("unverified")
+        return f
+
+    def _part_size(self, client, key: str, etag: str) -> Optional[int]:
+        """Size of the first part of a multipart upload, None for other objects or if the store does not report it."""
+        if "-" not in etag:
+            return None
+        from botocore.exceptions import ClientError
+        try:
+            return client.head_object(Bucket=self.bucket, Key=self._full_key(key), PartNumber=1)["ContentLength"]
+        except ClientError as e:
+            logger.debug(f"Could not get the part size of {key}: {e}")
+            return None
+
+    @staticmethod
+    def _verify(path: str, etag: str, size: int, part_size: int = None) -> bool:
+        """
+        Compares a download with the object's size and ETag, the MD5 of the object or of its parts.
+
+        Args:
+            path (str): downloaded file
+            etag (str): ETag of the object
+            size (int): size of the object
+            part_size (int, optional): part size of a multipart upload. Defaults to whole MB parts
+                guessed from the number of parts.
+
+        Returns:
+            bool: False if a multipart ETag could not be verified because the guessed part size is wrong
+        """
+        if os.path.getsize(path) != size:
+            raise ValueError(f"Downloaded {os.path.getsize(path)} of {size} bytes")
+        etag = etag.strip('"')
+        if "-" in etag:
+            guessed = part_size is None
+            if guessed:
+                # uploads use whole MB parts
+                part_size = -(-size // int(etag.split("-")[1]) // MB) * MB or MB
+            digests = []
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(part_size), b""):
+                    digests.append(hashlib.md5(chunk).digest())
+            digest = f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+            if digest == etag:
+                return True
+            if not guessed:
+                raise ValueError(f"Downloaded content does not match the multipart ETag {etag}")
+            logger.warning(f"Could not verify the multipart ETag {etag}, the part size is unknown")
+            return False
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(MB), b""):
+                md5.update(chunk)
+        if md5.hexdigest() != etag:
+            raise ValueError(f"Downloaded content does not match the ETag {etag}")
+        return True
+
+    def _remove_file(self, file: str):
+        try:
+            os.remove(os.path.join(self.directory, "objects", file))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, db, keep_key: str):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = db.execute("SELECT key, size, file FROM objects WHERE key != ? ORDER BY last_access",
+                          (keep_key,)).fetchall()
+        for key, size, file in rows:
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM objects WHERE key = ?", (key,))
+            self._remove_file(file)
+            total -= size
+            self._count("evictions")
+
+    def read_table(self, key: str, partition_columns: bool = True, **kwargs) -> "pa.Table":
+        """
+        Reads a cached parquet object.
+
+        Args:
+            key (str): object key relative to the prefix
+            partition_columns (bool, optional): whether the hive partition values of the key, such as
+                exchange, date and hour, are added as string columns. Defaults to True.
+            **kwargs: options of pyarrow.parquet.read_table, such as columns or filters
+
+        Returns:
+            pa.Table: the object's rows
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        with self.open(key) as f:
+            table = pq.read_table(f, **kwargs)
+        if partition_columns:
+            for part in key.split("/")[:-1]:
+                name, sep, value = part.partition("=")
+                if sep and name not in table.column_names:
+                    table = table.append_column(name, pa.array([value] * table.num_rows, type=pa.string()))
+        return table
+
+    def read_entries(self, entries: Iterable[dict], **kwargs) -> "pa.Table":
+        """
+        Reads the objects of manifest entries, see src.writer.manifest.Manifest.entries.
+
+        Args:
+            entries (Iterable[dict]): manifest entries
+            **kwargs: options of read_table
+
+        Returns:
+            pa.Table: the rows of all objects
+        """
+        import pyarrow as pa
+        tables = [self.read_table(entry["path"], **kwargs) for entry in entries]
+        if not tables:
+            return pa.table({})
+        # promote is deprecated for promote_options from pyarrow 14 on
+        if int(pa.__version__.split(".")[0]) >= 14:
+            return pa.concat_tables(tables, promote_options="default")
+        return pa.concat_tables(tables, promote=True)
+
+    def summary(self) -> dict:
+        """Hit rate, bytes served from disk instead of S3 and the cache's current size."""
+        with self._lock:
+            stats = dict(self.stats)
+        with self._db() as db:
+            objects, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+        requests = stats["hits"] + stats["misses"]
+        stats.update({"hit_rate": stats["hits"] / requests if requests else None,
+                      "objects": objects, "cached_bytes": size})
+        return stats
+
+
+def create_parquet_cache(directory: str = None, max_gb: float = None) -> ParquetCache:
+    """
+    Cache of the current environment's S3 data, configured under s3 and reader_cache in data.yaml.
+
+    Args:
+        directory (str, optional): overrides the configured cache directory
+        max_gb (float, optional): overrides the configured cache size in GB
+
+    Returns:
+        ParquetCache: the cache
+    """
+    config = load_config_by_name("data")
+    cache_config = config.get("reader_cache", {})
+    return ParquetCache(config["s3"]["bucket"],
+                        directory or cache_config.get("directory", "data/cache"),
+                        int((max_gb or cache_config.get("max_gb", 50)) * 1024 * MB),
+                        prefix=config["s3"]["prefix"],
+                        revalidate_after=cache_config.get("revalidate_after", 3600))
@@ -0,0 +1,279 @@
+import copy
+import logging
+import multiprocessing
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from src.data_collector import DataCollector
+from src.exchanges.exchange_factory import create_exchange
+from src.writer.factory import create_writer
+from src.utils.sharding import subscriptions_from_config
+
+logger = logging.getLogger(__name__)
+
+# a unit of work that is assigned to exactly one worker
+Market = Tuple[str, str]
+# signals the supervisor handles itself, a worker must not run the supervisor's handlers
+WORKER_SIGNALS = {signal.SIGINT, signal.SIGTERM}
+
+
+def split_markets(markets: List[Market], num_workers: int, rates: Dict[Market, float] = None) -> List[List[Market]]:
+    """Splits (exchange, market) pairs over workers so that the expected message rate per worker is balanced.
+
+    Markets are placed heaviest first on the currently lightest worker (longest processing time
+    first). Markets without an observed rate count as the average observed rate, or 1 if nothing
+    has been observed yet, which makes the initial split a plain round robin.
+
+    Args:
+        markets (List[Market]): such as [("bitvavo", "BTC-EUR"), ("bitvavo", "ETH-EUR")]
+        num_workers (int): number of worker processes
+        rates (Dict[Market, float], optional): observed messages per second per market.
+
+    Returns:
+        List[List[Market]]: markets per worker, some workers may be empty if there are fewer markets than workers
+    """
+    rates = rates if rates else {}
+    default_rate = sum(rates.values()) / len(rates) if rates else 1.0
+    weighted = sorted(markets, key=lambda market: rates.get(market, default_rate), reverse=True)
+    assignment = [[] for _ in range(num_workers)]
+    loads = [0.0] * num_workers
+    for market in weighted:
+        worker = loads.index(min(loads))
+        assignment[worker].append(market)
+        loads[worker] += rates.get(market, default_rate)
+    return assignment
+
+
+def worker_config(config: dict, markets: List[Market]) -> dict:
+    """Data collector config restricted to the given markets.
+
+    Args:
+        config (dict): the full data collector config
+        markets (List[Market]): markets assigned to the worker
+
+    Returns:
+        dict: config with the subscriptions, pairs and event types of the assigned markets only
+    """
+    config = copy.deepcopy(config)
+    assigned = set(markets)
+    subscriptions = {}
+    for exchange, event_types in subscriptions_from_config(config).items():
+        for event_type, pairs in event_types.items():
+            pairs = [pair for pair in pairs if (exchange, pair) in assigned]
+            if pairs:
+                subscriptions.setdefault(exchange, {})[event_type] = pairs
+    config["subscriptions"] = subscriptions
+    config["pairs"] = {exchange: list(dict.fromkeys(m for pairs in event_types.values() for m in pairs))
+                       for exchange, event_types in subscriptions.items()}
+    config["event_types"] = {exchange: list(event_types) for exchange, event_types in subscriptions.items()}
+    return config
+
+
+def run_worker(worker_id: int, config: dict, writer_config: dict, report_queue, report_interval: float):
+    """Entry point of a worker process. Collects the configured markets until it is terminated.
+
+    Args:
+        worker_id (int): index of the worker, used with the node id to keep the written file names apart
+        config (dict): data collector config of the worker
+        writer_config (dict): writer config
+        report_queue (multiprocessing.Queue): queue the message counts are reported to
+        report_interval (float): seconds between two reports
+    """
+    # the forked worker inherits the supervisor's handlers, start_worker blocked the signals until they are replaced
+    for signum in WORKER_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, WORKER_SIGNALS)
+    live_config = config.get("live_store")
+    if live_config and live_config.get("port"):
+        # every worker serves the rolling store of its own markets on its own port
+        config = dict(config, live_store=dict(live_config, port=live_config["port"] + worker_id))
+    feed_config = config.get("feed")
+    if feed_config and feed_config.get("path"):
+        # and publishes its events on its own socket
+        config = dict(config, feed=dict(feed_config, path=f"{feed_config['path']}.w{worker_id}"))
+    exchanges = [create_exchange(name) for name in config["pairs"].keys()]
+    node_id = config.get("node_id")
+    writer_id = f"{node_id}-w{worker_id}" if node_id else f"w{worker_id}"
+    writer = create_writer(writer_config, writer_id=writer_id)
+    data_collector = DataCollector(exchanges, writer, config=config)
+    signal.signal(signal.SIGINT, data_collector.graceful_shutdown)
+    signal.signal(signal.SIGTERM, data_collector.graceful_shutdown)
+
+    def report():
+        while True:
+            time.sleep(report_interval)
+            report_queue.put((worker_id, dict(data_collector.pop_message_counts()), report_interval))
+
+    threading.Thread(target=report, daemon=True).start()
+    data_collector.fetch_forever()
+
+
+class Supervisor:
+    """
+    Runs the data collection in several worker processes, each with its own sockets and writer.
+
+    The configured pairs are split over the workers, crashed workers are restarted with
+    the same markets, and the markets are redistributed by observed message rate when
+    the load of the busiest worker exceeds the average by the imbalance threshold.
+    """
+
+    def __init__(self, config: dict, writer_config: dict, workers: int,
+                 rebalance_interval: float = 600, imbalance_threshold: float = 1.5,
+                 report_interval: float = 30, restart_delay: float = 5):
+        """
+        Args:
+            config (dict): data collector config, its pairs are expected to be normalized to the market
+                names of the collected data (see normalize_config) as the message rates are keyed by those
+            writer_config (dict): writer config
+            workers (int): number of worker processes
+            rebalance_interval (float, optional): seconds between two load checks. Defaults to 600.
+            imbalance_threshold (float, optional): ratio of the busiest worker's load to the average
+                load above which markets are redistributed. Defaults to 1.5.
+            report_interval (float, optional): seconds between two message count reports of a worker. Defaults to 30.
+            restart_delay (float, optional): seconds to wait before restarting a crashed worker. Defaults to 5.
+        """
+        self.config = config
+        self.writer_config = writer_config
+        self.num_workers = workers
+        self.rebalance_interval = rebalance_interval
+        self.imbalance_threshold = imbalance_threshold
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+
+        self.markets = list(dict.fromkeys(
+            (exchange, pair) for exchange, pairs in config["pairs"].items() for pair in pairs
+        ))
+        self.assignment = split_markets(self.markets, self.num_workers)
+        # observed messages per second per market, exponentially weighted
+        self.rates: Dict[Market, float] = {}
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.report_queue = multiprocessing.Queue()
+        self._last_rebalance = time.monotonic()
+
+    def start_worker(self, worker_id: int) -> None:
+        markets = self.assignment[worker_id]
+        if not markets:
+            return
+        process = multiprocessing.Process(
+            target=run_worker,
+            args=(worker_id, worker_config(self.config, markets), self.writer_config,
+                  self.report_queue, self.report_interval),
+            name=f"data-collector-w{worker_id}",
+        )
+        signal.pthread_sigmask(signal.SIG_BLOCK, WORKER_SIGNALS)
+        try:
+            process.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, WORKER_SIGNALS)
+        self.processes[worker_id] = process
+        logger.info(f"Started worker {worker_id} (pid {process.pid}) for markets {markets}")
+
+    def stop_workers(self, worker_ids: List[int], timeout: float = 60) -> None:
+        self._stop_processes({i: self.processes.pop(i) for i in worker_ids if i in self.processes}, timeout)
+
+    def _stop_processes(self, processes: Dict[int, multiprocessing.Process], timeout: float = 60) -> None:
+        # SIGTERM lets the workers flush their buffers through graceful_shutdown
+        for process in processes.values():
+            process.terminate()
+        deadline = time.monotonic() + timeout
+        for worker_id, process in processes.items():
+            process.join(max(deadline - time.monotonic(), 0))
+            if process.is_alive():
+                logger.warning(f"Worker {worker_id} did not stop in {timeout} seconds, killing it.")
+                process.kill()
+                process.join()
+
+    def start(self) -> None:
+        for worker_id in range(self.num_workers):
+            self.start_worker(worker_id)
+
+    def shutdown(self, signum=None, frame=None):
+        logger.info("Received shutdown signal. Stopping workers...")
+        self.stop_workers(list(self.processes))
+        sys.exit(0)
+
+    def collect_reports(self, alpha: float = 0.3) -> None:
+        """Drains the worker reports and updates the message rate per market."""
+        while True:
+            try:
+                _, counts, interval = self.report_queue.get_nowait()
+            except queue.Empty:
+                return
+            for market, count in counts.items():
+                rate = count / interval
+                previous = self.rates.get(market)
+                self.rates[market] = rate if previous is None else alpha * rate + (1 - alpha) * previous
+
+    def restart_dead_workers(self) -> None:
+        for worker_id, process in list(self.processes.items()):
+            if not process.is_alive():
+                logger.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting it.")
+                self.processes.pop(worker_id)
+                time.sleep(self.restart_delay)
+                self.start_worker(worker_id)
+
+    def worker_loads(self, assignment: List[List[Market]] = None) -> List[float]:
+        assignment = self.assignment if assignment is None else assignment
+        return [sum(self.rates.get(market, 0.0) for market in markets) for markets in assignment]
+
+    def is_imbalanced(self, assignment: List[List[Market]] = None) -> bool:
+        assignment = self.assignment if assignment is None else assignment
+        loads = [load for load, markets in zip(self.worker_loads(assignment), assignment) if markets]
+        if not loads or sum(loads) == 0:
+            return False
+        return max(loads) > self.imbalance_threshold * sum(loads) / len(loads)
+
+    def plan_rebalance(self) -> List[List[Market]]:
+        """Moves markets from the busiest to the lightest worker, one at a time, until the load is
+        under the imbalance threshold or no single move lowers the busiest worker's load.
+
+        Returns:
+            List[List[Market]]: the new assignment, workers without moved markets keep theirs unchanged
+        """
+        assignment = [list(markets) for markets in self.assignment]
+        while self.is_imbalanced(assignment):
+            loads = self.worker_loads(assignment)
+            source = loads.index(max(loads))
+            target = loads.index(min(loads))
+            # the market after whose move the busier of the two workers is the least busy
+            candidates = [(max(loads[source] - self.rates.get(m, 0.0), loads[target] + self.rates.get(m, 0.0)), m)
+                          for m in assignment[source]]
+            peak, market = min(candidates, default=(loads[source], None))
+            if market is None or peak >= loads[source]:
+                break
+            assignment[source].remove(market)
+            assignment[target].append(market)
+        return assignment
+
+    def rebalance(self) -> None:
+        """Moves markets off the busiest workers and restarts only the workers whose markets changed.
+
+        The replacement of a worker is started before the old process is stopped, so a moved market
+        is collected twice for the time it takes to stop the old process rather than not at all.
+        """
+        assignment = self.plan_rebalance()
+        changed = [i for i in range(self.num_workers) if set(assignment[i]) != set(self.assignment[i])]
+        if not changed:
+            return
+        logger.info(f"Rebalancing workers {changed}, loads before: {self.worker_loads()}, "
+                    f"after: {self.worker_loads(assignment)}")
+        old = {i: self.processes.pop(i) for i in changed if i in self.processes}
+        self.assignment = assignment
+        for worker_id in changed:
+            self.start_worker(worker_id)
+        self._stop_processes(old)
+
+    def run_forever(self, check_interval: float = 1) -> None:
+        self.start()
+        while True:
+            time.sleep(check_interval)
+            self.collect_reports()
+            self.restart_dead_workers()
+            if time.monotonic() - self._last_rebalance >= self.rebalance_interval:
+                self._last_rebalance = time.monotonic()
+                if self.is_imbalanced():
+                    self.rebalance()
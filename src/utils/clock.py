@@ -0,0 +1,46 @@
+import time
+from datetime import datetime, timezone
+
+# The wall clock is read once at import and every later timestamp is derived from the
+# monotonic clock. Reading the monotonic counter is a single int and cannot jump backwards
+# when NTP adjusts the system time, which keeps receive timestamps cheap and ordered.
+_WALL_ANCHOR_NS = time.time_ns()
+_MONOTONIC_ANCHOR_NS = time.monotonic_ns()
+
+NS_PER_MS = 1_000_000
+
+
+def now_ns() -> int:
+    """Current UTC time as integer nanoseconds since the epoch.
+
+    Returns:
+        int: nanoseconds since 1970-01-01T00:00:00Z
+    """
+    return _WALL_ANCHOR_NS + (time.monotonic_ns() - _MONOTONIC_ANCHOR_NS)
+
+
+def ms_to_ns(timestamp_ms) -> int:
+    """Converts an exchange timestamp in milliseconds to nanoseconds.
+
+    Args:
+        timestamp_ms (int | float | str): epoch milliseconds as sent by the exchange
+
+    Returns:
+        int: epoch nanoseconds
+    """
+    if isinstance(timestamp_ms, int):
+        # avoid the float round trip, epoch nanoseconds do not fit in a double exactly
+        return timestamp_ms * NS_PER_MS
+    return int(float(timestamp_ms) * NS_PER_MS)
+
+
+def ns_to_datetime(timestamp_ns: int) -> datetime:
+    """Converts epoch nanoseconds to a timezone aware UTC datetime (microsecond precision).
+
+    Args:
+        timestamp_ns (int): epoch nanoseconds
+
+    Returns:
+        datetime: UTC datetime
+    """
+    return datetime.fromtimestamp(timestamp_ns / 1e9, tz=timezone.utc)
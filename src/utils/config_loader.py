@@ -1,5 +1,7 @@
 from dotenv import load_dotenv
+import copy
 import os
+import threading
 import yaml
 
 load_dotenv()
@@ -7,10 +9,42 @@ load_dotenv()
 APP_ENV = os.environ.get('APP_ENV', 'development').lower()
 PROJECT_ROOT = os.environ.get('PROJECT_ROOT', os.getcwd())
 
+# parsed configs keyed by (env, name), filled on first load
+_config_cache = {}
+_config_cache_lock = threading.Lock()
+
 def load_config_by_name(name):
-    config_path = f"{PROJECT_ROOT}/src/config/{APP_ENV}/{name.lower()}.yaml"
-    
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)
+    """Loads a config of the current environment. The file is parsed once and cached,
+    every call returns its own copy so that callers can modify it.
+
+    Args:
+        name (str): config name, such as "bitvavo"
+
+    Returns:
+        dict: the parsed config
+    """
+    key = (APP_ENV, name.lower())
+    with _config_cache_lock:
+        config = _config_cache.get(key)
+    if config is None:
+        config_path = f"{PROJECT_ROOT}/src/config/{APP_ENV}/{name.lower()}.yaml"
+
+        with open(config_path, "r") as f:
+            config = yaml.safe_load(f)
+
+        with _config_cache_lock:
+            _config_cache[key] = config
+
+    return copy.deepcopy(config)
+
+def invalidate_config(name=None):
+    """Drops a cached config, or all of them, so that the next load reads the file again.
 
-    return config
\ No newline at end of file
+    Args:
+        name (str, optional): config name, all configs if None.
+    """
+    with _config_cache_lock:
+        if name is None:
+            _config_cache.clear()
+        else:
+            _config_cache.pop((APP_ENV, name.lower()), None)
@@ -0,0 +1,46 @@
+from collections import deque
+from typing import Hashable
+
+
+class RecentIdIndex:
+    """
+    Exact set of the most recently seen ids with a fixed capacity.
+
+    A ring buffer keeps the insertion order and a hash set answers membership, so adding an id
+    is O(1) and memory is bounded by the capacity. Once full, the oldest id is forgotten, which is
+    fine for duplicates from reconnects and backfills as they repeat ids from the recent past.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        """
+        Args:
+            capacity (int, optional): number of ids remembered. Defaults to 10000.
+        """
+        if capacity <= 0:
+            raise ValueError("The capacity of the id index must be positive.")
+        self.capacity = capacity
+        self._order = deque()
+        self._ids = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, id_: Hashable) -> bool:
+        return id_ in self._ids
+
+    def add(self, id_: Hashable) -> bool:
+        """Remembers the id.
+
+        Args:
+            id_ (Hashable): trade id
+
+        Returns:
+            bool: False if the id was already seen, True if it is new
+        """
+        if id_ in self._ids:
+            return False
+        if len(self._order) == self.capacity:
+            self._ids.discard(self._order.popleft())
+        self._order.append(id_)
+        self._ids.add(id_)
+        return True
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import queue
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.utils.clock import now_ns
+from src.utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    A consumer of an EventBus with its filter and metrics.
+
+    lag is the time from publishing an event to the consumer starting on it, duration the time the
+    consumer took. A threaded consumer whose queue is full misses events, counted in dropped.
+    """
+
+    def __init__(self, consumer: Callable[[dict], None], name: str, exchanges: Optional[Iterable[str]],
+                 markets: Optional[Iterable[str]], event_types: Optional[Iterable[str]]):
+        self.consumer = consumer
+        self.name = name
+        self.exchanges = set(exchanges) if exchanges else None
+        self.markets = set(markets) if markets else None
+        self.event_types = set(event_types) if event_types else None
+        self.lag = LatencyHistogram()
+        self.duration = LatencyHistogram()
+        self.dropped = 0
+        self.errors = 0
+
+    def matches(self, event: dict) -> bool:
+        return (self.event_types is None or event.get("event") in self.event_types) \
+            and (self.exchanges is None or event.get("exchange") in self.exchanges) \
+            and (self.markets is None or event.get("market") in self.markets)
+
+    def deliver(self, event: dict, published_ns: int):
+        """Hands an event to the consumer, on the publishing thread unless the subscription has its own."""
+        self._handle(event, published_ns)
+
+    def _handle(self, event: dict, published_ns: int):
+        start = now_ns()
+        self.lag.record(start - published_ns)
+        try:
+            self.consumer(event)
+        except Exception as e:
+            # a failing consumer must not stop the collection or the other consumers
+            self.errors += 1
+            logger.error(f"Consumer {self.name} failed on a {event.get('event')} event: {e}")
+        self.duration.record(now_ns() - start)
+
+    def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"handled": self.duration.count, "dropped": self.dropped, "errors": self.errors,
+                "lag": self.lag.summary(), "duration": self.duration.summary()}
+
+
+class ThreadedSubscription(Subscription):
+    """A consumer running on its own thread, fed through a bounded queue."""
+
+    def __init__(self, *args, max_queue: int = 100000):
+        super().__init__(*args)
+        self.queue = queue.Queue(max_queue)
+        self.thread = threading.Thread(target=self._run, name=f"bus-{self.name}", daemon=True)
+        self.thread.start()
+
+    def deliver(self, event: dict, published_ns: int):
+        try:
+            self.queue.put_nowait((event, published_ns))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self._handle(*item)
+
+    def close(self):
+        try:
+            self.queue.put(None, timeout=5)
+        except queue.Full:
+            return
+        self.thread.join(5)
+
+    def stats(self) -> dict:
+        return dict(super().stats(), queued=self.queue.qsize())
+
+
+class LoopSubscription(Subscription):
+    """A consumer running as a callback or coroutine on an asyncio event loop."""
+
+    def __init__(self, *args, loop: asyncio.AbstractEventLoop):
+        super().__init__(*args)
+        self.loop = loop
+        self.coroutine = asyncio.iscoroutinefunction(self.consumer)
+
+    def deliver(self, event: dict, published_ns: int):
+        if self.loop.is_closed():
+            self.dropped += 1
+            return
+        if self.coroutine:
+            asyncio.run_coroutine_threadsafe(self._handle_async(event, published_ns), self.loop)
+        else:
+            self.loop.call_soon_threadsafe(self._handle, event, published_ns)
+
+    async def _handle_async(self, event: dict, published_ns: int):
+        start = now_ns()
+        self.lag.record(start - published_ns)
+        try:
+            await self.consumer(event)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Consumer {self.name} failed on a {event.get('event')} event: {e}")
+        self.duration.record(now_ns() - start)
+
+
+class EventBus:
+    """
+    Dispatches the normalized events of the websocket handlers to the consumers registered with
+    subscribe. Every matching consumer gets the same event object, events are never copied, so a
+    consumer must not modify them.
+
+    A consumer runs on the handler's receiving thread by default and delays the next message of
+    that socket by its duration. threaded consumers get their own thread and a bounded queue, and
+    consumers given an event loop run on that loop. Neither blocks the receiving thread.
+
+    Besides the metrics of every subscription, the bus records the handler overhead per event type:
+    the time from receiving a message, its fetch_time, to publishing the normalized event.
+    """
+
+    def __init__(self):
+        self.subscriptions: List[Subscription] = []
+        self.handler_overhead: Dict[str, LatencyHistogram] = defaultdict(LatencyHistogram)
+        self.lock = threading.Lock()
+
+    def subscribe(self, consumer: Callable[[dict], None], name: str = None, exchanges: Iterable[str] = None,
+                  markets: Iterable[str] = None, event_types: Iterable[str] = None, threaded: bool = False,
+                  max_queue: int = 100000, loop: asyncio.AbstractEventLoop = None) -> Subscription:
+        """
+        Registers a consumer.
+
+        Args:
+            consumer (Callable[[dict], None]): called with every matching event, a coroutine function
+                if a loop is given
+            name (str, optional): name in the stats. Defaults to the consumer's qualified name.
+            exchanges (Iterable[str], optional): exchanges to receive. Defaults to all.
+            markets (Iterable[str], optional): markets to receive. Defaults to all.
+            event_types (Iterable[str], optional): event types to receive. Defaults to all.
+            threaded (bool, optional): whether the consumer runs on its own thread. Defaults to False.
+            max_queue (int, optional): events queued for a threaded consumer before events are dropped.
+                Defaults to 100000.
+            loop (asyncio.AbstractEventLoop, optional): event loop the consumer runs on. Defaults to None.
+
+        Returns:
+            Subscription: pass to unsubscribe to remove the consumer
+        """
+        name = name or getattr(consumer, "__qualname__", repr(consumer))
+        args = (consumer, name, exchanges, markets, event_types)
+        if loop is not None:
+            subscription = LoopSubscription(*args, loop=loop)
+        elif threaded:
+            subscription = ThreadedSubscription(*args, max_queue=max_queue)
+        else:
+            subscription = Subscription(*args)
+        with self.lock:
+            # replaced rather than appended to, publish iterates without the lock
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+        subscription.close()
+
+    def publish(self, event: dict):
+        """
+        Dispatches an event to the matching consumers.
+
+        Args:
+            event (dict): normalized event with event, exchange, market and fetch_time keys
+        """
+        published_ns = now_ns()
+        fetch_time = event.get("fetch_time")
+        if fetch_time is not None:
+            self.handler_overhead[event.get("event")].record(published_ns - fetch_time)
+        for subscription in self.subscriptions:
+            if subscription.matches(event):
+                subscription.deliver(event, published_ns)
+
+    def stats(self) -> dict:
+        """Handler overhead per event type and the metrics of every consumer."""
+        return {"handler_overhead": {event_type: histogram.summary()
+                                     for event_type, histogram in self.handler_overhead.items()},
+                "consumers": {s.name: s.stats() for s in self.subscriptions}}
+
+    def close(self):
+        """Stops the threads of the threaded consumers."""
+        for subscription in self.subscriptions:
+            subscription.close()
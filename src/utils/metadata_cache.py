@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    """
+    On-disk cache of slowly changing exchange metadata such as markets and assets.
+
+    A cached copy is served even when it is older than the TTL, in which case it is refreshed
+    in a background thread, so constructing an exchange only reads a local file. The network is
+    only waited for when there is no cached copy at all. A failed refresh keeps the cached copy.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], dict], directory: str, ttl: float = 86400,
+                 on_refresh: Callable[[dict], None] = None):
+        """
+        Args:
+            name (str): cache entry name, such as the exchange name
+            fetch (Callable[[], dict]): requests the metadata from the exchange
+            directory (str): directory the cache file is kept in
+            ttl (float, optional): seconds after which the cached metadata is refreshed. Defaults to 86400.
+            on_refresh (Callable[[dict], None], optional): called with the metadata of a background refresh.
+        """
+        self.name = name
+        self.fetch = fetch
+        self.path = os.path.join(directory, f"{name}.json")
+        self.ttl = ttl
+        self.on_refresh = on_refresh
+        self._refreshing = threading.Lock()
+
+    def _read(self) -> Optional[dict]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+            return None
+
+    def _write(self, data: dict) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # write to a temporary file first so that a concurrent reader never sees a partial file
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": time.time(), "data": data}, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self) -> dict:
+        """Cached metadata, fetched synchronously only if nothing is cached yet.
+
+        Returns:
+            dict: the metadata as returned by fetch
+        """
+        cached = self._read()
+        if cached is None:
+            return self.refresh()
+        if time.time() - cached["fetched_at"] > self.ttl:
+            self.refresh_in_background()
+        return cached["data"]
+
+    def refresh(self) -> dict:
+        data = self.fetch()
+        self._write(data)
+        return data
+
+    def refresh_in_background(self) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self) -> None:
+        try:
+            data = self.refresh()
+            if self.on_refresh is not None:
+                self.on_refresh(data)
+        except Exception as e:
+            logger.warning(f"Could not refresh the {self.name} metadata, keeping the cached copy: {e}")
+        finally:
+            self._refreshing.release()
@@ -0,0 +1,96 @@
+import threading
+from typing import Dict, Optional
+
+
+class LatencyHistogram:
+    """
+    Log2 bucketed latency histogram.
+
+    Bucket 0 holds latencies below one microsecond and bucket i holds latencies in
+    [2^(i-1), 2^i) microseconds, so 32 buckets cover everything up to ~35 minutes.
+    Recording is O(1) and allocation free, which keeps it cheap enough for the receive path.
+    Negative latencies (exchange clock ahead of ours) are counted separately.
+    """
+
+    def __init__(self, num_buckets: int = 32):
+        self.num_buckets = num_buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.buckets = [0] * self.num_buckets
+        self.count = 0
+        self.negative = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_ns = None
+
+    def record(self, latency_ns: int) -> None:
+        """Adds a latency sample.
+
+        Args:
+            latency_ns (int): latency in nanoseconds
+        """
+        with self.lock:
+            if latency_ns < 0:
+                self.negative += 1
+                return
+            index = min((latency_ns // 1000).bit_length(), self.num_buckets - 1)
+            self.buckets[index] += 1
+            self.count += 1
+            self.total_ns += latency_ns
+            if self.min_ns is None or latency_ns < self.min_ns:
+                self.min_ns = latency_ns
+            if self.max_ns is None or latency_ns > self.max_ns:
+                self.max_ns = latency_ns
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Adds the samples of another histogram with the same bucket layout."""
+        with self.lock, other.lock:
+            for i, value in enumerate(other.buckets):
+                self.buckets[i] += value
+            self.count += other.count
+            self.negative += other.negative
+            self.total_ns += other.total_ns
+            if other.min_ns is not None:
+                self.min_ns = other.min_ns if self.min_ns is None else min(self.min_ns, other.min_ns)
+            if other.max_ns is not None:
+                self.max_ns = other.max_ns if self.max_ns is None else max(self.max_ns, other.max_ns)
+
+    def percentile(self, q: float) -> Optional[int]:
+        """Upper bound (in nanoseconds) of the bucket holding the q-th percentile.
+
+        Args:
+            q (float): percentile between 0 and 100
+
+        Returns:
+            int: latency upper bound in nanoseconds or None if there are no samples
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            rank = q / 100 * self.count
+            cumulative = 0
+            for i, value in enumerate(self.buckets):
+                cumulative += value
+                if cumulative >= rank and value:
+                    return min((1 << i) * 1000, self.max_ns)
+            return self.max_ns
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Summary statistics in milliseconds.
+
+        Returns:
+            dict: count, negative, mean, min, max, p50, p90 and p99
+        """
+        to_ms = lambda x: None if x is None else x / 1e6
+        summary = {
+            "count": self.count,
+            "negative": self.negative,
+            "mean_ms": to_ms(self.total_ns / self.count) if self.count else None,
+            "min_ms": to_ms(self.min_ns),
+            "max_ms": to_ms(self.max_ns),
+        }
+        for q in (50, 90, 99):
+            summary[f"p{q}_ms"] = to_ms(self.percentile(q))
+        return summary
@@ -0,0 +1,175 @@
+import bisect
+import copy
+import hashlib
+import os
+from typing import Callable, Dict, List, Tuple
+
+def _hash(key: str) -> int:
+    # a stable hash, python's hash() is salted per process
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring over the collector nodes.
+
+    Each node is placed on the ring at several virtual points, and a key belongs to the first
+    node clockwise of its hash. Adding or removing a node only moves the keys between that
+    node's points and their predecessors, i.e. about 1/N of the keys.
+    """
+
+    def __init__(self, members: List[str], virtual_nodes: int = 128):
+        """
+        Args:
+            members (List[str]): node ids of the fleet
+            virtual_nodes (int, optional): points per node on the ring. Defaults to 128.
+        """
+        if not members:
+            raise ValueError("A hash ring needs at least one member.")
+        self.members = list(members)
+        points = sorted(
+            (_hash(f"{member}#{i}"), member) for member in self.members for i in range(virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [member for _, member in points]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+def subscription_key(exchange: str, market: str, event_type: str) -> str:
+    """Ring key of an (exchange, market, event type) subscription"""
+    return f"{exchange.lower()}/{market.upper()}/{event_type.lower()}"
+
+
+def shard_subscriptions(subscriptions: Dict[str, Dict[str, List[str]]], node_id: str,
+                        members: List[str], virtual_nodes: int = 128) -> Dict[str, Dict[str, List[str]]]:
+    """Keeps the subscriptions that belong to the node.
+
+    Args:
+        subscriptions (Dict[str, Dict[str, List[str]]]): exchange -> event type -> markets
+        node_id (str): id of this node, one of members
+        members (List[str]): node ids of the fleet
+        virtual_nodes (int, optional): points per node on the ring. Defaults to 128.
+
+    Returns:
+        Dict[str, Dict[str, List[str]]]: the node's subset, exchanges and event types without markets are dropped
+    """
+    if node_id not in members:
+        raise ValueError(f"Node {node_id} is not a member of {members}.")
+    ring = HashRing(members, virtual_nodes)
+    sharded = {}
+    for exchange, event_types in subscriptions.items():
+        for event_type, markets in event_types.items():
+            mine = [m for m in markets if ring.node_for(subscription_key(exchange, m, event_type)) == node_id]
+            if mine:
+                sharded.setdefault(exchange, {})[event_type] = mine
+    return sharded
+
+
+def node_from_config(config: dict, overrides: dict = None) -> Tuple[str, List[str]]:
+    """Resolves this node's id and the fleet members.
+
+    The node is identified either by a member list and a node id, or by a node index and count,
+    in which case the members are named node0 ... node{count - 1}. Every setting is resolved from
+    the overrides (command line arguments), then the NODE_ID, NODE_MEMBERS (comma separated),
+    NODE_INDEX and NODE_COUNT environment variables, then the config.
+
+    Args:
+        config (dict): the sharding section of the data collector config
+        overrides (dict, optional): node_id, members, node_index or node_count that take precedence,
+            None values are ignored.
+
+    Returns:
+        Tuple[str, List[str]]: node id and members, or (None, None) if sharding is not configured
+    """
+    overrides = {k: v for k, v in (overrides or {}).items() if v is not None}
+
+    def setting(key: str, env: str):
+        if key in overrides:
+            return overrides[key]
+        return os.environ.get(env, config.get(key))
+
+    # an index or count given explicitly selects the index based identification
+    by_index = "node_index" in overrides or "node_count" in overrides
+    node_id = setting("node_id", "NODE_ID")
+    members = setting("members", "NODE_MEMBERS")
+    if isinstance(members, str):
+        members = [m.strip() for m in members.split(",") if m.strip()]
+    if not by_index and node_id is not None and members:
+        return str(node_id), [str(m) for m in members]
+
+    node_index = setting("node_index", "NODE_INDEX")
+    node_count = setting("node_count", "NODE_COUNT")
+    if node_index is None or node_count is None or int(node_count) <= 1:
+        return None, None
+    if not 0 <= int(node_index) < int(node_count):
+        raise ValueError(f"Node index {node_index} is out of range for {node_count} nodes.")
+    return f"node{int(node_index)}", [f"node{i}" for i in range(int(node_count))]
+
+
+def subscriptions_from_config(config: dict) -> Dict[str, Dict[str, List[str]]]:
+    """Subscriptions of a data collector config as exchange -> event type -> markets.
+
+    A sharded config carries its subscriptions explicitly, otherwise every configured
+    event type is subscribed for every pair of the exchange. Duplicated pairs are dropped.
+
+    Args:
+        config (dict): data collector config
+
+    Returns:
+        Dict[str, Dict[str, List[str]]]: exchange -> event type -> markets
+    """
+    if config.get("subscriptions") is not None:
+        return {exchange: {event_type: list(dict.fromkeys(markets)) for event_type, markets in event_types.items()}
+                for exchange, event_types in config["subscriptions"].items()}
+    return {exchange: {event_type: list(dict.fromkeys(pairs)) for event_type in config["event_types"][exchange]}
+            for exchange, pairs in config["pairs"].items()}
+
+
+def normalize_config(config: dict, market_name: Callable[[str, str], str]) -> dict:
+    """Rewrites the pairs of a data collector config to the market names of the collected data.
+
+    Spellings of the same market such as BTC_EUR and BTC-EUR become one market, so that it is
+    collected once and its message rate is attributed to it.
+
+    Args:
+        config (dict): data collector config
+        market_name (Callable[[str, str], str]): (exchange, pair) -> market name, such as "BTC-EUR"
+
+    Returns:
+        dict: config with normalized, de-duplicated subscriptions and pairs
+    """
+    config = copy.deepcopy(config)
+    subscriptions = {
+        exchange: {event_type: list(dict.fromkeys(market_name(exchange, pair) for pair in pairs))
+                   for event_type, pairs in event_types.items()}
+        for exchange, event_types in subscriptions_from_config(config).items()
+    }
+    config["subscriptions"] = subscriptions
+    config["pairs"] = {exchange: list(dict.fromkeys(m for markets in event_types.values() for m in markets))
+                       for exchange, event_types in subscriptions.items()}
+    return config
+
+
+def shard_config(config: dict, node_id: str, members: List[str], virtual_nodes: int = 128) -> dict:
+    """Restricts a data collector config to the subscriptions of the node.
+
+    Args:
+        config (dict): data collector config
+        node_id (str): id of this node
+        members (List[str]): node ids of the fleet
+        virtual_nodes (int, optional): points per node on the ring. Defaults to 128.
+
+    Returns:
+        dict: config with the node's subscriptions, pairs and event types, and its node_id
+    """
+    config = copy.deepcopy(config)
+    subscriptions = shard_subscriptions(subscriptions_from_config(config), node_id, members, virtual_nodes)
+    config["subscriptions"] = subscriptions
+    config["pairs"] = {exchange: list(dict.fromkeys(m for markets in event_types.values() for m in markets))
+                       for exchange, event_types in subscriptions.items()}
+    config["event_types"] = {exchange: list(event_types) for exchange, event_types in subscriptions.items()}
+    config["node_id"] = node_id
+    return config
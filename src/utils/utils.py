@@ -1,41 +1,62 @@
+import numpy as np
 import pandas as pd
 import os
 from math import isclose, inf, floor
 from time import time
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import sys
 from datetime import datetime
 import traceback
+from itertools import chain
 
 
 
+def parse_levels(levels) -> np.ndarray:
+    """(n, 2) array of the [price, size] levels of a book side, given as strings or numbers."""
+    if not levels:
+        return np.zeros((0, 2))
+    # cheaper than np.asarray for lists of string pairs
+    return np.fromiter(chain.from_iterable(levels), float, 2 * len(levels)).reshape(-1, 2)
+
+
+def walk_book(levels, amount: float, quote: bool = False) -> Tuple[float, float]:
+    """Fills an amount against the levels of one side of a book, best first.
+
+    Args:
+        levels: [price, size] levels, such as the bids or asks of an orderbook event or a (n, 2) array
+        amount (float): base amount to fill, or the quote amount to spend if quote is set
+        quote (bool, optional): whether amount is in the quote asset. Defaults to False.
+
+    Returns:
+        Tuple[float, float]: the other asset's amount of the fill before commission and the filled
+            part of amount, less than amount if the book is too shallow
+    """
+    book = np.asarray(levels, dtype=float).reshape(-1, 2)
+    prices, sizes = book[:, 0], book[:, 1]
+    if quote:
+        sizes = prices * sizes
+    cumulative = sizes.cumsum()
+    if amount <= 0 or not len(cumulative):
+        return 0.0, 0.0
+    # the levels the amount takes, the last one partially unless the book is too shallow
+    used = int(cumulative.searchsorted(amount)) + 1
+    fills = sizes[:used].copy()
+    if used <= len(cumulative):
+        fills[-1] -= cumulative[used - 1] - amount
+    other = (fills / prices[:used]).sum() if quote else fills @ prices[:used]
+    return float(other), float(fills.sum())
+
+
 def _get_market_value(target_query, orders, cost=0.001, type="buy", abs_tol=1e-5):
-    query_is_zero = isclose(target_query, 0., abs_tol=abs_tol)
-    num_orders = len(orders)
-    if query_is_zero:
+    if isclose(target_query, 0., abs_tol=abs_tol):
         return 0
-    else:
-        # orders are consumed but query is not fully obtained
-        if num_orders == 0:
-            return -1 * inf
-        else:
-            if type == "buy":
-                fee_coef = (1 + cost)
-            else:
-                fee_coef = ( 1 - cost)
-            
-            assert len(orders) >= 1
-            p, q = map(float, orders[0])
-
-            if target_query >= q:
-                value = q * p * fee_coef
-                target_query -= q
-                return value + _get_market_value(target_query, orders[1:], cost, type)
-            else:
-                # query is smaller
-                value = target_query * p * fee_coef
-                target_query = 0
-                return value + _get_market_value(target_query, orders[1:], cost, type)
+    value, filled = walk_book(orders, target_query)
+    # orders are consumed but query is not fully obtained
+    if not isclose(target_query - filled, 0., abs_tol=abs_tol):
+        return -1 * inf
+    fee_coef = (1 + cost) if type == "buy" else (1 - cost)
+    return value * fee_coef
+
 
 def create_error_message(exception:Exception):
     error_msg = "Time: " + get_current_time() +  f"Exception: {str(exception.__class__)} \n"
@@ -68,69 +89,24 @@ def get_saving_dir(root_saving_dir):
 
 
 def _get_amount(amountQuote, orders, cost=0.001, type="buy", abs_tol=1e-10):
-    # 5000lik btc satmak istiyorum kac btc satmaliyim
-    # btc alicilarina git
-    # ilk adam diyelim ki 10 btc almak istiyor x pricestan : q:10, p:x
-    # value = 10x
-    # adama 5000 olana kadar tum btclerimi satacagim
-    # my btc amount = y
-    # y = 5000 * (1 - cost) / p
-    
-    # diyelim adamda daha az btc var
-    # adamin tum btclerini al maaliyeti hesapla
-    # maaliyet = p * q ( 1 + cost)
-    quote_is_zero = isclose(amountQuote, 0., abs_tol=abs_tol)
-    num_orders = len(orders)
-    if quote_is_zero:
+    # base amount bought for amountQuote including the commission, levels are taken whole while
+    # amountQuote covers their cost, the rest buys amountQuote * (1 - cost) / p at the next level
+    if isclose(amountQuote, 0., abs_tol=abs_tol):
         return 0
-    else:
-        if num_orders == 0:
-            return -1 * inf
-        else:
-                
-            p, q = map(float, orders[0])
-            
-            value = q * p
-            if amountQuote <= value * ( 1 + cost):
-                amount = amountQuote * (1 - cost) / p
-                amountQuote = 0
-                return amount + _get_amount(amountQuote, orders[1:], cost, type)
-            
-            else:
-                amountQuote -= value * (1 + cost)
-                amount = q
-                return amount + _get_amount(amountQuote, orders[1:], cost, type)
-            
-            
-                
+    book = np.asarray(orders, dtype=float).reshape(-1, 2)
+    prices, sizes = book[:, 0], book[:, 1]
+    costs = np.cumsum(prices * sizes * (1 + cost))
+    # first level whose cost is not covered
+    level = int(np.searchsorted(costs, amountQuote, side="left"))
+    if level == len(costs):
+        rest = amountQuote - (costs[-1] if len(costs) else 0)
+        return float(sizes.sum()) if isclose(rest, 0., abs_tol=abs_tol) else -1 * inf
+    rest = amountQuote - (costs[level - 1] if level else 0)
+    return float(sizes[:level].sum() + rest * (1 - cost) / prices[level])
 
-def _get_amountQuote(amount, orders, cost=0.001, type="buy", abs_tol=1e-10):
-        query_is_zero = isclose(amount, 0., abs_tol=abs_tol)
-        num_orders = len(orders)
-        if query_is_zero:
-            return 0
-        else:
-            # orders are consumed but query is not fully obtained
-            if num_orders == 0:
-                return -1 * inf
-            else:
-                if type == "buy":
-                    fee_coef = (1 + cost)
-                else:
-                    fee_coef = ( 1 - cost)
-                
-                assert len(orders) >= 1
-                p, q = map(float, orders[0])
 
-                if amount >= q:
-                    value = q * p * fee_coef
-                    amount -= q
-                    return value + _get_amountQuote(amount, orders[1:], cost, type)
-                else:
-                    # query is smaller
-                    value = amount * p * fee_coef
-                    amount = 0
-                    return value + _get_amountQuote(amount, orders[1:], cost, type)
+def _get_amountQuote(amount, orders, cost=0.001, type="buy", abs_tol=1e-10):
+    return _get_market_value(amount, orders, cost, type, abs_tol)
 
 
 def timer_func(func):
@@ -0,0 +1,133 @@
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from src.exchanges.exchange_interface import ExchangeInterface
+from src.utils.clock import now_ns
+from src.utils.metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 1_000_000_000
+
+# (exchange, market, event type)
+Stream = Tuple[str, str, str]
+
+
+class StreamState:
+    def __init__(self, count: int, checked_at: int, since: int):
+        # messages counted at the previous check
+        self.count = count
+        # time of the previous check in UTC epoch ns
+        self.checked_at = checked_at
+        # silence is measured from here if nothing was received since, e.g. the subscription or the last resubscription
+        self.since = since
+        # learned messages per second, None until the first message
+        self.rate: Optional[float] = None
+
+
+class StallWatchdog:
+    """
+    Detects single streams that went quiet while their socket is still up.
+
+    The expected message rate of every (exchange, market, event type) is learned as an exponentially
+    weighted average over the checks in which messages arrived. A stream stalls when it has been silent
+    for stall_factor expected inter-arrival times, bounded by min_stall_seconds and max_stall_seconds,
+    the latter being the latency budget in which any stall is flagged, also for streams that never sent
+    a message. A stalled stream is handed to its exchange, which resubscribes only that market and
+    records the gap.
+    """
+
+    def __init__(self, exchanges: List[ExchangeInterface], check_interval: float = 5, stall_factor: float = 20,
+                 min_stall_seconds: float = 10, max_stall_seconds: float = 120, alpha: float = 0.2):
+        """
+        Args:
+            exchanges (List[ExchangeInterface]): subscribed exchanges
+            check_interval (float, optional): seconds between two checks. Defaults to 5.
+            stall_factor (float, optional): silent inter-arrival times after which a stream stalls. Defaults to 20.
+            min_stall_seconds (float, optional): lower bound of the silence of a stall. Defaults to 10.
+            max_stall_seconds (float, optional): upper bound of the silence of a stall. Defaults to 120.
+            alpha (float, optional): weight of the latest rate observation. Defaults to 0.2.
+        """
+        self.exchanges = exchanges
+        self.check_interval = int(check_interval * NS_PER_SECOND)
+        self.stall_factor = stall_factor
+        self.min_stall = int(min_stall_seconds * NS_PER_SECOND)
+        self.max_stall = int(max_stall_seconds * NS_PER_SECOND)
+        self.alpha = alpha
+        self.streams: Dict[Stream, StreamState] = {}
+        self._last_check = None
+        # number of stalls per stream and the silence before each stall was detected
+        self.stalls = Counter()
+        self.stall_durations = LatencyHistogram()
+
+    def budget(self, rate: Optional[float]) -> int:
+        """Silence in ns after which a stream with the given rate counts as stalled."""
+        if not rate:
+            return self.max_stall
+        return min(max(int(self.stall_factor / rate * NS_PER_SECOND), self.min_stall), self.max_stall)
+
+    def maybe_check(self, now: int = None) -> List[Stream]:
+        """Checks the streams if check_interval passed since the last check."""
+        now = now_ns() if now is None else now
+        if self._last_check is not None and now - self._last_check < self.check_interval:
+            return []
+        return self.check(now)
+
+    def check(self, now: int = None) -> List[Stream]:
+        """Updates the learned rates and resubscribes the stalled streams.
+
+        Args:
+            now (int, optional): current time in UTC epoch ns. Defaults to now.
+
+        Returns:
+            List[Stream]: the streams that stalled
+        """
+        now = now_ns() if now is None else now
+        self._last_check = now
+        stalled = []
+        for exchange in self.exchanges:
+            if exchange.is_socket_closed():
+                # the socket reconnects and resyncs as a whole
+                continue
+            for event_type, handler in exchange.ws_handlers.items():
+                counts, last_received = handler.stream_stats()
+                for pair in handler.pairs or []:
+                    market = handler.market_name(pair)
+                    stream = (exchange.name, market, event_type)
+                    if self._update(stream, counts.get(market, 0), last_received.get(market), now):
+                        stalled.append(stream)
+                        exchange.on_stream_stall(event_type, pair, self.streams[stream].since, now)
+                        self.streams[stream].since = now
+        return stalled
+
+    def _update(self, stream: Stream, count: int, last_received: Optional[int], now: int) -> bool:
+        state = self.streams.get(stream)
+        if state is None:
+            self.streams[stream] = StreamState(count=count, checked_at=now, since=now)
+            return False
+
+        received = count - state.count
+        elapsed = now - state.checked_at
+        if received > 0 and elapsed > 0:
+            rate = received / elapsed * NS_PER_SECOND
+            state.rate = rate if state.rate is None else self.alpha * rate + (1 - self.alpha) * state.rate
+        state.count, state.checked_at = count, now
+        if last_received is not None:
+            state.since = max(state.since, last_received)
+
+        silence = now - state.since
+        if silence <= self.budget(state.rate):
+            return False
+        self.stalls[stream] += 1
+        self.stall_durations.record(silence)
+        return True
+
+    def summary(self) -> dict:
+        """Stall metrics: number of watched streams, stalls per stream and the silence before detection."""
+        return {
+            "streams": len(self.streams),
+            "stalls": sum(self.stalls.values()),
+            "stalls_per_stream": {"/".join(stream): n for stream, n in self.stalls.items()},
+            "silence": self.stall_durations.summary(),
+        }
@@ -3,10 +3,11 @@ from typing import List
 from src.writer.writer_interface import WriterInterface
 
 class DBAWSWriter(WriterInterface):
-    def __init__(self, buffer_size: int, connection_string: str):
+    def __init__(self, buffer_size: int, connection_string: str, writer_id: str = None):
         self.buffer_size = buffer_size
         self.buffer = []
         self.connection_string = connection_string
+        self.writer_id = writer_id
         # Initialize DB connection here
 
     def append(self, data: List[dict]):
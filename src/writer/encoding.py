@@ -0,0 +1,99 @@
+import logging
+from typing import List, TYPE_CHECKING, Union
+
+from src.utils.config_loader import load_config_by_name
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+
+class EncodingProfile:
+    """
+    Named set of parquet encoding options, configured under encoding_profiles in writer.yaml.
+
+    Attributes:
+        name (str): profile name, such as "fast-ingest"
+        compression (str): codec of all columns, such as "snappy" or "zstd"
+        compression_level (int): codec level, the codec's default if None
+        dictionary_columns (List[str]): columns that are dictionary encoded, all columns if None
+        byte_stream_split (bool): whether float columns, also the values of the price levels,
+            are byte-stream-split encoded, which makes them compress better
+        row_group_size (int): maximum rows per row group, pyarrow's default if None
+        write_statistics (Union[bool, List[str]]): whether min/max statistics are written,
+            or the columns they are written for
+        data_page_size (int): target size of a data page in bytes, pyarrow's default if None
+    """
+
+    def __init__(self, name: str, compression: str = "snappy", compression_level: int = None,
+                 dictionary_columns: List[str] = None, byte_stream_split: bool = False, row_group_size: int = None,
+                 write_statistics: Union[bool, List[str]] = True, data_page_size: int = None):
+        self.name = name
+        self.compression = compression
+        self.compression_level = compression_level
+        self.dictionary_columns = dictionary_columns
+        self.byte_stream_split = byte_stream_split
+        self.row_group_size = row_group_size
+        self.write_statistics = write_statistics
+        self.data_page_size = data_page_size
+
+    def write_options(self, schema: "pa.Schema") -> dict:
+        """
+        Keyword arguments of pyarrow.parquet.write_table for a table of the schema.
+
+        Columns of the profile that are not in the schema are left out, e.g. "side" for tickers.
+
+        Args:
+            schema (pa.Schema): schema of the written table
+
+        Returns:
+            dict: write_table options
+        """
+        names = set(schema.names)
+        options = {"compression": self.compression, "compression_level": self.compression_level,
+                   "row_group_size": self.row_group_size, "data_page_size": self.data_page_size}
+        if self.dictionary_columns is not None:
+            options["use_dictionary"] = [col for col in self.dictionary_columns if col in names]
+        if self.byte_stream_split:
+            options["use_byte_stream_split"] = _float_columns(schema)
+        if isinstance(self.write_statistics, list):
+            options["write_statistics"] = [col for col in self.write_statistics if col in names]
+        else:
+            options["write_statistics"] = self.write_statistics
+        return options
+
+    def __repr__(self):
+        return f"EncodingProfile({self.name!r}, compression={self.compression!r})"
+
+
+def _float_columns(schema: "pa.Schema") -> List[str]:
+    """Parquet column paths of the float values, such as "bids.list.item.list.item" for the price levels."""
+    import pyarrow as pa
+    paths = []
+    for field in schema:
+        path, data_type = field.name, field.type
+        while pa.types.is_list(data_type):
+            path, data_type = f"{path}.list.item", data_type.value_type
+        if pa.types.is_floating(data_type):
+            paths.append(path)
+    return paths
+
+
+def get_encoding_profile(name: str) -> EncodingProfile:
+    """
+    Loads a profile from the encoding_profiles of the writer config.
+
+    Args:
+        name (str): profile name, such as "archive"
+
+    Returns:
+        EncodingProfile: the configured profile
+
+    Raises:
+        ValueError: If the profile is not configured.
+    """
+    profiles = load_config_by_name("writer").get("encoding_profiles", {})
+    if name not in profiles:
+        raise ValueError(f"Unknown encoding profile: {name}, configured: {sorted(profiles)}")
+    return EncodingProfile(name, **profiles[name])
@@ -1,44 +1,79 @@
-from typing import List
+from typing import List, TYPE_CHECKING
+import os
 from src.writer.writer_interface import WriterInterface
-from src.writer.s3_parquet import S3ParquetWriter
-from src.writer.aws_ts import DBAWSWriter
-from src.writer.local_parquet import LocalParquetWriter
 from src.utils.config_loader import load_config_by_name
 
+# the writers are imported by their factories, so that only the selected writer's dependencies are loaded
+if TYPE_CHECKING:
+    from src.writer.s3_parquet import S3ParquetWriter
+    from src.writer.aws_ts import DBAWSWriter
+    from src.writer.local_parquet import LocalParquetWriter
+    from src.writer.encoding import EncodingProfile
+
+
+def _encoding(encoding_profile: str = None) -> "EncodingProfile":
+    if encoding_profile is None:
+        return None
+    from src.writer.encoding import get_encoding_profile
+    return get_encoding_profile(encoding_profile)
+
+
 def create_parquet_s3_writer(buffer_size: int, 
-                             partition_cols: List[str] = None) -> S3ParquetWriter:
+                             partition_cols: List[str] = None,
+                             writer_id: str = None,
+                             encoding_profile: str = None,
+                             manifest: bool = False,
+                             **upload_config) -> "S3ParquetWriter":
     """
     Create an S3ParquetWriter instance using a specified configuration.
 
     Args:
         buffer_size (int): The size of the buffer to use.
         partition_cols (List[str], optional): The list of columns to use for partitioning.
+        writer_id (str, optional): Prefix of the written file names.
+        encoding_profile (str, optional): Name of the parquet encoding profile, pyarrow's defaults if None.
+        manifest (bool, optional): Whether the uploaded objects are recorded in a manifest under "<prefix>/_manifest".
+        **upload_config: upload settings of S3ParquetWriter, such as upload_workers.
 
     Returns:
         S3ParquetWriter: A configured S3ParquetWriter instance.
     """
+    from src.writer.s3_parquet import S3ParquetWriter
     # Load the S3 configuration details from a centralized location
     config = load_config_by_name("data")["s3"]
-    return S3ParquetWriter(config["bucket"], config["prefix"], buffer_size, partition_cols)
-
-
-def create_db_aws_writer(buffer_size: int, connection_string: str) -> DBAWSWriter:
+    writer = S3ParquetWriter(config["bucket"], config["prefix"], buffer_size, partition_cols, writer_id=writer_id,
+                             endpoint_url=config.get("endpoint_url"), encoding=_encoding(encoding_profile),
+                             **upload_config)
+    if manifest:
+        from src.writer.manifest import Manifest, S3ManifestStore
+        # the manifest shares the writer's client
+        store = S3ManifestStore(config["bucket"], f"{config['prefix']}/_manifest", lambda: writer.client)
+        writer.manifest = Manifest(store, writer_id)
+    return writer
+
+
+def create_db_aws_writer(buffer_size: int, connection_string: str, writer_id: str = None) -> "DBAWSWriter":
     """
     Create a DBAWSWriter instance.
 
     Args:
         buffer_size (int): The size of the buffer to use.
         connection_string (str): Connection string to the timeseries database.
+        writer_id (str, optional): Identifier of the writer.
 
     Returns:
         DBAWSWriter: A configured DBAWSWriter instance.
     """
-    return DBAWSWriter(buffer_size, connection_string)
+    from src.writer.aws_ts import DBAWSWriter
+    return DBAWSWriter(buffer_size, connection_string, writer_id)
 
 
 def create_parquet_local_writer(buffer_size: int, 
                                 data_directory: str, 
-                                partition_cols: List[str] = None) -> LocalParquetWriter:
+                                partition_cols: List[str] = None,
+                                writer_id: str = None,
+                                encoding_profile: str = None,
+                                manifest: bool = False) -> "LocalParquetWriter":
     """
     Create a LocalParquetWriter instance.
 
@@ -46,11 +81,20 @@ def create_parquet_local_writer(buffer_size: int,
         buffer_size (int): The size of the buffer to use.
         data_directory (str): Directory to save the parquet files.
         partition_cols (List[str], optional): The list of columns to use for partitioning.
+        writer_id (str, optional): Prefix of the written file names.
+        encoding_profile (str, optional): Name of the parquet encoding profile, pyarrow's defaults if None.
+        manifest (bool, optional): Whether the written files are recorded in a manifest under "<data_directory>/_manifest".
 
     Returns:
         LocalParquetWriter: A configured LocalParquetWriter instance.
     """
-    return LocalParquetWriter(buffer_size, data_directory, partition_cols)
+    from src.writer.local_parquet import LocalParquetWriter
+    writer = LocalParquetWriter(buffer_size, data_directory, partition_cols, writer_id=writer_id,
+                                encoding=_encoding(encoding_profile))
+    if manifest:
+        from src.writer.manifest import LocalManifestStore, Manifest
+        writer.manifest = Manifest(LocalManifestStore(os.path.join(data_directory, "_manifest")), writer_id)
+    return writer
 
 
 # Dictionary mapping writer types to their corresponding factory functions
@@ -60,12 +104,13 @@ WRITER_FACTORIES = {
     'parquet_local': create_parquet_local_writer,
 }
 
-def create_writer(writer_config: dict) -> WriterInterface:
+def create_writer(writer_config: dict, writer_id: str = None) -> WriterInterface:
     """
     Factory function to create a writer instance based on the given configuration.
 
     Args:
         writer_config (dict): Configuration details for the writer.
+        writer_id (str, optional): Identifier added to the written file names, e.g. the worker id.
 
     Returns:
         WriterInterface: A writer instance based on the specified configuration.
@@ -77,7 +122,7 @@ def create_writer(writer_config: dict) -> WriterInterface:
     buffer_size = writer_config["buffer_size"]
     specific_config = writer_config.get(writer_type, {})
 
-    config = {"buffer_size": buffer_size}
+    config = {"buffer_size": buffer_size, "writer_id": writer_id}
     config.update(specific_config)
 
     # Get the factory function for the specified writer type
@@ -1,10 +1,13 @@
-from typing import List
-import time
+from typing import List, TYPE_CHECKING
 import os
 import logging
 
+from src.writer.partitioning import TIME_PARTITION_COLS
 from src.writer.writer_interface import WriterInterface
 
+if TYPE_CHECKING:
+    from src.writer.encoding import EncodingProfile
+
 logger = logging.getLogger(__name__)
 
 class LocalParquetWriter(WriterInterface):
@@ -15,9 +18,13 @@ class LocalParquetWriter(WriterInterface):
         buffer_size (int): The size of the data buffer.
         data_directory (str): The directory where the parquet files will be saved.
         partition_cols (List[str]): The list of columns for partitioning.
+        writer_id (str): Prefix of the written file names.
+        encoding (EncodingProfile): Parquet encoding options, pyarrow's defaults if None.
+        manifest (Manifest): Index the written files are recorded in, not recorded if None.
     """
 
-    def __init__(self, buffer_size: int, data_directory: str, partition_cols: List[str] = None, buffer: List = None):
+    def __init__(self, buffer_size: int, data_directory: str, partition_cols: List[str] = None, buffer: dict = None,
+                 writer_id: str = None, encoding: "EncodingProfile" = None):
         """
         Constructs the LocalParquetWriter object.
 
@@ -25,13 +32,19 @@ class LocalParquetWriter(WriterInterface):
             buffer_size (int): The size of the data buffer.
             data_directory (str): The directory where the parquet files will be saved.
             partition_cols (List[str], optional): The list of columns for partitioning. Defaults to None.
+            buffer (dict, optional): The buffer to use. Defaults to None.
+            writer_id (str, optional): Prefix of the written file names. Defaults to None.
+            encoding (EncodingProfile, optional): Parquet encoding options. Defaults to pyarrow's defaults.
         """
         self.buffer_size = buffer_size
         if buffer is None:
-            buffer = []
+            buffer = {}
         self.buffer = buffer
         self.data_directory = data_directory
         self.partition_cols = partition_cols if partition_cols else []
+        self.writer_id = writer_id
+        self.encoding = encoding
+        self.manifest = None
 
     def append(self, data: List[dict], event_type: str):
         """
@@ -58,7 +71,7 @@ class LocalParquetWriter(WriterInterface):
 
     def save_and_refresh(self, event_type):
         """
-        Saves the data in the buffer to S3 and then refreshes the buffer.
+        Saves the data in the buffer to the data directory and then refreshes the buffer.
         Args:
             event_type (str): The event type. Such as "orderbook", "ticker", "trades".
         """
@@ -66,16 +79,23 @@ class LocalParquetWriter(WriterInterface):
             logger.warning("Buffer is empty")
             return
 
-        data = self._list_of_dict_to_df(self.buffer)
-        data["write_time"] = time.strftime("%Y%m%d-%H")
+        table = self._to_table(self.buffer[event_type], event_type)
 
-        os.makedirs(self.data_directory, exist_ok=True)
-        partition_cols = self.partition_cols + ["write_time"]
-        data.to_parquet(self.data_directory, engine='pyarrow', partition_cols=partition_cols)
-        logger.info(f"Saved {len(self.buffer)} rows to {self.data_directory}")
+        path = os.path.join(self.data_directory, event_type)
+        partition_cols = self.partition_cols + TIME_PARTITION_COLS
+        basename = self._basename_template().format(i=0)
+        entries = []
+        for directory, key, part in self._partitions(table, partition_cols):
+            os.makedirs(os.path.join(path, directory), exist_ok=True)
+            file_path = os.path.join(path, directory, basename)
+            self._write_parquet(part, file_path)
+            entries.append(self._manifest_entry(event_type, f"{event_type}/{directory}/{basename}", key, part,
+                                                os.path.getsize(file_path)))
+        self._record_manifest(event_type, entries)
+        logger.info(f"Saved {len(self.buffer[event_type])} rows to {path}")
 
         # don't init into a new buffer = [] since websocket streaming is through list referencing
-        self.buffer.clear()
+        self.buffer[event_type].clear()
 
     
     
@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.writer.partitioning import hour_partitions
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = "_index.json"
+
+
+class ManifestConflict(Exception):
+    """The manifest object was changed by another writer since it was read."""
+
+
+class ManifestStore(ABC):
+    """
+    Storage of the manifest objects. Objects are written whole, an object that is changed by
+    several writers is written with a version check so that no update is lost.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Reads an object.
+
+        Returns:
+            Tuple[Optional[bytes], Optional[str]]: content and version, both None if it does not exist
+        """
+        pass
+
+    @abstractmethod
+    def put(self, key: str, data: bytes):
+        """Writes an object that only this writer changes."""
+        pass
+
+    @abstractmethod
+    def put_if(self, key: str, data: bytes, version: Optional[str]):
+        """
+        Writes an object if it still has the version it was read with.
+
+        Args:
+            key (str): object key
+            data (bytes): new content
+            version (str, optional): version read, None if the object must not exist yet
+
+        Raises:
+            ManifestConflict: If the object was changed or created in the meantime.
+        """
+        pass
+
+
+class LocalManifestStore(ManifestStore):
+    """Manifest objects in a local directory, versioned by modification time and guarded by a file lock."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    @staticmethod
+    def _version(path: str) -> Optional[str]:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}-{stat.st_ino}"
+
+    def get(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                return f.read(), f"{stat.st_mtime_ns}-{stat.st_size}-{stat.st_ino}"
+        except FileNotFoundError:
+            return None, None
+
+    def _replace(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a reader never sees a partially written object
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put(self, key: str, data: bytes):
+        self._replace(self._path(key), data)
+
+    def put_if(self, key: str, data: bytes, version: Optional[str]):
+        import fcntl
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self._version(path) != version:
+                    raise ManifestConflict(key)
+                self._replace(path, data)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class S3ManifestStore(ManifestStore):
+    """Manifest objects under an S3 prefix, versioned by ETag with conditional writes."""
+
+    def __init__(self, bucket: str, prefix: str, get_client: Callable):
+        """
+        Args:
+            bucket (str): S3 bucket name
+            prefix (str): key prefix of the manifest, such as "data/prod/_manifest"
+            get_client (Callable): returns the boto3 S3 client, e.g. the writer's shared client
+        """
+        self.bucket = bucket
+        self.prefix = prefix
+        self.get_client = get_client
+
+    def get(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        client = self.get_client()
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")
+        except client.exceptions.NoSuchKey:
+            return None, None
+        return response["Body"].read(), response["ETag"]
+
+    def put(self, key: str, data: bytes):
+        self.get_client().put_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}", Body=data)
+
+    def put_if(self, key: str, data: bytes, version: Optional[str]):
+        from botocore.exceptions import ClientError
+        condition = {"IfNoneMatch": "*"} if version is None else {"IfMatch": version}
+        try:
+            self.get_client().put_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}", Body=data, **condition)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise ManifestConflict(key) from e
+            raise
+
+
+class Manifest:
+    """
+    Index of every parquet object the writers wrote, so that the objects of a time range or a
+    market are found without listing the data prefixes.
+
+    The manifest is kept per event type and event hour. Every writer session writes its entries
+    of an hour to its own segment, which only it changes, and adds the segment to the hour's index
+    once. Compactions commit their new objects and the objects they replace with a single index
+    update, so a reader sees either the objects before or after a compaction. Entries are only
+    ever added, a replaced object is hidden by the compaction segment that removed it.
+
+    Entries have the keys path (relative to the data root, e.g. "trades/exchange=bitvavo/..."),
+    event_type, exchanges, markets, min_time, max_time (event time in UTC epoch nanoseconds),
+    rows, bytes, writer_id and written_at.
+    """
+
+    def __init__(self, store: ManifestStore, writer_id: str = None, max_retries: int = 20,
+                 max_cached_hours: int = 48):
+        """
+        Args:
+            store (ManifestStore): where the manifest objects are kept
+            writer_id (str, optional): prefix of the writer's segment names
+            max_retries (int, optional): index updates tried when other writers update it concurrently. Defaults to 20.
+            max_cached_hours (int, optional): hours whose segment the writer keeps in memory. Defaults to 48.
+        """
+        self.store = store
+        # a restarted worker with the same id gets a new segment
+        self.session = f"{writer_id}-{uuid.uuid4().hex[:12]}" if writer_id else uuid.uuid4().hex[:12]
+        self.max_retries = max_retries
+        self.max_cached_hours = max_cached_hours
+        self._segments: "OrderedDict[Tuple[str, str, str], List[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hour_prefix(event_type: str, date: str, hour: str) -> str:
+        return f"{event_type}/date={date}/hour={hour}"
+
+    def _update_index(self, prefix: str, segment: str):
+        for attempt in range(self.max_retries):
+            data, version = self.store.get(f"{prefix}/{INDEX_NAME}")
+            index = json.loads(data) if data else {"segments": []}
+            if segment in index["segments"]:
+                return
+            index["segments"].append(segment)
+            try:
+                self.store.put_if(f"{prefix}/{INDEX_NAME}", json.dumps(index).encode(), version)
+                return
+            except ManifestConflict:
+                # another writer added its segment, read the index again
+                time.sleep(min(0.01 * 2 ** attempt, 1))
+        raise ManifestConflict(f"{prefix}/{INDEX_NAME} still changing after {self.max_retries} attempts")
+
+    def record(self, event_type: str, entries: Iterable[dict]):
+        """
+        Adds the objects of a flush.
+
+        Args:
+            event_type (str): such as "trades"
+            entries (Iterable[dict]): one entry per written object, with date and hour keys of its partition
+        """
+        by_hour: Dict[Tuple[str, str, str], List[dict]] = {}
+        for entry in entries:
+            entry = dict(entry)
+            by_hour.setdefault((event_type, entry.pop("date"), entry.pop("hour")), []).append(entry)
+
+        with self._lock:
+            for key, hour_entries in by_hour.items():
+                prefix = self._hour_prefix(*key)
+                segment_key = f"{prefix}/{self.session}.json"
+                segment = self._segments.get(key)
+                if segment is None:
+                    # late data of an hour that was evicted from memory
+                    data, _ = self.store.get(segment_key)
+                    segment = self._segments[key] = json.loads(data)["entries"] if data else []
+                    # also lists a segment whose index update failed before
+                    new_segment = True
+                else:
+                    self._segments.move_to_end(key)
+                    new_segment = False
+                segment.extend(hour_entries)
+                # the segment is written before it is listed, so a listed segment always exists
+                self.store.put(segment_key, json.dumps({"entries": segment}).encode())
+                if new_segment:
+                    self._update_index(prefix, f"{self.session}.json")
+            while len(self._segments) > self.max_cached_hours:
+                self._segments.popitem(last=False)
+
+    def commit_compaction(self, event_type: str, date: str, hour: str, removed_paths: List[str],
+                          entries: List[dict]):
+        """
+        Replaces objects of an hour by compacted ones in one atomic index update. The compacted
+        objects must be written before and the replaced ones deleted only after the commit.
+
+        Args:
+            event_type (str): such as "trades"
+            date (str): partition date, such as "2023-08-01"
+            hour (str): partition hour, such as "10"
+            removed_paths (List[str]): paths of the replaced objects
+            entries (List[dict]): entries of the compacted objects
+        """
+        prefix = self._hour_prefix(event_type, date, hour)
+        segment = f"compaction-{uuid.uuid4().hex}.json"
+        self.store.put(f"{prefix}/{segment}", json.dumps({"entries": entries, "removed": removed_paths}).encode())
+        self._update_index(prefix, segment)
+
+    def hour_entries(self, event_type: str, date: str, hour: str) -> List[dict]:
+        """Current entries of an hour, without the objects replaced by compactions."""
+        prefix = self._hour_prefix(event_type, date, hour)
+        data, _ = self.store.get(f"{prefix}/{INDEX_NAME}")
+        if not data:
+            return []
+        entries, removed = [], set()
+        for segment in json.loads(data)["segments"]:
+            content, _ = self.store.get(f"{prefix}/{segment}")
+            if content is None:
+                continue
+            content = json.loads(content)
+            entries.extend(content["entries"])
+            removed.update(content.get("removed", []))
+        return [entry for entry in entries if entry["path"] not in removed]
+
+    def entries(self, event_type: str, start_ns: int, end_ns: int, exchange: str = None,
+                market: str = None, workers: int = 16) -> List[dict]:
+        """
+        Objects with events from start_ns to end_ns, optionally of one exchange or market.
+
+        Args:
+            event_type (str): such as "orderbook"
+            start_ns (int): first event time in UTC epoch nanoseconds
+            end_ns (int): last event time in UTC epoch nanoseconds, inclusive
+            exchange (str, optional): exchange name, such as "bitvavo"
+            market (str, optional): market name, such as "BTC-EUR"
+            workers (int, optional): hours read in parallel. Defaults to 16.
+
+        Returns:
+            List[dict]: manifest entries, oldest hour first
+        """
+        hours = hour_partitions(start_ns, end_ns)
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hours)))) as executor:
+            per_hour = list(executor.map(lambda hour: self.hour_entries(event_type, *hour), hours))
+        return [entry for entries in per_hour for entry in entries
+                if entry["min_time"] <= end_ns and entry["max_time"] >= start_ns
+                and (exchange is None or exchange in entry["exchanges"])
+                and (market is None or market in entry["markets"])]
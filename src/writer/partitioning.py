@@ -0,0 +1,120 @@
+import logging
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+from src.utils.clock import NS_PER_MS, now_ns
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+logger = logging.getLogger(__name__)
+
+# partition columns derived from the event time, appended after the configured partition columns
+TIME_PARTITION_COLS = ["date", "hour"]
+NS_PER_HOUR = 3600 * 10 ** 9
+
+
+def event_time_ns(table: "pa.Table") -> "pa.ChunkedArray":
+    """
+    Event time of every row in UTC epoch nanoseconds: the exchange timestamp where the event type
+    has one, such as the trade time, otherwise the receive time.
+
+    Args:
+        table (pa.Table): table with the registered schema of its event type
+
+    Returns:
+        pa.ChunkedArray: int64 event times, rows without any time get the current time
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    times = None
+    if "timestamp" in table.column_names:
+        times = pc.multiply(table.column("timestamp").cast(pa.int64()), NS_PER_MS)
+    if "fetch_time" in table.column_names:
+        fetch_time = table.column("fetch_time").cast(pa.int64())
+        times = fetch_time if times is None else pc.coalesce(times, fetch_time)
+    if times is None:
+        return pa.chunked_array([pa.array([now_ns()] * table.num_rows, type=pa.int64())])
+    return pc.fill_null(times, now_ns())
+
+
+def add_time_partitions(table: "pa.Table") -> "pa.Table":
+    """
+    Appends the date ("2023-08-01") and hour ("10") partition columns, in UTC, of each row's event time.
+
+    Rows are not reordered, a buffer that spans several hours is split by the writers into one
+    file per hour it touches.
+
+    Args:
+        table (pa.Table): table with the registered schema of its event type
+
+    Returns:
+        pa.Table: the table with the date and hour columns
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    times = event_time_ns(table).cast(pa.timestamp("ns"))
+    table = table.append_column("date", pc.strftime(times, format="%Y-%m-%d"))
+    return table.append_column("hour", pc.strftime(times, format="%H"))
+
+
+def hour_partitions(start_ns: int, end_ns: int) -> List[Tuple[str, str]]:
+    """
+    The (date, hour) partitions that hold events from start_ns to end_ns.
+
+    Args:
+        start_ns (int): first event time in UTC epoch nanoseconds
+        end_ns (int): last event time in UTC epoch nanoseconds, inclusive
+
+    Returns:
+        List[Tuple[str, str]]: such as [("2023-08-01", "23"), ("2023-08-02", "00")]
+    """
+    import datetime
+    partitions = []
+    for hour in range(start_ns // NS_PER_HOUR, end_ns // NS_PER_HOUR + 1):
+        moment = datetime.datetime.fromtimestamp(hour * 3600, tz=datetime.timezone.utc)
+        partitions.append((moment.strftime("%Y-%m-%d"), moment.strftime("%H")))
+    return partitions
+
+
+def dataset_partitioning(partition_cols: List[str]) -> "ds.Partitioning":
+    """
+    Hive partitioning of a written event type with every partition column read as a string, so
+    that e.g. the hour "09" is not inferred as the integer 9.
+
+    Args:
+        partition_cols (List[str]): the configured partition columns of the writer, such as ["exchange"]
+
+    Returns:
+        ds.Partitioning: partitioning for pyarrow.dataset.dataset
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(col, pa.string()) for col in partition_cols + TIME_PARTITION_COLS]),
+                           flavor="hive")
+
+
+def partition_filter(start_ns: int, end_ns: int, market: Optional[str] = None) -> "ds.Expression":
+    """
+    Dataset filter for a time range and optionally a market. On a hive partitioned dataset only
+    the files of the matching partitions are read, the market is pruned by directory when market
+    is a partition column and by row group statistics otherwise.
+
+    Args:
+        start_ns (int): first event time in UTC epoch nanoseconds
+        end_ns (int): last event time in UTC epoch nanoseconds, inclusive
+        market (str, optional): market name, such as "BTC-EUR"
+
+    Returns:
+        ds.Expression: filter for pyarrow.dataset.Dataset.to_table
+    """
+    import pyarrow.dataset as ds
+    (start_date, start_hour), = hour_partitions(start_ns, start_ns)
+    (end_date, end_hour), = hour_partitions(end_ns, end_ns)
+    date, hour = ds.field("date"), ds.field("hour")
+    # both are zero padded, so they compare as strings
+    expression = (((date > start_date) | ((date == start_date) & (hour >= start_hour)))
+                  & ((date < end_date) | ((date == end_date) & (hour <= end_hour))))
+    if market is not None:
+        expression = expression & (ds.field("market") == market)
+    return expression
@@ -1,14 +1,20 @@
-from typing import List
-import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, TYPE_CHECKING
 import os
-import tempfile
 import logging
+import threading
 
-import boto3
+from src.writer.partitioning import TIME_PARTITION_COLS
 from src.writer.writer_interface import WriterInterface
 
+if TYPE_CHECKING:
+    import pyarrow as pa
+    from src.writer.encoding import EncodingProfile
+
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
 class S3ParquetWriter(WriterInterface):
     """
     A class to represent an S3 Parquet writer.
@@ -18,9 +24,18 @@ class S3ParquetWriter(WriterInterface):
         s3_prefix (str): The S3 prefix path.
         buffer_size (int): The size of the data buffer.
         partition_cols (List[str]): The list of columns for partitioning.
+        upload_workers (int): Number of partitions uploaded in parallel.
+        multipart_threshold_mb (int): File size from which a file is uploaded in parts.
+        multipart_chunksize_mb (int): Size of an uploaded part.
+        max_concurrency (int): Number of parts of a file uploaded in parallel.
+        encoding (EncodingProfile): Parquet encoding options, pyarrow's defaults if None.
+        manifest (Manifest): Index the uploaded objects are recorded in, not recorded if None.
     """
 
-    def __init__(self, s3_bucket: str, s3_prefix: str, buffer_size: int = 10000, partition_cols: List[str] = None, buffer:dict = None):
+    def __init__(self, s3_bucket: str, s3_prefix: str, buffer_size: int = 10000, partition_cols: List[str] = None, buffer:dict = None,
+                 writer_id: str = None, upload_workers: int = 8, multipart_threshold_mb: int = 8,
+                 multipart_chunksize_mb: int = 8, max_concurrency: int = 4, endpoint_url: str = None,
+                 boto_client=None, encoding: "EncodingProfile" = None):
         """
         Constructs the S3ParquetWriter object.
 
@@ -30,6 +45,14 @@ class S3ParquetWriter(WriterInterface):
             buffer_size (int): The size of the data buffer. Defaults to 10000.
             partition_cols (List[str], optional): The list of columns for partitioning. Defaults to None.
             buffer (dict, optional): The buffer to use. Defaults to None.
+            writer_id (str, optional): Prefix of the written file names. Defaults to None.
+            upload_workers (int, optional): Number of partitions uploaded in parallel. Defaults to 8.
+            multipart_threshold_mb (int, optional): File size in MB from which a file is uploaded in parts. Defaults to 8.
+            multipart_chunksize_mb (int, optional): Size of an uploaded part in MB. Defaults to 8.
+            max_concurrency (int, optional): Number of parts of a file uploaded in parallel. Defaults to 4.
+            endpoint_url (str, optional): S3 endpoint, for S3 compatible stores. Defaults to AWS.
+            boto_client (boto3.client, optional): Client to upload with. Created on the first flush if None.
+            encoding (EncodingProfile, optional): Parquet encoding options. Defaults to pyarrow's defaults.
         """
         self.buffer_size = buffer_size
         if buffer is None:
@@ -38,6 +61,20 @@ class S3ParquetWriter(WriterInterface):
         self.partition_cols = partition_cols if partition_cols else []
         self.s3_bucket = s3_bucket
         self.s3_prefix = s3_prefix
+        self.writer_id = writer_id
+        self.upload_workers = upload_workers
+        self.multipart_threshold_mb = multipart_threshold_mb
+        self.multipart_chunksize_mb = multipart_chunksize_mb
+        self.max_concurrency = max_concurrency
+        self.endpoint_url = endpoint_url
+        self._client = boto_client
+        self._client_lock = threading.Lock()
+        self._executor = None
+        self._transfer_config = None
+        self.encoding = encoding
+        self.manifest = None
+        # basename of a failed flush by event type, reused so that its retry overwrites the uploaded partitions
+        self._retry_basenames = {}
 
     def append(self, data: List[dict], event_type: str):
         """
@@ -65,27 +102,97 @@ class S3ParquetWriter(WriterInterface):
     def save_and_refresh(self, event_type):
         """
         Saves the data in the buffer to S3 and then refreshes the buffer.
+
+        Every partition is serialized to an in-memory parquet file and the partitions are uploaded
+        in parallel through the writer's client, large files as concurrent multipart uploads.
+        Nothing is written to the local disk.
+
         Args:
             event_type (str): The event type. Such as "orderbook", "ticker", "trades".
         """
         if not self.buffer[event_type]:
             logger.warning("Buffer is empty")
             return
-        
-        data = self._list_of_dict_to_df(self.buffer[event_type])
-        data["write_time"] = time.strftime("%Y%m%d-%H")
-        partition_cols = self.partition_cols + ["write_time"]
-
-        with tempfile.TemporaryDirectory() as temp_dir:
-            path = os.path.join(temp_dir, "data")
-            data.to_parquet(path, engine='pyarrow', partition_cols=partition_cols)
-            s3_dest_path = f"{self.s3_prefix}/{event_type}"
-            self.upload_to_s3(path, self.s3_bucket, s3_dest_path)
-            logger.info(f"Uploaded data to s3://{self.s3_bucket}/{s3_dest_path}")
+
+        table = self._to_table(self.buffer[event_type], event_type)
+        partition_cols = self.partition_cols + TIME_PARTITION_COLS
+        s3_dest_path = f"{self.s3_prefix}/{event_type}"
+        basename = self._retry_basenames.get(event_type) or self._basename_template().format(i=0)
+
+        partitions = list(self._partitions(table, partition_cols))
+        uploads = [self.executor.submit(self._upload_table, part, f"{s3_dest_path}/{directory}/{basename}")
+                   for directory, _, part in partitions]
+        # wait for every upload before raising, the buffer is kept and written again on the next flush
+        # under the same basename, replacing the partitions that were uploaded instead of duplicating them
+        errors = [future.exception() for future in uploads]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            self._retry_basenames[event_type] = basename
+            raise errors[0]
+        self._retry_basenames.pop(event_type, None)
+        self._record_manifest(event_type, [
+            self._manifest_entry(event_type, f"{event_type}/{directory}/{basename}", key, part, upload.result())
+            for (directory, key, part), upload in zip(partitions, uploads)])
+        logger.info(f"Uploaded {table.num_rows} rows in {len(uploads)} files to s3://{self.s3_bucket}/{s3_dest_path}")
 
         # don't init into a new buffer = [] since websocket streaming is through list referencing
         self.buffer[event_type].clear()
-    
+
+    @property
+    def client(self):
+        """The writer's boto3 S3 client, created on first use and shared by the upload threads."""
+        with self._client_lock:
+            if self._client is None:
+                self._client = self._create_client()
+            return self._client
+
+    def _create_client(self):
+        import boto3
+        from botocore.config import Config
+        # one connection per concurrently uploaded part, so that the threads don't wait for the pool
+        config = Config(max_pool_connections=max(10, self.upload_workers * self.max_concurrency))
+        return boto3.client(
+            "s3",
+            aws_access_key_id=os.environ.get('aws_access_key_id'),
+            aws_secret_access_key=os.environ.get('aws_secret_access_key'),
+            endpoint_url=self.endpoint_url,
+            config=config,
+        )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Thread pool the partitions of a flush are uploaded with, kept for the writer's lifetime."""
+        with self._client_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.upload_workers,
+                                                    thread_name_prefix="s3-upload")
+            return self._executor
+
+    @property
+    def transfer_config(self):
+        """Multipart settings of the uploads."""
+        if self._transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+            self._transfer_config = TransferConfig(multipart_threshold=self.multipart_threshold_mb * MB,
+                                                   multipart_chunksize=self.multipart_chunksize_mb * MB,
+                                                   max_concurrency=self.max_concurrency)
+        return self._transfer_config
+
+    def close(self):
+        """Waits for running uploads and releases the upload threads."""
+        with self._client_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _upload_table(self, table: "pa.Table", s3_key: str) -> int:
+        import pyarrow as pa
+        sink = pa.BufferOutputStream()
+        self._write_parquet(table, sink)
+        data = sink.getvalue()
+        # the reader wraps the arrow buffer without copying it
+        self.client.upload_fileobj(pa.BufferReader(data), self.s3_bucket, s3_key, Config=self.transfer_config)
+        return data.size
 
     @staticmethod
     def upload_to_s3(local_dir: str, s3_bucket: str, s3_prefix: str, boto_client=None):
@@ -99,6 +206,7 @@ class S3ParquetWriter(WriterInterface):
             boto_client (boto3.client, optional): The boto3 S3 client. If None, creates a new client.
         """
         if boto_client is None:
+            import boto3
             boto_client = boto3.client(
                 "s3",
                 aws_access_key_id=os.environ.get('aws_access_key_id'),
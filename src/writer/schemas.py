@@ -0,0 +1,143 @@
+import logging
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# columns every event type carries
+COMMON_FIELDS = [
+    pa.field("event", pa.string()),
+    pa.field("exchange", pa.string()),
+    pa.field("market", pa.string()),
+    # receive time in UTC epoch nanoseconds
+    pa.field("fetch_time", pa.int64()),
+]
+
+_PRICE_LEVELS = pa.list_(pa.list_(pa.float64()))
+
+# Arrow schema per event type. The handlers normalize every exchange to the same columns, so
+# the exchanges of an event type share one schema and every file of an event type has it.
+SCHEMAS: Dict[str, pa.Schema] = {
+    "orderbook": pa.schema(COMMON_FIELDS + [
+        # pair as requested, only set by the REST collection modes
+        pa.field("pair", pa.string()),
+        pa.field("nonce", pa.int64()),
+        # exchange timestamp in epoch milliseconds
+        pa.field("timestamp", pa.int64()),
+        pa.field("bids", _PRICE_LEVELS),
+        pa.field("asks", _PRICE_LEVELS),
+    ]),
+    "trades": pa.schema(COMMON_FIELDS + [
+        pa.field("id", pa.string()),
+        pa.field("timestamp", pa.int64()),
+        pa.field("price", pa.float64()),
+        pa.field("amount", pa.float64()),
+        pa.field("side", pa.string()),
+    ]),
+    "ticker": pa.schema(COMMON_FIELDS + [
+        pa.field("bestBid", pa.float64()),
+        pa.field("bestBidSize", pa.float64()),
+        pa.field("bestAsk", pa.float64()),
+        pa.field("bestAskSize", pa.float64()),
+        pa.field("lastPrice", pa.float64()),
+    ]),
+    "gaps": pa.schema(COMMON_FIELDS + [
+        pa.field("event_type", pa.string()),
+        pa.field("gap_start", pa.int64()),
+        pa.field("gap_end", pa.int64()),
+        pa.field("reason", pa.string()),
+        pa.field("backfilled", pa.bool_()),
+    ]),
+}
+
+
+def get_schema(event_type: str) -> Optional[pa.Schema]:
+    """Registered schema of the event type, None if the event type has none."""
+    return SCHEMAS.get(event_type)
+
+
+def register_schema(event_type: str, schema: pa.Schema) -> None:
+    SCHEMAS[event_type] = schema
+
+
+def _to_float(value):
+    # exchanges send numbers as strings
+    return None if value is None or value == "" else float(value)
+
+
+def _to_int(value):
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        # such as "1690998560339.0"
+        return int(float(value))
+
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+
+def _to_levels(levels):
+    return None if levels is None else [[_to_float(x) for x in level] for level in levels]
+
+
+def _converter(data_type: pa.DataType):
+    if pa.types.is_floating(data_type):
+        return _to_float
+    if pa.types.is_integer(data_type):
+        return _to_int
+    if pa.types.is_string(data_type):
+        return _to_str
+    if data_type == _PRICE_LEVELS:
+        return _to_levels
+    return None
+
+
+def _wire_type(data_type: pa.DataType) -> pa.DataType:
+    # numbers are sent as strings by the exchanges, also inside the price levels
+    if pa.types.is_floating(data_type):
+        return pa.string()
+    if data_type == _PRICE_LEVELS:
+        return pa.list_(pa.list_(pa.string()))
+    return data_type
+
+
+def records_to_table(records: List[dict], event_type: str) -> pa.Table:
+    """Converts buffered records to an Arrow table with the registered schema of the event type.
+
+    Values are cast to the schema, e.g. prices sent as strings become floats, missing columns are
+    null and columns that are not in the schema are dropped. Event types without a schema are
+    converted with inferred types.
+
+    The records are converted by Arrow in one pass as a struct array, first with the schema's types
+    and then with numbers as strings, which are parsed by a cast. Only a buffer that mixes both
+    falls back to converting value by value.
+
+    Args:
+        records (List[dict]): buffered records of one event type
+        event_type (str): such as "orderbook"
+
+    Returns:
+        pa.Table: the records as a table
+    """
+    schema = get_schema(event_type)
+    if schema is None:
+        return pa.Table.from_pylist(records)
+
+    for struct_type in (pa.struct(list(schema)), pa.struct([pa.field(f.name, _wire_type(f.type)) for f in schema])):
+        try:
+            struct = pa.array(records, type=struct_type)
+            columns = [struct.field(i).cast(field.type) for i, field in enumerate(schema)]
+            return pa.Table.from_arrays(columns, schema=schema)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+            continue
+
+    columns = []
+    for field in schema:
+        convert = _converter(field.type)
+        values = [record.get(field.name) for record in records]
+        columns.append(pa.array([convert(value) for value in values] if convert else values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
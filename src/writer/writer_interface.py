@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import List
-import pandas as pd
+from typing import Iterator, List, Tuple, TYPE_CHECKING
+import logging
+import uuid
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# directory name pyarrow gives null partition values
+HIVE_DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
 
 
 class WriterInterface(ABC):
@@ -38,14 +47,113 @@ class WriterInterface(ABC):
         """
         pass
 
-    def _list_of_dict_to_df(self, data: List[dict]) -> pd.DataFrame:
+    def _basename_template(self) -> str:
+        """
+        File name template for a flush. The writer id keeps files of several writers
+        (worker processes or collector instances) apart when they write to the same partitions.
+
+        Returns:
+            str: basename template with the "{i}" placeholder pyarrow requires
+        """
+        writer_id = getattr(self, "writer_id", None)
+        prefix = f"{writer_id}-" if writer_id else ""
+        return prefix + uuid.uuid4().hex + "-{i}.parquet"
+
+    def _to_table(self, data: List[dict], event_type: str) -> "pa.Table":
         """
-        Converts a list of dictionaries to a pandas DataFrame.
+        Converts a list of dictionaries to an Arrow table with the registered schema of the
+        event type and adds the date and hour partition columns of the event time.
 
         Args:
             data (List[dict]): List of dictionaries to be converted.
+            event_type (str): The event type. Such as "orderbook", "ticker", "trades".
 
         Returns:
-            pd.DataFrame: The converted pandas DataFrame.
+            pa.Table: The converted table.
+        """
+        # pyarrow is imported on the first flush, not when the writer is imported
+        from src.writer.partitioning import add_time_partitions
+        from src.writer.schemas import records_to_table
+        return add_time_partitions(records_to_table(data, event_type))
+
+    def _partitions(self, table: "pa.Table", partition_cols: List[str]) -> Iterator[Tuple[str, dict, "pa.Table"]]:
+        """
+        Splits a table into its hive partitions, the same layout pyarrow.parquet.write_to_dataset writes.
+
+        Args:
+            table (pa.Table): table to split
+            partition_cols (List[str]): columns to partition by, in directory order
+
+        Yields:
+            Tuple[str, dict, pa.Table]: relative directory such as "exchange=bitvavo/date=2023-08-01/hour=10",
+                the partition values and the rows of the partition without the partition columns
+        """
+        import pyarrow.compute as pc
+        keys = table.select(partition_cols).group_by(partition_cols).aggregate([]).to_pylist()
+        data = table.drop(partition_cols)
+        for key in keys:
+            mask = None
+            for col in partition_cols:
+                column = table.column(col)
+                match = pc.is_null(column) if key[col] is None else pc.equal(column, key[col])
+                mask = match if mask is None else pc.and_(mask, match)
+            directory = "/".join(f"{col}={HIVE_DEFAULT_PARTITION if key[col] is None else key[col]}"
+                                 for col in partition_cols)
+            yield directory, key, data.filter(mask)
+
+    def _write_parquet(self, table: "pa.Table", where):
+        """
+        Writes a table as one parquet file with the writer's encoding profile.
+
+        Args:
+            table (pa.Table): table to write
+            where: file path or writable arrow stream
+        """
+        import pyarrow.parquet as pq
+        encoding = getattr(self, "encoding", None)
+        options = encoding.write_options(table.schema) if encoding is not None else {}
+        pq.write_table(table, where, **options)
+
+    def _manifest_entry(self, event_type: str, path: str, key: dict, table: "pa.Table", size: int) -> dict:
+        """
+        Manifest entry of a written partition file.
+
+        Args:
+            event_type (str): The event type. Such as "orderbook", "ticker", "trades".
+            path (str): path of the file relative to the data root
+            key (dict): partition values of the file
+            table (pa.Table): rows of the file
+            size (int): file size in bytes
+
+        Returns:
+            dict: the entry, see src.writer.manifest.Manifest
+        """
+        import pyarrow.compute as pc
+        from src.utils.clock import now_ns
+        from src.writer.partitioning import event_time_ns
+
+        def values(col):
+            if col in key:
+                return [] if key[col] is None else [key[col]]
+            if col in table.column_names:
+                return [value for value in pc.unique(table.column(col)).to_pylist() if value is not None]
+            return []
+
+        times = pc.min_max(event_time_ns(table)).as_py()
+        return {"path": path, "event_type": event_type, "date": key["date"], "hour": key["hour"],
+                "exchanges": values("exchange"), "markets": values("market"),
+                "min_time": times["min"], "max_time": times["max"], "rows": table.num_rows, "bytes": size,
+                "writer_id": getattr(self, "writer_id", None), "written_at": now_ns()}
+
+    def _record_manifest(self, event_type: str, entries: List[dict]):
+        """
+        Records written files in the writer's manifest, if it has one. The files are written at
+        this point, so a failure is logged rather than raised, which would write them again.
         """
-        return pd.DataFrame(data)
+        manifest = getattr(self, "manifest", None)
+        if manifest is None or not entries:
+            return
+        try:
+            manifest.record(event_type, entries)
+        except Exception as e:
+            logger.error(f"Could not record {len(entries)} {event_type} files in the manifest: {e}")
@@ -1,8 +1,13 @@
 import logging
-from datetime import datetime
 from abc import ABC, abstractmethod
 import threading
 import copy
+from collections import Counter
+
+from src.utils.clock import now_ns, ms_to_ns
+from src.utils.metrics import LatencyHistogram
+from src.utils.dedup import RecentIdIndex
+from src.utils.event_bus import EventBus
 
 
 logger = logging.getLogger(__name__)
@@ -16,9 +21,23 @@ class WSHandler(ABC):
     active_buffer: list = None
     swap_buffer: list = None
     pairs: list = None
+    # trade ids remembered per market to drop the duplicates of reconnects and backfills
+    dedup_capacity: int = 10000
+    # decides which orderbook updates are buffered for the writer, see OrderbookConflator
+    conflator = None
     
     def __init__(self):
         self.lock = threading.Lock()
+        # exchange timestamp to receive time latency of the messages handled
+        self.latency = LatencyHistogram()
+        # messages and last receive time per market, read by the stall watchdog
+        self.market_counts = Counter()
+        self.last_received = {}
+        # recent trade ids and dropped duplicates per market
+        self.recent_ids = {}
+        self.duplicates = Counter()
+        # consumers of the buffered events besides the writer, shared by the handlers of a collector
+        self.bus = EventBus()
 
     def validate_data_keys(self, response):
         for key in self.keys[self.event_type]:
@@ -34,14 +53,73 @@ class WSHandler(ABC):
             response["event"] = self.event_type
         return response
         
-    def add_fetch_time(self, response):
-        response["fetch_time"] = datetime.now()
+    def add_fetch_time(self, response, fetch_time: int = None):
+        """Adds the receive time as UTC epoch nanoseconds.
+
+        Args:
+            response (dict): message from the exchange
+            fetch_time (int, optional): receive time captured at the start of the callback. Defaults to now.
+        """
+        response["fetch_time"] = now_ns() if fetch_time is None else fetch_time
+        return response
+    
+    def record_latency_callback(self, response):
+        """Records the latency between the exchange timestamp and our receive time if the message has one."""
+        timestamp = response.get("timestamp")
+        if timestamp is not None:
+            self.latency.record(response["fetch_time"] - ms_to_ns(timestamp))
         return response
     
+    def is_duplicate(self, response) -> bool:
+        """Whether a trade with the same id was already handled for the market. Thread safe."""
+        market = response.get("market")
+        with self.lock:
+            index = self.recent_ids.get(market)
+            if index is None:
+                index = self.recent_ids[market] = RecentIdIndex(self.dedup_capacity)
+            if index.add(response["id"]):
+                return False
+            self.duplicates[market] += 1
+            return True
+
     def append_data_callback(self, response):
+        market = response.get("market")
+        with self.lock:
+            # the bus still gets every update, only the written ones are conflated
+            if self.conflator is None or self.conflator.offer(response):
+                self.active_buffer.append(response)
+            self.market_counts[market] += 1
+            self.last_received[market] = response.get("fetch_time")
+        self.bus.publish(response)
+
+    def add_listener(self, listener):
+        """Registers a callable that is called with every event appended to the buffer, on the receiving thread.
+
+        Args:
+            listener (Callable[[dict], None]): must not modify the event
+        """
+        self.bus.subscribe(listener, event_types=[self.event_type])
+
+    def pop_conflated_counts(self) -> Counter:
+        """Updates per market that were conflated since the last call. Thread safe."""
         with self.lock:
-            self.active_buffer.append(response)
+            if self.conflator is None:
+                return Counter()
+            return self.conflator.pop_conflated_counts()
 
+    def conflation_stats(self):
+        """Received, persisted and conflated updates, None without a conflator. Thread safe."""
+        with self.lock:
+            return None if self.conflator is None else self.conflator.stats()
+
+    def stream_stats(self):
+        """Copies of the message counts and last receive times (UTC epoch ns) per market. Thread safe."""
+        with self.lock:
+            return dict(self.market_counts), dict(self.last_received)
+        
+    def market_name(self, pair: str) -> str:
+        """Market name of a subscribed pair, such as BTC-EUR"""
+        return pair
         
     def append_exchange_name_callback(self, response, name):
         response["exchange"] = name
@@ -72,6 +150,9 @@ class WSHandler(ABC):
             list: A deep copy of the active buffer.
         """
         with self.lock:
+            # the latest books of markets whose persist interval passed since their last written one
+            if self.conflator is not None:
+                self.active_buffer.extend(self.conflator.due(now_ns()))
             # Swap the buffers
             self.active_buffer, self.swap_buffer = self.swap_buffer, self.active_buffer
             # Clear active buffer for new data
@@ -1,10 +1,10 @@
 import logging
-import time
 
 from python_bitvavo_api.bitvavo import Bitvavo
 
 
 from src.ws_handlers.base_handler import WSHandler
+from src.utils.clock import now_ns
 
 
 logger = logging.getLogger(__name__)
@@ -31,11 +31,19 @@ class BitvavoWSHandler(WSHandler):
         self.pairs = pairs
     
     def callback(self, response):
+        # capture the receive time before doing any work on the message
+        fetch_time = now_ns()
         response = self.validate_data_keys(response)
         if response is None:
             return None
+        if self.event_type == "trades" and self.is_duplicate(response):
+            return None
+        if self.event_type == "orderbook":
+            # the sdk passes its local book which it keeps mutating, take a shallow copy
+            response = dict(response)
         response = self.add_event_type_callback(response)
-        response = self.add_fetch_time(response)
+        response = self.add_fetch_time(response, fetch_time)
+        response = self.record_latency_callback(response)
         
         if self.event_type ==  "orderbook":
             response = self.limit_orderbook_callback(response)
@@ -54,17 +62,7 @@ class BitvavoWSHandler(WSHandler):
         return response
     
     def error_callback(self, error):
-        #TODO depending on the error type, implement specific error handling
-        # if error is caused by A do this
-        # if error is caused by B do that 
-        # ....
-        # now just sleep and try to reconnect to websocket
+        # runs on the receive thread, so it must not block. Dropped connections are
+        # reopened and resubscribed by the socket and the gap is backfilled by the exchange.
         logger.error(f"Something happened in websocket {error}")
-        logger.info("Sleeping for 60 seconds and then try to reconnect again...")
-        time.sleep(60)
-        if self.socket.is_socket_closed():
-            # reconnect to websocket
-            logger.info("socket is already closed. Will open a new one.")
-        else:
-            self.socket.checkReconnect()
     
\ No newline at end of file
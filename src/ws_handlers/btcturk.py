@@ -0,0 +1,96 @@
+import logging
+
+from src.ws_handlers.base_handler import WSHandler
+from src.utils.clock import now_ns
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class BtcTurkWSHandler(WSHandler):
+    """
+    Handles the BtcTurk push feed messages and normalizes them into the same
+    columns as the Bitvavo handler so that both exchanges share a buffer per event type.
+    """
+    keys = {
+        "orderbook": ["PS", "AO", "BO"],
+        "ticker": ["PS"],
+        "trades": ["I", "A", "P", "D", "PS", "S"]
+    }
+
+    def __init__(self, event_type, socket=None, limit: int = 20, pairs: list = None, market_names: dict = None):
+        """
+        Args:
+            event_type (str): "orderbook", "ticker" or "trades"
+            socket (BtcTurkWebSocket, optional): the socket the handler is subscribed on.
+            limit (int, optional): number of orderbook levels to keep. Defaults to 20.
+            pairs (list, optional): subscribed pair symbols such as ["BTCTRY"].
+            market_names (dict, optional): maps BtcTurk pair symbols to market names, e.g. {"BTCTRY": "BTC-TRY"}.
+        """
+        super().__init__()
+        self.socket = socket
+        if event_type not in ["orderbook", "ticker", "trades"]:
+            logger.error("Invalid event type in WS.")
+            raise ValueError("Invalid event type.")
+        self.event_type = event_type
+        self.active_buffer = []
+        self.swap_buffer = []
+        self.limit = limit
+        self.pairs = pairs
+        self.market_names = market_names if market_names else {}
+
+    def callback(self, response):
+        # capture the receive time before doing any work on the message
+        fetch_time = now_ns()
+        response = self.validate_data_keys(response)
+        if response is None:
+            return None
+        response = self.normalize_callback(response)
+        if self.event_type == "trades" and self.is_duplicate(response):
+            return None
+        response = self.add_event_type_callback(response)
+        response = self.add_fetch_time(response, fetch_time)
+        response = self.record_latency_callback(response)
+
+        if self.event_type == "orderbook":
+            response = self.limit_orderbook_callback(response)
+
+        response = self.append_exchange_name_callback(response, "btcturk")
+        self.append_data_callback(response)
+
+    def market_name(self, pair: str) -> str:
+        return self.market_names.get(pair, pair)
+
+    def normalize_callback(self, response):
+        """Maps the abbreviated BtcTurk keys to the column names used by the other exchanges."""
+        market = self.market_name(response["PS"])
+        if self.event_type == "orderbook":
+            return {
+                "market": market,
+                "nonce": response.get("CS"),
+                "bids": [[level["P"], level["A"]] for level in response["BO"]],
+                "asks": [[level["P"], level["A"]] for level in response["AO"]],
+            }
+        if self.event_type == "trades":
+            return {
+                "id": str(response["I"]),
+                "amount": response["A"],
+                "price": response["P"],
+                "timestamp": int(response["D"]),
+                "market": market,
+                # S is the taker side, 0 for buy and 1 for sell
+                "side": "buy" if int(response["S"]) == 0 else "sell",
+            }
+        return {
+            "market": market,
+            "bestBid": response.get("B"),
+            "bestBidSize": response.get("BA"),
+            "bestAsk": response.get("A"),
+            "bestAskSize": response.get("AA"),
+            "lastPrice": response.get("LA"),
+        }
+
+    def error_callback(self, error):
+        # the socket reconnects and resubscribes by itself, nothing to do but report
+        logger.error(f"Something happened in websocket {error}")
@@ -0,0 +1,116 @@
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10 ** 9
+
+
+def _top_prices(levels, n: int) -> Tuple[float, ...]:
+    return tuple(float(level[0]) for level in (levels or [])[:n])
+
+
+class OrderbookConflator:
+    """
+    Decides which orderbook updates are persisted. The latest book of every market is kept and an
+    update is persisted if the market's interval passed since its last persisted book, or on a
+    significant change: the mid moved by mid_change_bps or a price of the top_levels levels changed.
+    Superseded books are conflated, the latest one is persisted once its interval is due.
+
+    Not thread safe, the handler calls it under its lock.
+    """
+
+    def __init__(self, interval: float = 1, intervals: Dict[str, float] = None, mid_change_bps: Optional[float] = 5,
+                 top_levels: Optional[int] = None):
+        """
+        Args:
+            interval (float, optional): seconds between two persisted books of a market. Defaults to 1.
+            intervals (Dict[str, float], optional): interval by market, overriding interval. Defaults to None.
+            mid_change_bps (float, optional): mid move in basis points since the last persisted book that
+                is persisted immediately, None to disable. Defaults to 5.
+            top_levels (int, optional): number of levels per side whose price changes are persisted
+                immediately, None to disable. Defaults to None.
+        """
+        self.interval_ns = int(interval * NS_PER_SECOND)
+        self.intervals_ns = {market: int(seconds * NS_PER_SECOND) for market, seconds in (intervals or {}).items()}
+        self.mid_change = None if mid_change_bps is None else mid_change_bps / 10000
+        self.top_levels = top_levels
+        # per market: fetch time, mid and top prices of the last persisted book
+        self.persisted: Dict[str, Tuple[int, Optional[float], tuple]] = {}
+        # latest book of a market that was not persisted yet
+        self.pending: Dict[str, dict] = {}
+        self.received = Counter()
+        self.persisted_by = Counter()
+        self.conflated = Counter()
+        # conflated since the last pop_conflated_counts, the collector counts them as load
+        self.unreported = Counter()
+
+    def _signature(self, book: dict) -> Tuple[Optional[float], tuple]:
+        bids, asks = book.get("bids") or [], book.get("asks") or []
+        mid = (float(bids[0][0]) + float(asks[0][0])) / 2 if bids and asks else None
+        top = (_top_prices(bids, self.top_levels), _top_prices(asks, self.top_levels)) if self.top_levels else ()
+        return mid, top
+
+    def offer(self, book: dict) -> bool:
+        """
+        Adds an update of a market's book.
+
+        Args:
+            book (dict): orderbook event with market, fetch_time, bids and asks
+
+        Returns:
+            bool: whether to persist the update now, otherwise it is kept as the market's pending book
+        """
+        market = book.get("market")
+        self.received[market] += 1
+        if self.pending.pop(market, None) is not None:
+            self.conflated[market] += 1
+            self.unreported[market] += 1
+        mid, top = self._signature(book)
+        last = self.persisted.get(market)
+        reason = None
+        if last is None:
+            reason = "first"
+        elif book["fetch_time"] - last[0] >= self.intervals_ns.get(market, self.interval_ns):
+            reason = "interval"
+        elif self.mid_change is not None and mid is not None and last[1] \
+                and abs(mid - last[1]) >= self.mid_change * last[1]:
+            reason = "mid_change"
+        elif self.top_levels and top != last[2]:
+            reason = "top_levels"
+        if reason is None:
+            self.pending[market] = book
+            return False
+        self._persist(market, book, mid, top, reason)
+        return True
+
+    def _persist(self, market: str, book: dict, mid: Optional[float], top: tuple, reason: str):
+        self.persisted[market] = (book["fetch_time"], mid, top)
+        self.persisted_by[reason] += 1
+
+    def due(self, time_ns: int) -> List[dict]:
+        """
+        Removes and returns the pending books whose interval passed.
+
+        Args:
+            time_ns (int): current time in UTC epoch nanoseconds
+        """
+        books = []
+        for market, book in list(self.pending.items()):
+            if time_ns - self.persisted[market][0] >= self.intervals_ns.get(market, self.interval_ns):
+                del self.pending[market]
+                self._persist(market, book, *self._signature(book), "interval")
+                books.append(book)
+        return books
+
+    def pop_conflated_counts(self) -> Counter:
+        """Conflated updates per market since the last call."""
+        counts, self.unreported = self.unreported, Counter()
+        return counts
+
+    def stats(self) -> dict:
+        """Updates received, persisted by reason and conflated."""
+        received, conflated = sum(self.received.values()), sum(self.conflated.values())
+        return {"received": received, "persisted": dict(self.persisted_by), "conflated": conflated,
+                "conflated_ratio": conflated / received if received else None}
@@ -38,7 +38,10 @@ def mock_config_bitvavo():
         "exchange_fiat": "USD",
         "base_endpoint": "http://mock_endpoint",
         "exchange_info_url": "/mock_exchange_info",
-        "assets_info_url": "/mock_assets_info"
+        "assets_info_url": "/mock_assets_info",
+        "ws_subscription_batch_size": 2,
+        "backfill_page_size": 2,
+        "backfill_max_pages": 3
     }
     
 @pytest.fixture
@@ -103,6 +106,9 @@ def mock_config_btcturk():
         "order_url": "/mock_orderbook",
         "orderbook_url": "/mock_orderbook",
         "orderbook_limit": 20,
+        "trades_url": "/mock_trades",
+        "ws_url": "wss://mock_ws_endpoint",
+        "trades_backfill_limit": 2,
     }
 
 @pytest.fixture
@@ -141,8 +147,13 @@ def mock_config_data_collector(request):
     return {
         "collection_mode": request.param,
         "limit": 5,
+        "sleep_duration": 1,
         "pairs": {
             "bitvavo": ["BTC-EUR"],
             "btcturk": ["BTC-TRY"]
+        },
+        "event_types": {
+            "bitvavo": ["orderbook"],
+            "btcturk": ["orderbook"]
         }
     }
\ No newline at end of file
@@ -0,0 +1,97 @@
+import pytest
+
+from src.live.arbitrage import ArbitrageScanner
+
+S = 10 ** 9
+
+
+def book(exchange, market, bids, asks, at=0):
+    return {"event": "orderbook", "exchange": exchange, "market": market, "fetch_time": at,
+            "bids": [[str(p), str(q)] for p, q in bids], "asks": [[str(p), str(q)] for p, q in asks]}
+
+
+@pytest.fixture
+def published():
+    return []
+
+
+@pytest.fixture
+def scanner(published):
+    scanner = ArbitrageScanner(
+        currency="EUR", fiats={"bitvavo": "EUR", "btcturk": "TRY"}, commissions={"bitvavo": 0.01, "btcturk": 0.01},
+        conversions={"TRY": [["btcturk", "USDT-TRY"], ["bitvavo", "USDT-EUR"]]}, sizes=[100, 1000, 10000],
+        emit_interval=1, max_book_age=5, publish=published.append)
+    # 30 TRY per EUR
+    scanner.update(book("btcturk", "USDT-TRY", [(29, 1000)], [(31, 1000)]))
+    scanner.update(book("bitvavo", "USDT-EUR", [(0.99, 1000)], [(1.01, 1000)]))
+    return scanner
+
+
+def add_btc_books(scanner, at=0):
+    scanner.update(book("bitvavo", "BTC-EUR", [(99, 10)], [(100, 10)], at=at))
+    # 110 and 105 EUR
+    scanner.update(book("btcturk", "BTC-TRY", [(3300, 1), (3150, 10)], [(3400, 10)], at=at))
+
+
+def test_ladder_spreads_after_commission_and_depth(scanner, published):
+    assert scanner.rate("TRY") == pytest.approx(1 / 30)
+    add_btc_books(scanner)
+    rows = scanner.extract_data()
+    assert [(row["exchange"], row["sell_exchange"], row["size"]) for row in rows] == \
+        [("bitvavo", "btcturk", 100), ("bitvavo", "btcturk", 1000)]
+    small, large = rows
+    # 1 BTC bought for 100 EUR, 0.99 after the commission, sold at 3300 TRY
+    assert small["amount"] == pytest.approx(0.99)
+    assert small["spread_bps"] == pytest.approx((0.99 * 110 * 0.99 / 100 - 1) * 10000)
+    # 9.9 BTC sold through two levels
+    assert large["profit"] == pytest.approx((3300 + 8.9 * 3150) * 0.99 / 30 - 1000)
+    assert large["market"] == "BTC"
+    assert large["currency"] == "EUR"
+    # 10000 EUR exceeds the depth of the asks and the reverse direction loses the spread
+    assert published == rows
+    assert len(scanner.current()) == 2
+
+
+def test_only_affected_assets_are_evaluated(scanner, mocker):
+    add_btc_books(scanner)
+    scanner.update(book("bitvavo", "ETH-EUR", [(99, 10)], [(100, 10)]))
+    evaluate = mocker.spy(scanner, "_evaluate")
+    scanner.update(book("bitvavo", "ETH-EUR", [(99, 10)], [(100, 10)]))
+    assert [call.args[0] for call in evaluate.call_args_list] == ["ETH"]
+    evaluate.reset_mock()
+    # the TRY conversion changes the assets with a TRY book only, USDT-TRY is one of them
+    scanner.update(book("btcturk", "USDT-TRY", [(29, 1000)], [(31, 1000)]))
+    assert sorted(call.args[0] for call in evaluate.call_args_list) == ["BTC", "USDT"]
+    evaluate.reset_mock()
+    # markets quoted in another asset are not scanned
+    scanner.update(book("bitvavo", "ETH-BTC", [(0.05, 10)], [(0.06, 10)]))
+    assert evaluate.call_count == 0
+
+
+def test_lasting_opportunities_are_emitted_every_interval(scanner):
+    add_btc_books(scanner)
+    assert len(scanner.extract_data()) == 2
+    add_btc_books(scanner, at=S // 2)
+    assert scanner.extract_data() == []
+    add_btc_books(scanner, at=S)
+    assert len(scanner.extract_data()) == 2
+    # the opportunity closes and opens again
+    scanner.update(book("btcturk", "BTC-TRY", [(2900, 10)], [(3400, 10)], at=S + 1))
+    assert scanner.current() == []
+    add_btc_books(scanner, at=S + 2)
+    assert len(scanner.extract_data()) == 2
+
+
+def test_stale_books_are_not_compared(scanner):
+    scanner.update(book("bitvavo", "BTC-EUR", [(99, 10)], [(100, 10)], at=0))
+    scanner.update(book("btcturk", "BTC-TRY", [(3300, 1)], [(3400, 10)], at=6 * S))
+    assert scanner.extract_data() == []
+
+
+def test_books_without_a_receive_time_are_not_compared(scanner):
+    scanner.update(book("bitvavo", "BTC-EUR", [(99, 10)], [(100, 10)], at=None))
+    scanner.update(book("btcturk", "BTC-TRY", [(3300, 1), (3150, 10)], [(3400, 10)], at=None))
+    assert scanner.extract_data() == []
+    # compared once the books have a receive time
+    add_btc_books(scanner)
+    assert len(scanner.extract_data()) == 2
@@ -0,0 +1,93 @@
+import math
+
+import pytest
+
+from src.live.bars import BarAggregator, parse_interval
+from src.writer.schemas import records_to_table, register_schema
+
+# 2023-08-01 10:00:00 UTC
+START_MS = 1690884000000
+NS_PER_MS = 1_000_000
+
+
+def trade(offset_ms, price, amount, side="buy", market="BTC-EUR"):
+    return {"event": "trades", "exchange": "bitvavo", "market": market, "id": str(offset_ms),
+            "timestamp": START_MS + offset_ms, "price": str(price), "amount": str(amount), "side": side,
+            "fetch_time": (START_MS + offset_ms) * NS_PER_MS}
+
+
+def test_time_bars_complete_once_the_watermark_passes():
+    bars = BarAggregator(intervals=["1s"], allowed_lateness=1.2)
+    bars.update(trade(100, 10, 1))
+    bars.update(trade(900, 12, 1, side="sell"))
+    bars.update(trade(1200, 11, 2))
+    assert bars.buffer == []
+    # arrives late, within the allowed lateness, and is older than the open
+    bars.update(trade(50, 9, 1))
+    bars.update(trade(2300, 11, 1))
+    (bar,) = bars.buffer
+    assert (bar["open"], bar["high"], bar["low"], bar["close"]) == (9, 12, 9, 12)
+    assert (bar["volume"], bar["buy_volume"], bar["trades"]) == (3, 2, 3)
+    assert bar["vwap"] == pytest.approx(31 / 3)
+    assert bar["start_time"] == START_MS * NS_PER_MS and bar["end_time"] == (START_MS + 1000) * NS_PER_MS
+    assert bar["timestamp"] == START_MS and bar["bar_size"] == "1s"
+
+    # its bar was emitted already
+    bars.update(trade(500, 100, 1))
+    assert bars.late_trades[("bitvavo", "BTC-EUR")] == 1
+
+
+def test_quiet_markets_are_completed_by_the_clock():
+    bars = BarAggregator(intervals=["1s", "1m"], allowed_lateness=1)
+    bars.update(trade(0, 10, 1))
+    assert bars.extract_data((START_MS + 1500) * NS_PER_MS) == []
+    rows = bars.extract_data((START_MS + 2000) * NS_PER_MS)
+    assert [row["bar_size"] for row in rows] == ["1s"]
+    rows = bars.extract_data((START_MS + 61000) * NS_PER_MS)
+    assert [row["bar_size"] for row in rows] == ["1m"]
+
+
+def test_trades_received_behind_the_clock_land_in_their_bar():
+    bars = BarAggregator(intervals=["1s"], allowed_lateness=5)
+    # received 10s after their exchange time, such as a backfill
+    behind = 10_000 * NS_PER_MS
+    first, second = trade(100, 10, 1), trade(600, 11, 1)
+    first["fetch_time"] += behind
+    second["fetch_time"] += behind
+    bars.update(first)
+    assert bars.extract_data(first["fetch_time"] + 500 * NS_PER_MS) == []
+    bars.update(second)
+    (bar,) = bars.extract_data(second["fetch_time"] + 6000 * NS_PER_MS)
+    assert (bar["open"], bar["close"], bar["trades"]) == (10, 11, 2)
+    assert not bars.late_trades
+
+
+def test_volume_and_notional_bars_per_market():
+    bars = BarAggregator(intervals=[], volume={"BTC-EUR": 2}, notional={"default": 100})
+    bars.update(trade(0, 10, 1.5))
+    bars.update(trade(10, 20, 1))
+    bars.update(trade(20, 30, 4, market="ETH-EUR"))
+    rows = bars.extract_data()
+    assert [(r["market"], r["bar_type"], r["bar_size"]) for r in rows] == [
+        ("BTC-EUR", "volume", "2"), ("ETH-EUR", "notional", "100")]
+    assert rows[0]["open"] == 10 and rows[0]["close"] == 20 and rows[0]["volume"] == 2.5
+    assert rows[0]["start_time"] == START_MS * NS_PER_MS
+    # the notional bar of BTC-EUR is still open at 35
+    assert bars.threshold_bars[("bitvavo", "BTC-EUR", "notional", "100")].notional == 35
+
+
+def test_bars_fit_their_schema():
+    bars = BarAggregator(intervals=["1s"], allowed_lateness=0)
+    bars.update(trade(0, 10, 0))
+    bars.update(trade(1000, 10, 1))
+    register_schema(bars.event_type, bars.schema())
+    table = records_to_table(bars.extract_data(START_MS * NS_PER_MS), "bars")
+    assert table.schema == bars.schema()
+    # a bar of trades without volume has no vwap
+    assert math.isnan(table.column("vwap")[0].as_py())
+
+
+def test_intervals_are_validated():
+    assert parse_interval("5m") == 300 * 10 ** 9
+    with pytest.raises(ValueError):
+        parse_interval("5x")
@@ -1,6 +1,9 @@
+import json
+
 import pytest
 
 from src.exchanges.exceptions import MissingApiKeyError
+from src.exchanges.bitvavo import CustomBitvavoWrapper
 
 
 def test_bitvavo_init(authenticated_bitvavo, unauthenticated_bitvavo):
@@ -54,4 +57,148 @@ def test_fetch_orderbook(mocker, unauthenticated_bitvavo, mock_orderbook_bitvavo
     assert orderbook["pair"] == "BTC-EUR"
 
     # Confirming the timestamp value (based on the current function implementation)
-    assert orderbook["timestamp"] is None
\ No newline at end of file
+    assert orderbook["timestamp"] is None
+
+def test_subscribe_batches_markets_and_event_types(mocker, unauthenticated_bitvavo):
+    """
+    Test that all event types are subscribed together with de-duplicated markets.
+    """
+    socket = mocker.Mock()
+    socket.is_socket_closed.return_value = False
+    unauthenticated_bitvavo.socket = socket
+    unauthenticated_bitvavo.subscribe(["orderbook", "trades"], ["BTC-EUR", "BTC_EUR", "ETH-EUR"])
+
+    socket.subscribe_channels.assert_called_once()
+    channels, batch_size = socket.subscribe_channels.call_args[0]
+    assert batch_size == 2
+    assert channels["book"][0] == ["BTC-EUR", "ETH-EUR"]
+    assert channels["trades"][1] == unauthenticated_bitvavo.ws_handlers["trades"].callback
+
+
+def test_websocket_sends_batched_subscriptions(mocker):
+    """
+    Test that the websocket sends one subscribe message per batch and a book snapshot request per market.
+    """
+    # skip connecting, only the subscription bookkeeping is tested
+    socket = CustomBitvavoWrapper.customWebSocket.__new__(CustomBitvavoWrapper.customWebSocket)
+    socket.callbacks, socket.localBook, socket.ws = {}, {}, None
+    socket.doSend = mocker.Mock()
+    book_callback, trades_callback = mocker.Mock(), mocker.Mock()
+    socket.subscribe_channels({"book": (["A-EUR", "B-EUR", "C-EUR"], book_callback),
+                               "trades": (["A-EUR"], trades_callback)}, batch_size=2)
+
+    messages = [json.loads(c[0][1]) for c in socket.doSend.call_args_list]
+    subscribes = [m for m in messages if m["action"] == "subscribe"]
+    assert subscribes[0]["channels"] == [{"name": "book", "markets": ["A-EUR", "B-EUR"]},
+                                         {"name": "trades", "markets": ["A-EUR"]}]
+    assert subscribes[1]["channels"] == [{"name": "book", "markets": ["C-EUR"]}]
+    assert [m["market"] for m in messages if m["action"] == "getBook"] == ["A-EUR", "B-EUR", "C-EUR"]
+    assert socket.callbacks["subscriptionBookUser"]["C-EUR"] is book_callback
+    assert socket.callbacks["subscriptionTrades"]["A-EUR"] is trades_callback
+
+    # a reconnect resubscribes everything in batches as well
+    socket.doSend.reset_mock()
+    socket.checkReconnect()
+    assert sum(json.loads(c[0][1])["action"] == "subscribe" for c in socket.doSend.call_args_list) == 2
+
+
+def test_reconnect_keeps_handlers_and_records_gaps(mocker, unauthenticated_bitvavo, mock_orderbook_bitvavo):
+    """
+    Test that resubscribing keeps the buffered data and that a reconnect is backfilled and recorded as a gap.
+    """
+    unauthenticated_bitvavo.socket = mocker.Mock()
+    unauthenticated_bitvavo.socket.is_socket_closed.return_value = False
+    unauthenticated_bitvavo.subscribe(["orderbook", "trades"], ["BTC-EUR"])
+    handler = unauthenticated_bitvavo.ws_handlers["orderbook"]
+    handler.callback(dict(mock_orderbook_bitvavo))
+
+    unauthenticated_bitvavo.subscribe(["orderbook"], ["BTC-EUR"])
+    assert unauthenticated_bitvavo.ws_handlers["orderbook"] is handler
+
+    mocker.patch.object(unauthenticated_bitvavo.wrapper, "book", return_value=dict(mock_orderbook_bitvavo))
+    public_trades = mocker.patch.object(unauthenticated_bitvavo.wrapper, "publicTrades", side_effect=[
+        [{"id": "2", "timestamp": 1_500, "amount": "1", "price": "10", "side": "sell"},
+         {"id": "1", "timestamp": 1_200, "amount": "1", "price": "10", "side": "buy"}],
+        [{"id": "1", "timestamp": 1_200, "amount": "1", "price": "10", "side": "buy"}],
+    ])
+    unauthenticated_bitvavo.resync(1_000_000_000, 2_000_000_000)
+    # a full page is followed by a page ending at its oldest trade
+    assert public_trades.call_args[0][1] == {"start": 1_000, "end": 1_200, "limit": 2}
+
+    data = unauthenticated_bitvavo.extract_data()
+    assert len(data["orderbook"]) == 2
+    assert [trade["id"] for trade in data["trades"]] == ["1", "2"]
+    assert {(gap["event_type"], gap["market"], gap["backfilled"]) for gap in data["gaps"]} == {
+        ("orderbook", "BTC-EUR", True), ("trades", "BTC-EUR", True)
+    }
+    assert all(gap["gap_end"] - gap["gap_start"] == 1_000_000_000 for gap in data["gaps"])
+
+
+def test_trades_backfill_is_partial_at_page_limit(mocker, unauthenticated_bitvavo):
+    """
+    Test that a gap with more trades than the page limit is not recorded as filled.
+    """
+    unauthenticated_bitvavo.socket = mocker.Mock()
+    unauthenticated_bitvavo.socket.is_socket_closed.return_value = False
+    unauthenticated_bitvavo.subscribe(["trades"], ["BTC-EUR"])
+    trade = lambda i: {"id": str(i), "timestamp": 1_000 + i, "amount": "1", "price": "10", "side": "buy"}
+    # every page is full, the third one reaches the page limit before the start of the gap
+    mocker.patch.object(unauthenticated_bitvavo.wrapper, "publicTrades",
+                        side_effect=[[trade(i), trade(i - 1)] for i in (10, 8, 6)])
+    unauthenticated_bitvavo.resync(1_000_000_000, 2_000_000_000)
+
+    data = unauthenticated_bitvavo.extract_data()
+    assert len(data["trades"]) == 6
+    assert [gap["backfilled"] for gap in data["gaps"]] == [False]
+
+
+def test_nonce_gap_requests_a_new_book_snapshot(mocker):
+    """
+    Test that a book update skipping a nonce drops the local book and requests a snapshot.
+    """
+    socket = CustomBitvavoWrapper.customWebSocket.__new__(CustomBitvavoWrapper.customWebSocket)
+    socket.callbacks, socket.localBook, socket.ws = {}, {}, None
+    socket.doSend = mocker.Mock()
+    callback = mocker.Mock()
+    socket._register_subscription("book", ["A-EUR"], callback)
+
+    # updates before the snapshot are ignored
+    socket.callbacks["subscriptionBook"]["A-EUR"](None, {"event": "book", "market": "A-EUR", "nonce": 1, "bids": [], "asks": []})
+    assert not callback.called
+    socket.callbacks["subscriptionBook"]["A-EUR"](None, {"action": "getBook", "response": {
+        "market": "A-EUR", "nonce": 5, "bids": [["10", "1"]], "asks": [["11", "1"]]}})
+    socket.callbacks["subscriptionBook"]["A-EUR"](None, {"event": "book", "market": "A-EUR", "nonce": 6,
+                                                         "bids": [["10.5", "2"]], "asks": []})
+    assert callback.call_args[0][0]["bids"] == [["10.5", "2"], ["10", "1"]]
+
+    socket.callbacks["subscriptionBook"]["A-EUR"](None, {"event": "book", "market": "A-EUR", "nonce": 8, "bids": [], "asks": []})
+    assert callback.call_count == 2
+    assert json.loads(socket.doSend.call_args[0][1]) == {"action": "getBook", "market": "A-EUR"}
+    assert socket.localBook["A-EUR"] == {}
+
+
+def test_stalled_stream_is_resubscribed_and_recorded(mocker, unauthenticated_bitvavo):
+    """
+    Test that a stall resubscribes only the stalled market and records a stall gap.
+    """
+    unauthenticated_bitvavo.socket = mocker.Mock()
+    unauthenticated_bitvavo.socket.is_socket_closed.return_value = False
+    unauthenticated_bitvavo.subscribe(["trades"], ["BTC-EUR", "ETH-EUR"])
+    mocker.patch.object(unauthenticated_bitvavo.wrapper, "publicTrades", return_value=[])
+
+    unauthenticated_bitvavo._recover_stream("trades", "ETH-EUR", 1_000_000_000, 2_000_000_000)
+    unauthenticated_bitvavo.socket.resubscribe_market.assert_called_once_with("trades", "ETH-EUR")
+    gaps = unauthenticated_bitvavo.extract_data()["gaps"]
+    assert [(gap["market"], gap["reason"], gap["backfilled"]) for gap in gaps] == [("ETH-EUR", "stall", True)]
+
+
+def test_fetch_trades_normalizes_the_public_trades(mocker, unauthenticated_bitvavo):
+    public_trades = mocker.patch.object(unauthenticated_bitvavo.wrapper, "publicTrades", return_value=[
+        {"id": "2", "timestamp": 20, "amount": "0.2", "price": "101", "side": "sell"},
+        {"id": "1", "timestamp": 10, "amount": "0.1", "price": "100", "side": "buy"},
+    ])
+    trades = unauthenticated_bitvavo.fetch_trades("BTC-EUR", since=10)
+    public_trades.assert_called_once_with("BTC-EUR", {"start": 10})
+    assert [(t["id"], t["market"], t["exchange"], t["event"]) for t in trades] == [
+        ("1", "BTC-EUR", "bitvavo", "trades"), ("2", "BTC-EUR", "bitvavo", "trades")]
+    assert all("fetch_time" in t for t in trades)
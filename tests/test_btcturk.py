@@ -1,5 +1,8 @@
+import json
+
 import pytest
 
+from src.exchanges.btcturk import BtcTurkWebSocket
 from src.exchanges.exceptions import MissingApiKeyError
 
 
@@ -54,4 +57,78 @@ def test_fetch_orderbook(mocker, unauthenticated_btcturk, mock_orderbook_btcturk
     assert orderbook["pair"] == "BTC-TRY"
 
     # Confirming the timestamp value (based on the current function implementation)
-    assert orderbook["timestamp"] is not None
\ No newline at end of file
+    assert orderbook["timestamp"] is not None
+
+def test_subscribe(mocker, unauthenticated_btcturk):
+    """
+    Test that subscribing registers one handler per event type on a single socket.
+    """
+    socket = mocker.patch("src.exchanges.btcturk.BtcTurkWebSocket").return_value
+    socket.is_socket_closed.return_value = False
+    unauthenticated_btcturk.subscribe(["orderbook", "trades", "ticker"], ["BTC-TRY", "ETH_TRY"])
+
+    assert set(unauthenticated_btcturk.ws_handlers) == {"orderbook", "trades", "ticker"}
+    assert socket.subscription.call_count == 6
+    socket.subscription.assert_any_call("trades", "BTCTRY", unauthenticated_btcturk.ws_handlers["trades"].callback)
+    assert not unauthenticated_btcturk.is_socket_closed()
+
+
+def test_ws_handler_normalizes_messages(mocker, unauthenticated_btcturk):
+    """
+    Test that BtcTurk push messages are buffered with the same columns as Bitvavo.
+    """
+    mocker.patch("src.exchanges.btcturk.BtcTurkWebSocket")
+    unauthenticated_btcturk.subscribe(["orderbook", "trades", "ticker"], ["BTC-TRY"])
+    handlers = unauthenticated_btcturk.ws_handlers
+
+    handlers["orderbook"].callback({"CS": 7, "PS": "BTCTRY",
+                                    "AO": [{"A": "0.1", "P": "101"}], "BO": [{"A": "0.2", "P": "100"}]})
+    handlers["trades"].callback({"I": 123, "A": "0.01", "P": "100", "D": "1690998560339", "PS": "BTCTRY", "S": 1})
+    handlers["ticker"].callback({"PS": "BTCTRY", "B": "100", "A": "101", "LA": "100.5"})
+    data = unauthenticated_btcturk.extract_data()
+
+    book = data["orderbook"][0]
+    assert book["market"] == "BTC-TRY"
+    assert book["bids"] == [["100", "0.2"]] and book["asks"] == [["101", "0.1"]]
+    trade = data["trades"][0]
+    assert trade["id"] == "123" and trade["side"] == "sell" and trade["timestamp"] == 1690998560339
+    ticker = data["ticker"][0]
+    assert ticker["bestBid"] == "100" and ticker["bestBidSize"] is None
+    assert all(x[0]["exchange"] == "btcturk" for x in data.values())
+
+
+def test_trades_backfill_is_partial_without_reaching_gap_start(mocker, unauthenticated_btcturk):
+    """
+    Test that a gap longer than the latest trades returned by the endpoint is not recorded as filled.
+    """
+    socket = mocker.patch("src.exchanges.btcturk.BtcTurkWebSocket").return_value
+    socket.is_socket_closed.return_value = False
+    unauthenticated_btcturk.subscribe(["trades"], ["BTC-TRY"])
+    trades = [{"tid": str(i), "amount": "1", "price": "10", "date": 1_000 + i, "side": "buy"} for i in (9, 8)]
+    mocker.patch("src.exchanges.btcturk.fetch_json", return_value={"data": trades})
+
+    unauthenticated_btcturk.resync(1_000_000_000, 2_000_000_000)
+    data = unauthenticated_btcturk.extract_data()
+    assert [trade["id"] for trade in data["trades"]] == ["8", "9"]
+    assert [gap["backfilled"] for gap in data["gaps"]] == [False]
+
+
+def test_websocket_resubscribes_registered_pairs_on_open(mocker):
+    """
+    Test that opening the socket subscribes every registered pair once, also for pairs registered meanwhile.
+    """
+    mocker.patch.object(BtcTurkWebSocket, "start")
+    socket = BtcTurkWebSocket("wss://mock_ws_endpoint")
+    socket.ws = mocker.Mock()
+    socket.subscription("trades", "BTCTRY", mocker.Mock())
+    assert not socket.ws.send.called
+
+    # a pair registered while on_open is subscribing must not break the loop
+    sent = []
+    def send(message):
+        sent.append(json.loads(message)[1]["event"])
+        if len(sent) == 1:
+            socket.subscription("trades", "ETHTRY", mocker.Mock())
+    socket.ws.send.side_effect = send
+    socket.on_open(socket.ws)
+    assert sorted(sent) == ["BTCTRY", "ETHTRY"]
@@ -0,0 +1,15 @@
+from src.utils import config_loader
+from src.utils.config_loader import invalidate_config, load_config_by_name
+
+
+def test_config_is_parsed_once_and_copied(mocker):
+    invalidate_config()
+    safe_load = mocker.spy(config_loader.yaml, "safe_load")
+    config = load_config_by_name("bitvavo")
+    config["name"] = "changed"
+    assert load_config_by_name("BITVAVO")["name"] == "bitvavo"
+    assert safe_load.call_count == 1
+
+    invalidate_config("bitvavo")
+    load_config_by_name("bitvavo")
+    assert safe_load.call_count == 2
@@ -0,0 +1,66 @@
+from src.utils.clock import now_ns
+from src.ws_handlers.bitvavo import BitvavoWSHandler
+from src.ws_handlers.conflation import OrderbookConflator
+
+S = 10 ** 9
+
+
+def book(at, bid=100.0, ask=101.0, market="BTC-EUR", second_bid=99.0):
+    return {"event": "orderbook", "market": market, "fetch_time": at,
+            "bids": [[str(bid), "1"], [str(second_bid), "1"]], "asks": [[str(ask), "1"], [str(ask + 1), "1"]]}
+
+
+def test_latest_book_is_persisted_once_the_interval_passed():
+    conflator = OrderbookConflator(interval=1, mid_change_bps=None)
+    assert conflator.offer(book(0))
+    assert not conflator.offer(book(S // 10))
+    latest = book(S // 2, bid=100.5)
+    assert not conflator.offer(latest)
+    assert conflator.due(S // 2) == []
+    assert conflator.due(S) == [latest]
+    # the pending book was persisted, the interval restarts at its fetch time
+    assert not conflator.offer(book(S + S // 10))
+    assert conflator.offer(book(S // 2 + S))
+    stats = conflator.stats()
+    assert stats["received"] == 5
+    # the book at S + S // 10 was superseded before its interval passed
+    assert stats["conflated"] == 2
+    assert stats["persisted"] == {"first": 1, "interval": 2}
+
+
+def test_significant_changes_are_persisted_immediately():
+    conflator = OrderbookConflator(interval=60, mid_change_bps=10, intervals={"ETH-EUR": 0})
+    assert conflator.offer(book(0))
+    # 5 bps mid move
+    assert not conflator.offer(book(1, bid=100.0, ask=101.1))
+    assert conflator.offer(book(2, bid=100.2, ask=102.0))
+    # per market interval
+    assert conflator.offer(book(3, market="ETH-EUR"))
+    assert conflator.offer(book(4, market="ETH-EUR"))
+    assert conflator.persisted_by["mid_change"] == 1
+    assert conflator.pop_conflated_counts() == {"BTC-EUR": 1}
+    assert conflator.pop_conflated_counts() == {}
+
+    conflator = OrderbookConflator(interval=60, mid_change_bps=None, top_levels=1)
+    assert conflator.offer(book(0))
+    # a new best bid
+    assert conflator.offer(book(1, bid=100.05))
+    # a change below the top levels
+    assert not conflator.offer(book(2, bid=100.05, second_bid=98.0))
+    assert conflator.persisted_by["top_levels"] == 1
+
+
+def test_handler_writes_conflated_books_and_publishes_every_update(mocker):
+    handler = BitvavoWSHandler("orderbook", mocker.Mock())
+    handler.conflator = OrderbookConflator(interval=3600, mid_change_bps=None)
+    published = []
+    handler.bus.subscribe(published.append)
+    start = now_ns()
+    for at in range(5):
+        handler.append_data_callback(book(start + at))
+    assert len(published) == 5
+    assert [b["fetch_time"] for b in handler.extract_data()] == [start]
+    assert handler.pop_conflated_counts() == {"BTC-EUR": 3}
+    # the stall watchdog still sees every update
+    assert handler.stream_stats()[0] == {"BTC-EUR": 5}
+    assert handler.conflation_stats()["conflated"] == 3
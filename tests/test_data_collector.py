@@ -1,3 +1,4 @@
+import base64
 from src.exchanges.btcturk import BtcTurk
 from src.exchanges.bitvavo import Bitvavo
 import pytest
@@ -29,4 +30,86 @@ def test_data_collector_fetch_orderbooks(mocker, mock_config_data_collector):
     for ob in orderbooks:
         assert "fetch_time" in ob
         assert "bids" in ob and "asks" in ob
-        assert "exchange" in ob
\ No newline at end of file
+        assert "exchange" in ob
+
+@pytest.mark.parametrize("mock_config_data_collector", ["sync"], indirect=True)
+def test_polled_trades_are_new_trades_only(mocker, mock_config_data_collector, unauthenticated_bitvavo,
+                                           unauthenticated_btcturk):
+    config = dict(mock_config_data_collector, event_types={"bitvavo": ["orderbook", "trades"], "btcturk": ["orderbook"]})
+    dc = DataCollector(exchanges=[unauthenticated_bitvavo, unauthenticated_btcturk], config=config)
+    trade = {"event": "trades", "exchange": "bitvavo", "market": "BTC-EUR", "price": "1", "amount": "1", "side": "buy"}
+    fetch_trades = mocker.patch.object(unauthenticated_bitvavo, "fetch_trades", side_effect=[
+        [dict(trade, id="a", timestamp=1), dict(trade, id="b", timestamp=2)],
+        [dict(trade, id="b", timestamp=2), dict(trade, id="c", timestamp=2)],
+    ])
+
+    assert [t["id"] for t in dc.fetch_trades()] == ["a", "b"]
+    assert [t["id"] for t in dc.fetch_trades()] == ["c"]
+    assert fetch_trades.call_args_list == [mocker.call("BTC-EUR", None), mocker.call("BTC-EUR", 2)]
+
+
+@pytest.mark.parametrize("mock_config_data_collector", ["sync"], indirect=True)
+def test_polled_books_are_published(mocker, mock_config_data_collector, unauthenticated_bitvavo,
+                                    unauthenticated_btcturk):
+    config = dict(mock_config_data_collector, features={"enabled": True, "windows": [10], "depth_levels": [1],
+                                                        "emit_interval": 0})
+    dc = DataCollector(exchanges=[unauthenticated_bitvavo, unauthenticated_btcturk], config=config)
+    for exchange in (unauthenticated_bitvavo, unauthenticated_btcturk):
+        mocker.patch.object(exchange, "fetch_orderbook", side_effect=lambda pair, limit, name=exchange.name: {
+            "bids": [[100.0, 1.0]], "asks": [[102.0, 1.0]], "timestamp": None, "pair": pair, "exchange": name})
+    books = []
+    dc.bus.subscribe(books.append, event_types=["orderbook"])
+
+    dc.fetch_orderbooks()
+    dc.fetch_orderbooks()
+    assert [(book["exchange"], book["market"]) for book in books[:2]] == [("bitvavo", "BTC-EUR"), ("btcturk", "BTC-TRY")]
+    features = dc._add_derived_data({})["features"]
+    assert {(row["exchange"], row["market"], row["mid"]) for row in features} == \
+        {("bitvavo", "BTC-EUR", 101), ("btcturk", "BTC-TRY", 101)}
+
+
+@pytest.mark.parametrize("mock_config_data_collector", ["websocket"], indirect=True)
+def test_valuation_and_arbitrage_stages_consume_the_books(mocker, mock_config_data_collector, unauthenticated_bitvavo,
+                                                          unauthenticated_btcturk):
+    mocker.patch.object(DataCollector, "_initialize_websocket")
+    mocker.patch.object(unauthenticated_bitvavo, "fetch_balance", return_value={"BTC": {"total": 1, "available": 1}})
+    mocker.patch.object(unauthenticated_btcturk, "fetch_balance", side_effect=RuntimeError("no api keys"))
+    fiat = unauthenticated_bitvavo.exchange_fiat
+    config = dict(mock_config_data_collector, portfolio={"enabled": True, "currency": fiat, "emit_interval": 0},
+                  arbitrage={"enabled": True, "currency": fiat, "sizes": [10], "emit_interval": 0})
+    dc = DataCollector(exchanges=[unauthenticated_bitvavo, unauthenticated_btcturk], config=config)
+    arbitrage = []
+    dc.bus.subscribe(arbitrage.append, event_types=["arbitrage"])
+
+    market = f"BTC-{fiat}"
+    for fetch_time in (1, 2):
+        dc.bus.publish({"event": "orderbook", "exchange": "bitvavo", "market": market, "fetch_time": fetch_time,
+                        "bids": [["100", "1"]], "asks": [["101", "1"]]})
+    data = dc._combine_data_across_exchanges()
+    assert data["portfolio"][0]["mark_value"] == pytest.approx(100.5)
+    # the books of one exchange have nothing to compare with
+    assert "arbitrage" not in data and arbitrage == []
+
+
+@pytest.mark.parametrize("mock_config_data_collector", ["websocket"], indirect=True)
+def test_refresh_balances_values_btcturk_holdings(mocker, mock_config_data_collector, unauthenticated_bitvavo,
+                                                  authenticated_btcturk):
+    mocker.patch.object(DataCollector, "_initialize_websocket")
+    mocker.patch.object(unauthenticated_bitvavo, "fetch_balance", return_value={})
+    # the private key is base64 encoded
+    authenticated_btcturk.private_key = base64.b64encode(b"private key").decode()
+    fetch_json = mocker.patch("src.exchanges.btcturk.fetch_json", return_value={"data": [
+        {"asset": "BTC", "assetname": "Bitcoin", "balance": "0.5", "locked": "0.1", "free": "0.4"},
+        {"asset": "TRY", "assetname": "Türk Lirası", "balance": "1000", "locked": "0", "free": "1000"},
+    ]})
+    config = dict(mock_config_data_collector, portfolio={"enabled": True, "currency": "TRY", "emit_interval": 0})
+    dc = DataCollector(exchanges=[unauthenticated_bitvavo, authenticated_btcturk], config=config)
+
+    assert fetch_json.call_args.args[0] == "http://mock_endpoint/mock_balance"
+    assert dc.portfolio.balances["btcturk"] == {"BTC": {"total": 0.5, "available": 0.4},
+                                                "TRY": {"total": 1000.0, "available": 1000.0}}
+    assert dc.portfolio.holdings == [("btcturk", "BTC", 0.5), ("btcturk", "TRY", 1000.0)]
+    dc.portfolio.update({"event": "orderbook", "exchange": "btcturk", "market": "BTC-TRY", "fetch_time": 1,
+                         "bids": [["3000", "1"]], "asks": [["3100", "1"]]})
+    btcturk = next(row for row in dc.portfolio.valuation() if row["exchange"] == "btcturk")
+    assert btcturk["mark_value"] == pytest.approx(1000 + 0.5 * 3050)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+
+from src.utils.clock import now_ns
+from src.utils.event_bus import EventBus
+from src.ws_handlers.bitvavo import BitvavoWSHandler
+
+
+def event(event_type="trades", exchange="bitvavo", market="BTC-EUR"):
+    return {"event": event_type, "exchange": exchange, "market": market, "fetch_time": now_ns()}
+
+
+def test_consumers_get_the_same_object_of_their_events():
+    bus = EventBus()
+    trades, bitvavo_eth = [], []
+    bus.subscribe(trades.append, name="trades", event_types=["trades"])
+    bus.subscribe(bitvavo_eth.append, name="eth", exchanges=["bitvavo"], markets=["ETH-EUR"])
+    published = [event(), event("ticker", market="ETH-EUR"), event(exchange="btcturk", market="ETH-EUR")]
+    for e in published:
+        bus.publish(e)
+
+    assert trades[0] is published[0] and trades[1] is published[2] and len(trades) == 2
+    assert bitvavo_eth == [published[1]]
+    stats = bus.stats()
+    assert stats["consumers"]["trades"]["handled"] == 2
+    assert stats["handler_overhead"]["trades"]["count"] == 2
+
+
+def test_a_failing_consumer_does_not_stop_the_others(mocker):
+    bus = EventBus()
+    received = []
+    bus.subscribe(mocker.Mock(side_effect=RuntimeError("consumer bug")), name="broken")
+    bus.subscribe(received.append)
+    bus.publish(event())
+    assert len(received) == 1 and bus.stats()["consumers"]["broken"]["errors"] == 1
+
+
+def test_threaded_consumers_do_not_block_the_publisher():
+    bus = EventBus()
+    release = threading.Event()
+    received = []
+
+    def slow(e):
+        release.wait(10)
+        received.append(e)
+
+    subscription = bus.subscribe(slow, name="slow", threaded=True, max_queue=10)
+    for _ in range(50):
+        bus.publish(event())
+    # one event is being handled, ten are queued
+    assert subscription.dropped >= 39
+    release.set()
+    bus.close()
+    assert len(received) == 50 - subscription.dropped
+    assert subscription.stats()["lag"]["count"] == len(received)
+
+
+def test_coroutine_consumers_run_on_their_loop():
+    bus = EventBus()
+    loop = asyncio.new_event_loop()
+    received = []
+
+    async def consume(e):
+        received.append((e, threading.current_thread()))
+
+    bus.subscribe(consume, loop=loop)
+    bus.publish(event())
+    loop.run_until_complete(asyncio.sleep(0.05))
+    loop.close()
+    assert received[0][1] is threading.current_thread()
+
+
+def test_handlers_of_an_exchange_share_its_bus(mocker):
+    bus = EventBus()
+    trades = BitvavoWSHandler("trades", mocker.Mock())
+    ticker = BitvavoWSHandler("ticker", mocker.Mock())
+    trades.bus = ticker.bus = bus
+    received = []
+    bus.subscribe(received.append, event_types=["ticker"])
+    trades.callback({"id": "1", "amount": "0.1", "price": "100", "timestamp": 1, "market": "BTC-EUR", "side": "buy"})
+    ticker.callback({"market": "BTC-EUR", "bestBid": "100"})
+    assert [e["event"] for e in received] == ["ticker"]
+    # the writer's buffer is filled independently of the consumers
+    assert len(trades.extract_data()) == 1
@@ -0,0 +1,77 @@
+import math
+
+import pytest
+
+from src.live.features import FeatureEngine
+from src.writer.schemas import records_to_table
+
+SECOND = 10 ** 9
+START = 1690884000 * SECOND
+
+
+def book(time_ns, bid, ask, market="BTC-EUR", sizes=("1", "3")):
+    return {"event": "orderbook", "exchange": "bitvavo", "market": market, "fetch_time": time_ns,
+            "bids": [[str(bid), sizes[0]], [str(bid - 1), "1"]], "asks": [[str(ask), sizes[1]], [str(ask + 1), "1"]]}
+
+
+def trade(time_ns, price, amount, side="buy", market="BTC-EUR"):
+    return {"event": "trades", "exchange": "bitvavo", "market": market, "fetch_time": time_ns,
+            "price": str(price), "amount": str(amount), "side": side}
+
+
+def test_book_features_of_the_latest_book():
+    engine = FeatureEngine(windows=[10], depth_levels=[1, 2])
+    engine.update(book(START, 100, 102))
+    engine.update(trade(START + 2 * SECOND, 101, 1))
+    (row,) = engine.extract_data()
+    assert (row["mid"], row["spread"]) == (101, 2)
+    # weighted towards the ask, the side with less size on the bid
+    assert row["microprice"] == pytest.approx((100 * 3 + 102 * 1) / 4)
+    assert row["imbalance_1"] == pytest.approx(-0.5) and row["imbalance_2"] == pytest.approx(-2 / 6)
+
+
+def test_book_features_without_size_are_null():
+    engine = FeatureEngine(windows=[10], depth_levels=[1])
+    engine.update(book(START, 100, 102, sizes=("0", "0")))
+    engine.update(trade(START + 2 * SECOND, 101, 1))
+    (row,) = engine.extract_data()
+    assert row["mid"] == 101
+    assert row["microprice"] is None and row["imbalance_1"] is None
+
+
+def test_windows_keep_only_their_trades():
+    engine = FeatureEngine(windows=[2, 10], depth_levels=[1], emit_interval=100)
+    engine.update(trade(START, 100, 1))
+    engine.update(trade(START + 5 * SECOND, 110, 3, side="sell"))
+    engine.update(trade(START + 6 * SECOND, 120, 1, market="ETH-EUR"))
+    features = engine.window_features(START + 6 * SECOND)
+    btc, eth = engine.markets[("bitvavo", "BTC-EUR")], engine.markets[("bitvavo", "ETH-EUR")]
+    assert features["volume_2s"][btc] == 3 and features["volume_10s"][btc] == 4
+    assert features["vwap_10s"][btc] == pytest.approx((100 + 330) / 4)
+    assert features["signed_volume_10s"][btc] == -2 and features["trades_10s"][eth] == 1
+    # the ring slot of START is reused 10 buckets later
+    engine.update(trade(START + 10 * SECOND, 90, 2))
+    assert engine.window_features(START + 10 * SECOND)["volume_10s"][btc] == 5
+    assert math.isnan(engine.window_features(START + 30 * SECOND)["vwap_2s"][btc])
+
+
+def test_realized_volatility_of_the_mid():
+    engine = FeatureEngine(windows=[60], depth_levels=[1])
+    for i, mid in enumerate([100, 101, 100]):
+        engine.update(book(START + i * SECOND // 10, mid - 1, mid + 1))
+    expected = math.sqrt(math.log(101 / 100) ** 2 + math.log(100 / 101) ** 2)
+    assert engine.window_features(START)["realized_vol_60s"][0] == pytest.approx(expected)
+
+
+def test_rows_fit_the_features_schema():
+    engine = FeatureEngine(windows=[10], depth_levels=[1], initial_markets=1)
+    engine.update(trade(START, 100, 1))
+    engine.update(book(START, 100, 102, market="ETH-EUR"))
+    engine.update(trade(START + SECOND, 100, 1))
+    rows = engine.extract_data()
+    assert len(rows) == 2 and engine.capacity == 2
+    from src.writer.schemas import register_schema
+    register_schema("features", engine.schema())
+    table = records_to_table(rows, "features")
+    assert table.schema == engine.schema()
+    assert table.column("mid").to_pylist() == [None, 101.0]
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from src.live.feed import FeedClient, FeedServer, decode_event, encode_event
+
+TRADE = {"event": "trades", "exchange": "bitvavo", "market": "BTC-EUR", "id": "abc", "timestamp": 1690884000000,
+         "price": "27000.5", "amount": "0.1", "side": "sell", "fetch_time": 1690884000001000000}
+BOOK = {"event": "orderbook", "exchange": "btcturk", "market": "BTC-TRY", "timestamp": 1690884000000, "nonce": 7,
+        "bids": [["100", "1"], ["99", "2"]], "asks": [["101", "3"]], "fetch_time": 5}
+TICKER = {"event": "ticker", "exchange": "bitvavo", "market": "ETH-EUR", "bestBid": "1800", "bestBidSize": "2",
+          "bestAsk": "1801", "fetch_time": 6}
+
+
+@pytest.fixture
+def server(tmp_path):
+    server = FeedServer(str(tmp_path / "feed.sock"), max_queue=5)
+    server.start()
+    yield server
+    server.stop()
+
+
+def wait_for_subscribers(server, count):
+    deadline = time.time() + 5
+    while len(server.subscribers) < count and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(server.subscribers) == count
+
+
+def test_events_round_trip_the_binary_encoding():
+    assert decode_event(encode_event(TRADE)) == dict(TRADE, price=27000.5, amount=0.1)
+    assert decode_event(encode_event(BOOK)) == dict(BOOK, bids=[[100, 1], [99, 2]], asks=[[101, 3]])
+    assert decode_event(encode_event(TICKER)) == dict(TICKER, bestBid=1800, bestBidSize=2, bestAsk=1801,
+                                                      bestAskSize=None, lastPrice=None)
+    # ids longer than 255 bytes, such as concatenated or hashed ids
+    long_id = dict(TRADE, id="x" * 1000)
+    assert decode_event(encode_event(long_id)) == dict(long_id, price=27000.5, amount=0.1)
+
+
+def test_subscribers_receive_the_events_of_their_filter(server):
+    trades = FeedClient(server.path, event_types=["trades"])
+    bitvavo = FeedClient(server.path, exchanges=["bitvavo"])
+    wait_for_subscribers(server, 2)
+    for event in (TRADE, BOOK, TICKER, {"event": "subscribed"}):
+        server.publish(event)
+    assert trades.recv()["id"] == "abc"
+    assert [bitvavo.recv()["event"], bitvavo.recv()["event"]] == ["trades", "ticker"]
+    server.stop()
+    assert trades.recv() is None and bitvavo.recv() is None
+
+
+def test_a_slow_subscriber_misses_frames_without_blocking_publish(server):
+    client = FeedClient(server.path)
+    wait_for_subscribers(server, 1)
+    (subscriber,) = server.subscribers
+    # the subscriber stops reading
+    release = threading.Event()
+    sock = subscriber.sock
+
+    class StuckSocket:
+        def sendall(self, data):
+            release.wait(10)
+            sock.sendall(data)
+
+        def __getattr__(self, name):
+            return getattr(sock, name)
+
+    subscriber.sock = StuckSocket()
+    start = time.perf_counter()
+    for i in range(100):
+        server.publish(dict(TRADE, id=str(i)))
+    assert time.perf_counter() - start < 1
+    assert subscriber.dropped > 0 and subscriber.seq == 100
+    release.set()
+    received = [client.recv()["id"] for _ in range(100 - subscriber.dropped)]
+    assert received == sorted(received, key=int) and received[0] == "0"
+    # the next frame shows the client the gap
+    server.publish(dict(TRADE, id="next"))
+    assert client.recv()["id"] == "next" and client.missed == subscriber.dropped
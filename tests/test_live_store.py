@@ -0,0 +1,80 @@
+import json
+import math
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from src.live.api import LiveApi
+from src.live.rolling_store import RollingStore
+from src.utils.clock import now_ns
+
+NS_PER_SECOND = 10 ** 9
+
+
+def trade(fetch_time, price="100", market="BTC-EUR"):
+    return {"event": "trades", "exchange": "bitvavo", "market": market, "id": "1", "timestamp": fetch_time // 10 ** 6,
+            "price": price, "amount": "0.5", "side": "sell", "fetch_time": fetch_time}
+
+
+def test_events_are_queried_by_receive_time():
+    store = RollingStore(window_seconds=60, orderbook_depth=2)
+    now = now_ns()
+    for i in range(5):
+        store.append(trade(now - (5 - i) * NS_PER_SECOND, price=str(100 + i)))
+    store.append(trade(now, market="ETH-EUR"))
+    store.append({"event": "ticker", "exchange": "bitvavo", "market": "BTC-EUR", "fetch_time": now,
+                  "bestBid": "99.5", "bestBidSize": None})
+    store.append({"event": "orderbook", "exchange": "bitvavo", "market": "BTC-EUR", "fetch_time": now, "nonce": 7,
+                  "bids": [["99", "1"]], "asks": [["101", "2"], ["102", "3"], ["103", "4"]]})
+
+    trades = store.query("bitvavo", "BTC-EUR", "trades", start_ns=now - 3 * NS_PER_SECOND)
+    assert trades["price"].tolist() == [102.0, 103.0, 104.0]
+    assert trades["side"].tolist() == [-1] * 3 and trades["amount"].dtype == np.float64
+
+    ticker = store.query("bitvavo", "BTC-EUR", "ticker")
+    assert ticker["bestBid"][0] == 99.5 and math.isnan(ticker["bestBidSize"][0])
+    book = store.query("bitvavo", "BTC-EUR", "orderbook")
+    assert book["asks"].shape == (1, 2, 2) and book["asks"][0].tolist() == [[101.0, 2.0], [102.0, 3.0]]
+    assert np.isnan(book["bids"][0, 1]).all()
+
+    assert store.query("bitvavo", "XRP-EUR", "trades")["price"].shape == (0,)
+    assert sorted(store.keys()) == [("bitvavo", "BTC-EUR", "orderbook"), ("bitvavo", "BTC-EUR", "ticker"),
+                                    ("bitvavo", "BTC-EUR", "trades"), ("bitvavo", "ETH-EUR", "trades")]
+
+
+def test_buffers_keep_the_window_and_overwrite_older_rows():
+    store = RollingStore(window_seconds=10, initial_capacity=2, max_capacity=64)
+    now = now_ns()
+    # 20 s of data, one row a second: the buffer grows while its rows are in the window
+    for i in range(20):
+        store.append(trade(now - (19 - i) * NS_PER_SECOND, price=str(i)))
+    buffer = store.series[("bitvavo", "BTC-EUR", "trades")]
+    assert buffer.capacity == 16
+    # only the window is returned, oldest first
+    assert store.query("bitvavo", "BTC-EUR", "trades")["price"].tolist() == [float(i) for i in range(10, 20)]
+
+
+def test_live_api_serves_arrow_and_json():
+    store = RollingStore()
+    now = now_ns()
+    store.append(trade(now))
+    api = LiveApi(store, port=0)
+    api.start()
+    base = f"http://127.0.0.1:{api.port}"
+    try:
+        with urllib.request.urlopen(f"{base}/series") as response:
+            assert json.load(response) == [{"exchange": "bitvavo", "market": "BTC-EUR", "event_type": "trades"}]
+        query = f"{base}/query?exchange=bitvavo&market=BTC-EUR&event_type=trades&start={now - 1}"
+        with urllib.request.urlopen(query) as response:
+            table = pa.ipc.open_stream(response.read()).read_all()
+        assert table.column("price").to_pylist() == [100.0] and table.column("fetch_time")[0].as_py() == now
+        with urllib.request.urlopen(query + "&format=json") as response:
+            assert json.load(response)["amount"] == [0.5]
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"{base}/query?exchange=bitvavo&market=BTC-EUR&event_type=candles")
+        assert error.value.code == 400
+    finally:
+        api.stop()
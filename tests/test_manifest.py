@@ -0,0 +1,107 @@
+import threading
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from src.writer.local_parquet import LocalParquetWriter
+from src.writer.manifest import LocalManifestStore, Manifest, ManifestConflict, S3ManifestStore
+from src.writer.s3_parquet import S3ParquetWriter
+
+# 2023-08-01 10:00:00 UTC
+HOUR_MS = 1690884000000
+NS_PER_MS = 1_000_000
+
+
+def trade(time_ms, market="BTC-EUR"):
+    return {"event": "trades", "exchange": "bitvavo", "market": market, "id": str(time_ms), "timestamp": time_ms,
+            "price": "1", "amount": "1", "side": "buy", "fetch_time": time_ms * NS_PER_MS}
+
+
+def entry(path, time_ms=HOUR_MS, market="BTC-EUR"):
+    return {"path": path, "date": "2023-08-01", "hour": "10", "exchanges": ["bitvavo"], "markets": [market],
+            "min_time": time_ms * NS_PER_MS, "max_time": time_ms * NS_PER_MS, "rows": 1, "bytes": 1}
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="test-bucket")
+        yield "test-bucket"
+
+
+def test_local_writer_records_its_files(tmp_path):
+    writer = LocalParquetWriter(buffer_size=10, data_directory=str(tmp_path), writer_id="w0")
+    writer.manifest = Manifest(LocalManifestStore(str(tmp_path / "_manifest")), "w0")
+    writer.append([trade(HOUR_MS - 1), trade(HOUR_MS), trade(HOUR_MS + 5, market="ETH-EUR")], "trades")
+    writer.save_and_refresh("trades")
+
+    reader = Manifest(LocalManifestStore(str(tmp_path / "_manifest")))
+    entries = reader.entries("trades", HOUR_MS * NS_PER_MS, (HOUR_MS + 1) * NS_PER_MS)
+    assert len(entries) == 1
+    (found,) = entries
+    assert (tmp_path / found["path"]).exists()
+    assert found["markets"] == ["BTC-EUR", "ETH-EUR"] and found["exchanges"] == ["bitvavo"]
+    assert found["min_time"] == HOUR_MS * NS_PER_MS and found["rows"] == 2 and found["writer_id"] == "w0"
+    assert reader.entries("trades", (HOUR_MS - 1) * NS_PER_MS, (HOUR_MS + 1) * NS_PER_MS, market="XRP-EUR") == []
+    # the previous hour has its own file
+    assert len(reader.entries("trades", (HOUR_MS - 1) * NS_PER_MS, HOUR_MS * NS_PER_MS)) == 2
+
+
+def test_s3_writer_records_objects_and_queries_do_not_list(s3_bucket, mocker):
+    writer = S3ParquetWriter(s3_bucket, "data", buffer_size=10, partition_cols=["market"], writer_id="w1")
+    writer.manifest = Manifest(S3ManifestStore(s3_bucket, "data/_manifest", lambda: writer.client), "w1")
+    writer.append([trade(HOUR_MS), trade(HOUR_MS, market="ETH-EUR")], "trades")
+    writer.save_and_refresh("trades")
+
+    list_objects = mocker.spy(writer.client, "list_objects_v2")
+    entries = writer.manifest.entries("trades", HOUR_MS * NS_PER_MS, HOUR_MS * NS_PER_MS, market="ETH-EUR")
+    assert [e["path"].split("/")[1] for e in entries] == ["market=ETH-EUR"]
+    writer.client.head_object(Bucket=s3_bucket, Key=f"data/{entries[0]['path']}")
+    assert not list_objects.called
+
+
+def test_compaction_replaces_objects_atomically(tmp_path):
+    store = LocalManifestStore(str(tmp_path))
+    manifest = Manifest(store, "w0")
+    manifest.record("trades", [entry("trades/a.parquet"), entry("trades/b.parquet")])
+    manifest.commit_compaction("trades", "2023-08-01", "10", ["trades/a.parquet", "trades/b.parquet"],
+                               [entry("trades/compacted.parquet")])
+    # later flushes of the writer keep the replaced objects hidden
+    manifest.record("trades", [entry("trades/c.parquet")])
+    paths = [e["path"] for e in manifest.hour_entries("trades", "2023-08-01", "10")]
+    assert sorted(paths) == ["trades/c.parquet", "trades/compacted.parquet"]
+
+
+def test_concurrent_writers_do_not_lose_segments(tmp_path):
+    store = LocalManifestStore(str(tmp_path))
+    manifests = [Manifest(store, f"w{i}") for i in range(8)]
+    threads = [threading.Thread(target=m.record, args=("trades", [entry(f"trades/{i}.parquet")]))
+               for i, m in enumerate(manifests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(Manifest(store).hour_entries("trades", "2023-08-01", "10")) == 8
+
+
+def test_late_data_of_an_evicted_hour_is_kept(tmp_path):
+    manifest = Manifest(LocalManifestStore(str(tmp_path)), "w0", max_cached_hours=1)
+    manifest.record("trades", [entry("trades/a.parquet")])
+    manifest.record("trades", [dict(entry("trades/b.parquet"), hour="11")])
+    manifest.record("trades", [entry("trades/c.parquet")])
+    paths = [e["path"] for e in manifest.hour_entries("trades", "2023-08-01", "10")]
+    assert paths == ["trades/a.parquet", "trades/c.parquet"]
+
+
+def test_s3_store_rejects_stale_versions(s3_bucket):
+    store = S3ManifestStore(s3_bucket, "manifest", lambda: boto3.client("s3"))
+    store.put_if("index", b"1", None)
+    with pytest.raises(ManifestConflict):
+        store.put_if("index", b"2", None)
+    _, version = store.get("index")
+    store.put_if("index", b"2", version)
+    with pytest.raises(ManifestConflict):
+        store.put_if("index", b"3", version)
+    assert store.get("index")[0] == b"2" and store.get("missing") == (None, None)
@@ -0,0 +1,54 @@
+import json
+import time
+
+import pytest
+
+from src.exchanges.bitvavo import Bitvavo
+from src.utils.metadata_cache import MetadataCache
+
+
+@pytest.fixture
+def synchronous_refresh(mocker):
+    # run the background refresh on the calling thread
+    return mocker.patch("src.utils.metadata_cache.threading.Thread",
+                        side_effect=lambda target, daemon: mocker.Mock(start=target))
+
+
+def test_cache_is_fetched_once_and_read_from_disk(mocker, tmp_path):
+    fetch = mocker.Mock(return_value={"markets": [1]})
+    assert MetadataCache("x", fetch, str(tmp_path)).get() == {"markets": [1]}
+    assert MetadataCache("x", fetch, str(tmp_path)).get() == {"markets": [1]}
+    assert fetch.call_count == 1
+
+
+def test_stale_cache_is_served_and_refreshed_in_background(mocker, tmp_path, synchronous_refresh):
+    (tmp_path / "x.json").write_text(json.dumps({"fetched_at": time.time() - 100, "data": {"v": 1}}))
+    on_refresh = mocker.Mock()
+    cache = MetadataCache("x", mocker.Mock(return_value={"v": 2}), str(tmp_path), ttl=10, on_refresh=on_refresh)
+
+    assert cache.get() == {"v": 1}
+    assert synchronous_refresh.called
+    on_refresh.assert_called_once_with({"v": 2})
+    assert json.loads((tmp_path / "x.json").read_text())["data"] == {"v": 2}
+
+
+def test_failed_refresh_keeps_the_cached_copy(mocker, tmp_path, synchronous_refresh):
+    (tmp_path / "x.json").write_text(json.dumps({"fetched_at": 0, "data": {"v": 1}}))
+    cache = MetadataCache("x", mocker.Mock(side_effect=ConnectionError), str(tmp_path), ttl=10)
+    assert cache.get() == {"v": 1}
+    assert cache.get() == {"v": 1}
+    assert cache.fetch.call_count == 2
+
+
+def test_exchange_starts_from_cache_without_network(mocker, tmp_path, mock_config_bitvavo,
+                                                    mock_exchange_info_bitvavo, mock_assets_bitvavo):
+    mock_config_bitvavo["metadata_cache_dir"] = str(tmp_path)
+    mocker.patch("src.exchanges.bitvavo.load_config_by_name", return_value=mock_config_bitvavo)
+    mocker.patch("src.exchanges.bitvavo.BitvavoWrapper.markets", return_value=mock_exchange_info_bitvavo)
+    mocker.patch("src.exchanges.bitvavo.BitvavoWrapper.assets", return_value=mock_assets_bitvavo)
+    Bitvavo()
+
+    markets = mocker.patch("src.exchanges.bitvavo.BitvavoWrapper.markets", side_effect=ConnectionError)
+    bitvavo = Bitvavo()
+    assert not markets.called
+    assert bitvavo._get_pair_name("btc_eur") == "BTC-EUR"
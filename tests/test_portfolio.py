@@ -0,0 +1,85 @@
+import math
+
+import pytest
+
+from src.live.portfolio import PortfolioValuation
+
+
+def book(exchange, market, bids, asks, at=0):
+    return {"event": "orderbook", "exchange": exchange, "market": market, "fetch_time": at,
+            "bids": [[str(p), str(q)] for p, q in bids], "asks": [[str(p), str(q)] for p, q in asks]}
+
+
+@pytest.fixture
+def portfolio():
+    portfolio = PortfolioValuation(
+        currency="EUR", fiats={"bitvavo": "EUR", "btcturk": "TRY"},
+        commissions={"bitvavo": 0.01, "btcturk": 0.02},
+        conversions={"TRY": [["btcturk", "USDT-TRY"], ["bitvavo", "USDT-EUR"]]}, emit_interval=1)
+    portfolio.set_balances("bitvavo", {"BTC": {"total": 2, "available": 1}, "EUR": {"total": 100, "available": 100},
+                                       "XRP": {"total": 0, "available": 0}})
+    portfolio.set_balances("btcturk", {"BTC": {"total": 1, "available": 1}, "ETH": {"total": 5, "available": 5}})
+    return portfolio
+
+
+def values(portfolio):
+    return {row["exchange"]: row for row in portfolio.valuation()}
+
+
+def test_mark_and_liquidation_values(portfolio):
+    portfolio.update(book("bitvavo", "BTC-EUR", [(100, 1), (90, 0.5)], [(102, 1)]))
+    bitvavo = values(portfolio)["bitvavo"]
+    assert bitvavo["mark_value"] == pytest.approx(100 + 2 * 101)
+    # 1 at 100 and 0.5 at 90 after the commission, the other 0.5 exceeds the depth
+    assert bitvavo["liquidation_value"] == pytest.approx(100 + 145 * 0.99)
+    assert bitvavo["shortfall_value"] == pytest.approx(0.5 * 101)
+    assert bitvavo["unpriced"] == 0
+    # no TRY conversion yet and no ETH book
+    btcturk = values(portfolio)["btcturk"]
+    assert math.isnan(btcturk["mark_value"])
+    assert btcturk["unpriced"] == 2
+
+
+def test_fiat_is_converted_through_the_conversion_path(portfolio):
+    portfolio.update(book("btcturk", "BTC-TRY", [(3000, 10)], [(3100, 10)]))
+    portfolio.update(book("btcturk", "ETH-TRY", [(200, 10)], [(200, 10)]))
+    portfolio.update(book("btcturk", "USDT-TRY", [(29, 1000)], [(31, 1000)]))
+    portfolio.update(book("bitvavo", "USDT-EUR", [(0.9, 1000)], [(1.1, 1000)]))
+    btcturk = values(portfolio)["btcturk"]
+    assert btcturk["mark_value"] == pytest.approx((3050 + 5 * 200) / 30)
+    # TRY buys USDT at the ask, which sells at the bid, after the commission of each exchange
+    lira = (3000 + 1000) * 0.98
+    assert btcturk["liquidation_value"] == pytest.approx(lira / 31 * 0.98 * 0.9 * 0.99)
+    total = values(portfolio)["all"]
+    assert total["market"] == "EUR"
+    # the bitvavo BTC has no book yet, it is counted as unpriced
+    assert total["mark_value"] == pytest.approx(100 + btcturk["mark_value"])
+    assert total["unpriced"] == 1
+
+
+def test_only_the_holdings_of_the_updated_market_are_revalued(portfolio, mocker):
+    revalue = mocker.spy(portfolio, "_revalue")
+    portfolio.update(book("bitvavo", "BTC-EUR", [(100, 5)], [(102, 5)]))
+    portfolio.update(book("bitvavo", "ETH-EUR", [(100, 5)], [(102, 5)]))
+    assert revalue.call_count == 1
+    assert set(portfolio.books) == {("bitvavo", "BTC-EUR")}
+    # new balances are valued with the books already received
+    portfolio.set_balances("bitvavo", {"BTC": {"total": 1, "available": 1}})
+    assert values(portfolio)["bitvavo"]["mark_value"] == pytest.approx(101)
+
+
+def test_valuations_are_emitted_every_interval(portfolio):
+    for at in range(0, 2_500_000_000, 500_000_000):
+        portfolio.update(book("bitvavo", "BTC-EUR", [(100, 5)], [(102, 5)], at=at))
+    rows = portfolio.extract_data()
+    assert [row["fetch_time"] for row in rows] == [1_000_000_000] * 3 + [2_000_000_000] * 3
+    assert {row["exchange"] for row in rows} == {"bitvavo", "btcturk", "all"}
+    # missing values are written as null
+    assert next(row for row in rows if row["exchange"] == "btcturk")["mark_value"] is None
+    assert portfolio.extract_data() == []
+
+
+def test_positions_are_summed_over_exchanges(portfolio):
+    positions = portfolio.positions()
+    assert positions["BTC"] == {"total": 3, "available": 2}
+    assert positions["ETH"] == {"total": 5, "available": 5}
@@ -0,0 +1,132 @@
+import io
+import os
+import threading
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from boto3.s3.transfer import TransferConfig
+from moto import mock_aws
+
+from src.reader.cache import ParquetCache
+
+KEY = "trades/exchange=bitvavo/date=2023-08-01/hour=10/w0-a-0.parquet"
+
+
+def parquet(rows: int) -> bytes:
+    sink = io.BytesIO()
+    pq.write_table(pa.table({"id": [str(i) for i in range(rows)]}), sink)
+    return sink.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="test-bucket")
+        yield client
+
+
+def make_cache(client, tmp_path, **kwargs):
+    return ParquetCache("test-bucket", str(tmp_path / "cache"), kwargs.pop("max_bytes", 10 ** 9),
+                        prefix="data", get_client=lambda: client, **kwargs)
+
+
+def test_objects_are_downloaded_once(client, tmp_path, mocker):
+    client.put_object(Bucket="test-bucket", Key=f"data/{KEY}", Body=parquet(3))
+    download = mocker.spy(client, "download_fileobj")
+    cache = make_cache(client, tmp_path)
+
+    for _ in range(3):
+        table = cache.read_table(KEY)
+    assert table.column("id").to_pylist() == ["0", "1", "2"]
+    assert table.column("exchange").to_pylist() == ["bitvavo"] * 3 and table.column("hour")[0].as_py() == "10"
+    assert download.call_count == 1
+    summary = cache.summary()
+    assert (summary["hits"], summary["misses"], summary["objects"]) == (2, 1, 1)
+    assert summary["bytes_saved"] == 2 * summary["bytes_downloaded"] and summary["hit_rate"] == 2 / 3
+
+    # a second reader of the directory, e.g. another process, uses the cached file
+    assert make_cache(client, tmp_path).read_table(KEY).num_rows == 3
+    assert download.call_count == 1
+
+
+def test_changed_objects_are_downloaded_again(client, tmp_path):
+    client.put_object(Bucket="test-bucket", Key=f"data/{KEY}", Body=parquet(1))
+    cache = make_cache(client, tmp_path, revalidate_after=0)
+    assert cache.read_table(KEY).num_rows == 1
+    assert cache.read_table(KEY).num_rows == 1
+    client.put_object(Bucket="test-bucket", Key=f"data/{KEY}", Body=parquet(2))
+
+    assert cache.read_table(KEY).num_rows == 2
+    assert (cache.stats["revalidations"], cache.stats["changed"], cache.stats["misses"]) == (2, 1, 2)
+    assert len(list((tmp_path / "cache" / "objects").iterdir())) == 1
+
+
+def test_least_recently_used_objects_are_evicted(client, tmp_path):
+    size = len(parquet(1))
+    for name in "abc":
+        client.put_object(Bucket="test-bucket", Key=f"data/{name}.parquet", Body=parquet(1))
+    cache = make_cache(client, tmp_path, max_bytes=2 * size)
+    for name in "abac":
+        cache.read_table(f"{name}.parquet")
+
+    assert cache.stats["evictions"] == 1 and cache.summary()["cached_bytes"] == 2 * size
+    cache.read_table("a.parquet")
+    assert cache.stats["misses"] == 3
+    cache.read_table("b.parquet")
+    assert cache.stats["misses"] == 4
+
+
+def test_concurrent_readers_share_one_download(client, tmp_path, mocker):
+    client.put_object(Bucket="test-bucket", Key=f"data/{KEY}", Body=parquet(100))
+    download = mocker.spy(client, "download_fileobj")
+    cache = make_cache(client, tmp_path)
+    rows = []
+    threads = [threading.Thread(target=lambda: rows.append(cache.read_table(KEY).num_rows)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert rows == [100] * 8 and download.call_count == 1
+
+
+def test_corrupted_downloads_are_rejected(tmp_path):
+    path = tmp_path / "object"
+    path.write_bytes(b"data")
+    ParquetCache._verify(str(path), '"8d777f385d3dfec8815d20f7496026dc"', 4)
+    with pytest.raises(ValueError):
+        ParquetCache._verify(str(path), '"00000000000000000000000000000000"', 4)
+
+
+def test_multipart_downloads_are_verified_with_their_part_size(client, tmp_path):
+    # 8 MB parts, not the whole MB parts the number of parts suggests
+    data = os.urandom(11 * 1024 * 1024)
+    client.upload_fileobj(io.BytesIO(data), "test-bucket", f"data/{KEY}",
+                          Config=TransferConfig(multipart_threshold=5 * 1024 * 1024,
+                                                multipart_chunksize=8 * 1024 * 1024))
+    cache = make_cache(client, tmp_path)
+    with cache.open(KEY) as f:
+        assert f.read() == data
+    assert cache.summary()["unverified"] == 0
+
+    etag = client.head_object(Bucket="test-bucket", Key=f"data/{KEY}")["ETag"]
+    path = tmp_path / "object"
+    path.write_bytes(data)
+    assert ParquetCache._verify(str(path), etag, len(data)) is False
+    path.write_bytes(data[:-1] + b"x")
+    with pytest.raises(ValueError):
+        ParquetCache._verify(str(path), etag, len(data), part_size=8 * 1024 * 1024)
+
+
+def test_entries_with_different_columns_are_concatenated(client, tmp_path):
+    other = KEY.replace("w0-a-0", "w0-b-0")
+    client.put_object(Bucket="test-bucket", Key=f"data/{KEY}", Body=parquet(2))
+    sink = io.BytesIO()
+    pq.write_table(pa.table({"id": ["x"], "price": [1.0]}), sink)
+    client.put_object(Bucket="test-bucket", Key=f"data/{other}", Body=sink.getvalue())
+    table = make_cache(client, tmp_path).read_entries([{"path": KEY}, {"path": other}])
+    assert table.num_rows == 3
+    assert table.column("price").to_pylist() == [None, None, 1.0]
@@ -0,0 +1,74 @@
+import pytest
+
+from src.utils.sharding import (
+    HashRing, node_from_config, normalize_config, shard_config, shard_subscriptions, subscription_key
+)
+
+
+def mock_subscriptions(num_markets=200):
+    markets = [f"C{i}-EUR" for i in range(num_markets)]
+    return {"bitvavo": {"orderbook": markets, "trades": markets, "ticker": markets}}
+
+
+def test_shards_cover_every_subscription_once():
+    subscriptions = mock_subscriptions()
+    members = ["node0", "node1", "node2"]
+    shards = [shard_subscriptions(subscriptions, node, members) for node in members]
+
+    for event_type, markets in subscriptions["bitvavo"].items():
+        collected = [m for shard in shards for m in shard.get("bitvavo", {}).get(event_type, [])]
+        assert sorted(collected) == sorted(markets)
+    # every node gets a fair share
+    sizes = [sum(len(x) for x in shard["bitvavo"].values()) for shard in shards]
+    assert min(sizes) > 600 / 3 * 0.6
+
+
+def test_adding_a_node_moves_few_subscriptions():
+    keys = [subscription_key("bitvavo", f"C{i}-EUR", event_type)
+            for i in range(500) for event_type in ["orderbook", "trades", "ticker"]]
+    before = HashRing(["node0", "node1", "node2", "node3"])
+    after = HashRing(["node0", "node1", "node2", "node3", "node4"])
+    moved = sum(before.node_for(key) != after.node_for(key) for key in keys)
+    # ideally 1/5 of the keys move, and only to the new node
+    assert moved < len(keys) * 0.3
+    assert all(after.node_for(key) == "node4" for key in keys if before.node_for(key) != after.node_for(key))
+
+
+def test_shard_config():
+    config = {"pairs": {"bitvavo": ["BTC-EUR", "BTC-EUR", "ETH-EUR"]},
+              "event_types": {"bitvavo": ["orderbook", "trades"]}}
+    shards = [shard_config(config, node, ["a", "b"]) for node in ["a", "b"]]
+    assert all(shard["node_id"] in ["a", "b"] for shard in shards)
+    subscriptions = [(m, e) for shard in shards for e, ms in shard["subscriptions"].get("bitvavo", {}).items() for m in ms]
+    assert sorted(subscriptions) == sorted((m, e) for m in ["BTC-EUR", "ETH-EUR"] for e in ["orderbook", "trades"])
+
+
+def test_node_from_config(monkeypatch):
+    assert node_from_config({"node_index": 0, "node_count": 1}) == (None, None)
+    assert node_from_config({"node_index": 1, "node_count": 3}) == ("node1", ["node0", "node1", "node2"])
+    monkeypatch.setenv("NODE_ID", "b")
+    monkeypatch.setenv("NODE_MEMBERS", "a, b")
+    assert node_from_config({}) == ("b", ["a", "b"])
+    monkeypatch.delenv("NODE_ID")
+    with pytest.raises(ValueError):
+        node_from_config({"node_index": 3, "node_count": 3})
+
+
+def test_node_from_config_overrides_take_precedence(monkeypatch):
+    monkeypatch.setenv("NODE_INDEX", "0")
+    monkeypatch.setenv("NODE_COUNT", "2")
+    assert node_from_config({"node_index": 0, "node_count": 1}) == ("node0", ["node0", "node1"])
+    overrides = {"node_index": 2, "node_count": 3}
+    assert node_from_config({}, overrides=overrides) == ("node2", ["node0", "node1", "node2"])
+    # unset arguments fall back to the environment
+    assert node_from_config({}, overrides={"node_index": 1, "node_count": None}) == ("node1", ["node0", "node1"])
+    monkeypatch.setenv("NODE_ID", "b")
+    monkeypatch.setenv("NODE_MEMBERS", "a, b")
+    assert node_from_config({}, overrides=overrides) == ("node2", ["node0", "node1", "node2"])
+
+
+def test_normalize_config_merges_spellings_of_a_market():
+    config = {"pairs": {"bitvavo": ["BTC_EUR", "btc-eur", "ETH-EUR"]}, "event_types": {"bitvavo": ["trades"]}}
+    config = normalize_config(config, lambda exchange, pair: pair.replace("_", "-").upper())
+    assert config["pairs"] == {"bitvavo": ["BTC-EUR", "ETH-EUR"]}
+    assert config["subscriptions"] == {"bitvavo": {"trades": ["BTC-EUR", "ETH-EUR"]}}
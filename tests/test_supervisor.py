@@ -0,0 +1,85 @@
+from src.supervisor import Supervisor, split_markets, worker_config
+
+
+def mock_config():
+    return {
+        "collection_mode": "websocket",
+        "limit": 5,
+        "sleep_duration": 1,
+        "pairs": {
+            "bitvavo": ["BTC-EUR", "ETH-EUR", "XRP-EUR", "BTC-EUR"],
+            "btcturk": ["BTC-TRY"]
+        },
+        "event_types": {
+            "bitvavo": ["orderbook", "trades"],
+            "btcturk": ["ticker"]
+        }
+    }
+
+
+def test_split_markets_round_robin_without_rates():
+    markets = [("bitvavo", "BTC-EUR"), ("bitvavo", "ETH-EUR"), ("bitvavo", "XRP-EUR"), ("btcturk", "BTC-TRY")]
+    assignment = split_markets(markets, 2)
+    assert sorted(len(x) for x in assignment) == [2, 2]
+    assert sorted(m for x in assignment for m in x) == sorted(markets)
+
+
+def test_split_markets_balances_by_rate():
+    markets = [("bitvavo", "BTC-EUR"), ("bitvavo", "ETH-EUR"), ("bitvavo", "XRP-EUR"), ("btcturk", "BTC-TRY")]
+    rates = {("bitvavo", "BTC-EUR"): 100, ("bitvavo", "ETH-EUR"): 10, ("bitvavo", "XRP-EUR"): 10, ("btcturk", "BTC-TRY"): 10}
+    assignment = split_markets(markets, 2, rates)
+    # the busiest market gets a worker of its own
+    assert [("bitvavo", "BTC-EUR")] in assignment
+
+
+def test_worker_config_only_has_assigned_exchanges():
+    config = worker_config(mock_config(), [("bitvavo", "ETH-EUR")])
+    assert config["pairs"] == {"bitvavo": ["ETH-EUR"]}
+    assert config["event_types"] == {"bitvavo": ["orderbook", "trades"]}
+    assert config["sleep_duration"] == 1
+
+
+def test_supervisor_rebalances_on_imbalance(mocker):
+    supervisor = Supervisor(mock_config(), {}, workers=2)
+    # duplicated pairs are assigned once
+    assert len(supervisor.markets) == 4
+    start_worker = mocker.patch.object(supervisor, "start_worker")
+    stop_processes = mocker.patch.object(supervisor, "_stop_processes")
+
+    busiest = supervisor.assignment[0][0]
+    supervisor.rates = {market: 1.0 for market in supervisor.markets}
+    supervisor.rates[busiest] = 100.0
+    assert supervisor.is_imbalanced()
+
+    supervisor.rebalance()
+    assert [busiest] in supervisor.assignment
+    assert stop_processes.called and start_worker.called
+
+    # the split is already the best one, no worker is restarted again
+    start_worker.reset_mock()
+    supervisor.rebalance()
+    assert not start_worker.called
+
+
+def test_rebalance_moves_few_markets_and_starts_before_stopping(mocker):
+    config = mock_config()
+    config["pairs"]["bitvavo"] = [f"M{i}-EUR" for i in range(6)]
+    supervisor = Supervisor(config, {}, workers=3)
+    old_processes = {i: mocker.Mock() for i in range(3)}
+    supervisor.processes = dict(old_processes)
+    calls = mocker.Mock()
+    mocker.patch.object(supervisor, "start_worker", side_effect=calls.start)
+    mocker.patch.object(supervisor, "_stop_processes", side_effect=calls.stop)
+
+    before = [list(markets) for markets in supervisor.assignment]
+    supervisor.rates = {market: 1.0 for market in supervisor.markets}
+    supervisor.rates[before[0][0]] = 10.0
+    supervisor.rates[before[0][1]] = 10.0
+    supervisor.rebalance()
+
+    # one market moved off the busiest worker, the untouched worker keeps running
+    moved = [i for i in range(3) if supervisor.assignment[i] != before[i]]
+    assert len(moved) == 2 and 0 in moved
+    assert sum(len(markets) for markets in supervisor.assignment) == len(supervisor.markets)
+    assert [c[0] for c in calls.mock_calls] == ["start", "start", "stop"]
+    assert calls.stop.call_args[0][0] == {i: old_processes[i] for i in moved}
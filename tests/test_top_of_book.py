@@ -0,0 +1,79 @@
+import math
+import multiprocessing
+import uuid
+
+import pytest
+
+from src.live.top_of_book import TopOfBook, instruments_from_config
+
+
+@pytest.fixture
+def book():
+    book = TopOfBook.create(f"test-tob-{uuid.uuid4().hex[:8]}", [("bitvavo", "BTC-EUR"), ("btcturk", "BTC-TRY")])
+    yield book
+    book.close()
+
+
+def read_in_process(name, queue):
+    reader = TopOfBook.attach(name)
+    row = reader.read_market("btcturk", "BTC-TRY")
+    queue.put((float(row["bid"]), float(row["ask"]), int(row["updates"])))
+    reader.close()
+
+
+def test_instruments_are_numbered_from_the_config():
+    config = {"pairs": {"btcturk": ["BTC-TRY"], "bitvavo": ["ETH-EUR", "BTC-EUR"]}}
+    assert instruments_from_config(config) == [("bitvavo", "BTC-EUR"), ("bitvavo", "ETH-EUR"), ("btcturk", "BTC-TRY")]
+
+
+def test_orderbook_and_ticker_events_update_the_best_prices(book):
+    assert math.isnan(book.read(0)["bid"])
+    book.update({"event": "orderbook", "exchange": "bitvavo", "market": "BTC-EUR", "timestamp": 1690884000000,
+                 "bids": [["100.5", "2"], ["100", "1"]], "asks": [["101", "3"]], "fetch_time": 5})
+    row = book.read_market("bitvavo", "BTC-EUR")
+    assert (row["bid"], row["bid_size"], row["ask"], row["ask_size"]) == (100.5, 2, 101, 3)
+    assert row["exchange_time"] == 1690884000000 and row["fetch_time"] == 5 and row["seq"] % 2 == 0
+
+    # a ticker with one side keeps the other
+    book.update({"event": "ticker", "exchange": "bitvavo", "market": "BTC-EUR", "bestBid": "100.7",
+                 "bestBidSize": "1", "fetch_time": 6})
+    row = book.read_market("bitvavo", "BTC-EUR")
+    assert (row["bid"], row["ask"], row["updates"]) == (100.7, 101, 2)
+
+    book.update({"event": "trades", "exchange": "bitvavo", "market": "BTC-EUR", "price": "1"})
+    book.update({"event": "ticker", "exchange": "bitvavo", "market": "XRP-EUR", "bestBid": "1"})
+    assert book.read_market("bitvavo", "BTC-EUR")["updates"] == 2
+    assert book.read_market("bitvavo", "XRP-EUR") is None
+
+
+def test_other_processes_attach_by_name(book):
+    book.write(book.instrument_id("btcturk", "BTC-TRY"), 10.0, 1.0, 11.0, 1.0)
+    queue = multiprocessing.get_context("spawn").Queue()
+    process = multiprocessing.get_context("spawn").Process(target=read_in_process, args=(book.shm.name, queue))
+    process.start()
+    assert queue.get(timeout=30) == (10.0, 11.0, 1)
+    process.join(30)
+    # the reader's exit did not remove the segment
+    reader = TopOfBook.attach(book.shm.name)
+    assert reader.instruments() == book.instruments()
+    reader.close()
+
+
+def test_a_row_left_mid_update_is_not_read_until_written_again(book):
+    # a writer killed between the two sequence increments
+    book.rows["seq"][0] = 3
+    assert book.read(0, max_retries=100) is None
+    book.write(0, 1.0, 1.0, 2.0, 1.0)
+    row = book.read(0)
+    assert row["seq"] == 6 and row["bid"] == 1.0
+
+
+def test_attach_rejects_other_segments():
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=f"test-tob-{uuid.uuid4().hex[:8]}", create=True, size=1024)
+    try:
+        with pytest.raises(ValueError):
+            TopOfBook.attach(shm.name)
+    finally:
+        shm.close()
+        shm.unlink()
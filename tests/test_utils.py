@@ -0,0 +1,36 @@
+from math import inf
+
+import numpy as np
+import pytest
+
+from src.utils.utils import _get_amount, _get_amountQuote, _get_market_value, merge_dicts, walk_book
+
+ASKS = [["10", "1"], ["11", "2"], ["12", "3"]]
+
+
+def test_walk_book():
+    assert walk_book(ASKS, 2) == (21, 2)
+    assert walk_book(np.array([[10, 1], [11, 2]]), 5) == (32, 3)
+    # spending quote
+    assert walk_book(ASKS, 21, quote=True) == (2, 21)
+    assert walk_book([], 1) == (0, 0)
+
+
+def test_market_value_includes_the_commission():
+    assert _get_market_value(2, ASKS, cost=0.01, type="buy") == pytest.approx(21 * 1.01)
+    assert _get_amountQuote(2, ASKS, cost=0.01, type="sell") == pytest.approx(21 * 0.99)
+    assert _get_market_value(0, ASKS) == 0
+    # the book is too shallow
+    assert _get_market_value(7, ASKS) == -inf
+
+
+def test_amount_bought_for_a_quote_amount():
+    # the first level costs 10.1, the rest buys at 11
+    assert _get_amount(10.1 + 11, ASKS, cost=0.01) == pytest.approx(1 + 11 * 0.99 / 11)
+    assert _get_amount(0, ASKS) == 0
+    assert _get_amount(1000, ASKS) == -inf
+
+
+def test_merge_dicts():
+    merged = merge_dicts([{"a": {"x": 10, "y": 20}, "b": 1}, {"a": {"x": 1, "y": 2}, "b": 2, "c": 3}])
+    assert merged == {"a": {"x": 11, "y": 22}, "b": 3, "c": 3}
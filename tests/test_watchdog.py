@@ -0,0 +1,55 @@
+from src.watchdog import StallWatchdog, NS_PER_SECOND
+from src.ws_handlers.bitvavo import BitvavoWSHandler
+
+
+def make_exchange(mocker, pairs):
+    exchange = mocker.Mock()
+    exchange.name = "bitvavo"
+    exchange.is_socket_closed.return_value = False
+    handler = BitvavoWSHandler("trades", None, pairs=pairs)
+    exchange.ws_handlers = {"trades": handler}
+    return exchange, handler
+
+
+def receive(handler, market, at):
+    handler.append_data_callback({"market": market, "fetch_time": at})
+
+
+def test_only_the_quiet_stream_stalls(mocker):
+    exchange, handler = make_exchange(mocker, ["BTC-EUR", "ETH-EUR"])
+    watchdog = StallWatchdog([exchange], stall_factor=5, min_stall_seconds=2, max_stall_seconds=60)
+    s = NS_PER_SECOND
+
+    watchdog.check(0)
+    # both streams send one message per second for 10 seconds, then ETH-EUR goes quiet
+    for t in range(1, 11):
+        receive(handler, "BTC-EUR", t * s)
+        receive(handler, "ETH-EUR", t * s)
+        watchdog.check(t * s)
+    for t in range(11, 15):
+        receive(handler, "BTC-EUR", t * s)
+        assert watchdog.check(t * s) == []
+    for t in range(15, 17):
+        receive(handler, "BTC-EUR", t * s)
+        stalled = watchdog.check(t * s)
+        if stalled:
+            break
+
+    # 5 expected inter-arrival times of one second
+    assert stalled == [("bitvavo", "ETH-EUR", "trades")]
+    exchange.on_stream_stall.assert_called_once_with("trades", "ETH-EUR", 10 * s, 16 * s)
+    assert watchdog.summary()["stalls"] == 1
+    # the silence is measured from the resubscription, no new stall right away
+    assert watchdog.check(17 * s) == []
+
+
+def test_silent_stream_stalls_within_budget(mocker):
+    exchange, handler = make_exchange(mocker, ["BTC-EUR"])
+    watchdog = StallWatchdog([exchange], max_stall_seconds=30)
+    watchdog.check(0)
+    assert watchdog.check(30 * NS_PER_SECOND) == []
+    assert watchdog.check(31 * NS_PER_SECOND) == [("bitvavo", "BTC-EUR", "trades")]
+
+    # closed sockets are resynced as a whole
+    exchange.is_socket_closed.return_value = True
+    assert watchdog.check(100 * NS_PER_SECOND) == []
@@ -0,0 +1,201 @@
+import os
+import tempfile
+
+import boto3
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+
+from src.writer.encoding import EncodingProfile, get_encoding_profile
+from src.writer.local_parquet import LocalParquetWriter
+from src.writer.partitioning import dataset_partitioning, partition_filter
+from src.writer.s3_parquet import S3ParquetWriter
+from src.writer.schemas import get_schema, records_to_table
+
+
+def ticker(**values):
+    record = {"event": "ticker", "exchange": "bitvavo", "market": "BTC-EUR", "fetch_time": 1,
+              "bestBid": None, "bestBidSize": None, "bestAsk": None, "bestAskSize": None}
+    record.update(values)
+    return record
+
+
+def test_records_are_cast_to_the_registered_schema():
+    # a buffer of nulls only and a buffer of strings end up with the same column types
+    only_nulls = records_to_table([ticker()], "ticker")
+    strings = records_to_table([ticker(bestBid="100.5", extra="dropped")], "ticker")
+    assert only_nulls.schema == strings.schema == get_schema("ticker")
+    assert strings.column("bestBid").to_pylist() == [100.5]
+
+    book = records_to_table([{"market": "BTC-EUR", "nonce": 3, "bids": [["10", "1.5"]], "asks": []}], "orderbook")
+    assert book.column("bids").to_pylist() == [[[10.0, 1.5]]]
+
+
+def test_unregistered_event_types_are_inferred():
+    assert records_to_table([{"a": 1}], "custom").column("a").to_pylist() == [1]
+
+
+def test_local_writer_writes_schema_stable_files(tmp_path):
+    writer = LocalParquetWriter(buffer_size=1, data_directory=str(tmp_path), writer_id="w0")
+    for record in [ticker(), ticker(bestBid="1")]:
+        writer.append([record], "ticker")
+        writer.save_and_refresh("ticker")
+
+    files = sorted((tmp_path / "ticker").rglob("*.parquet"))
+    assert len(files) == 2 and all(f.name.startswith("w0-") for f in files)
+    schemas = {pq.read_schema(f).field("bestBid").type for f in files}
+    assert len(schemas) == 1
+    assert pq.read_table(tmp_path / "ticker").num_rows == 2
+
+
+def test_mixed_strings_and_numbers_are_converted():
+    table = records_to_table([{"bids": [[10.0, 1.0]], "asks": []}, {"bids": [["11", "2"]], "asks": []}], "orderbook")
+    assert table.column("bids").to_pylist() == [[[10.0, 1.0]], [[11.0, 2.0]]]
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        boto3.client("s3").create_bucket(Bucket="test-bucket")
+        yield "test-bucket"
+
+
+def test_s3_writer_uploads_partitions_from_memory(s3_bucket, mocker):
+    temp_dir = mocker.spy(tempfile, "TemporaryDirectory")
+    writer = S3ParquetWriter(s3_bucket, "data", buffer_size=1, partition_cols=["exchange"], writer_id="w0")
+    writer.append([ticker(bestBid="1"), ticker(exchange="btcturk"), ticker(exchange=None)], "ticker")
+    writer.save_and_refresh("ticker")
+    client = writer.client
+    writer.append([ticker()], "ticker")
+    writer.save_and_refresh("ticker")
+    writer.close()
+
+    assert writer.client is client
+    assert not temp_dir.called
+    keys = [o["Key"] for o in client.list_objects_v2(Bucket=s3_bucket)["Contents"]]
+    assert len(keys) == 4
+    assert {key.split("/")[2] for key in keys} == {"exchange=bitvavo", "exchange=btcturk",
+                                                   "exchange=__HIVE_DEFAULT_PARTITION__"}
+    assert all(key.startswith("data/ticker/") and key.split("/")[-1].startswith("w0-") for key in keys)
+
+    bitvavo = [key for key in keys if "exchange=bitvavo" in key]
+    body = client.get_object(Bucket=s3_bucket, Key=bitvavo[0])["Body"].read()
+    table = pq.read_table(pa.BufferReader(body))
+    assert "exchange" not in table.column_names and "hour" not in table.column_names
+    assert table.schema.field("bestBid").type == pa.float64()
+    assert writer.buffer["ticker"] == []
+
+
+def test_s3_writer_uploads_large_files_in_parts(s3_bucket, mocker):
+    writer = S3ParquetWriter(s3_bucket, "data", buffer_size=1, multipart_threshold_mb=5,
+                             multipart_chunksize_mb=5, max_concurrency=2)
+    upload_part = mocker.spy(writer.client, "upload_part")
+    # random ids don't compress, so the file is larger than the 5 MB threshold
+    writer.append([ticker(market=os.urandom(64).hex()) for _ in range(60000)], "ticker")
+    writer.save_and_refresh("ticker")
+
+    assert upload_part.call_count >= 2
+    keys = [o["Key"] for o in writer.client.list_objects_v2(Bucket=s3_bucket)["Contents"]]
+    body = writer.client.get_object(Bucket=s3_bucket, Key=keys[0])["Body"].read()
+    assert pq.read_table(pa.BufferReader(body)).num_rows == 60000
+
+
+def test_s3_writer_keeps_the_buffer_when_an_upload_fails(s3_bucket):
+    writer = S3ParquetWriter("missing-bucket", "data", buffer_size=1)
+    writer.append([ticker()], "ticker")
+    with pytest.raises(Exception):
+        writer.save_and_refresh("ticker")
+    assert len(writer.buffer["ticker"]) == 1
+
+
+def test_s3_writer_retry_overwrites_the_uploaded_partitions(s3_bucket, mocker):
+    writer = S3ParquetWriter(s3_bucket, "data", buffer_size=1, partition_cols=["exchange"], writer_id="w0")
+    upload = writer._upload_table
+
+    def fail_btcturk(table, s3_key):
+        if "exchange=btcturk" in s3_key:
+            raise IOError("upload failed")
+        return upload(table, s3_key)
+
+    mocker.patch.object(writer, "_upload_table", side_effect=fail_btcturk)
+    writer.append([ticker(), ticker(exchange="btcturk")], "ticker")
+    with pytest.raises(IOError):
+        writer.save_and_refresh("ticker")
+    assert len(writer.client.list_objects_v2(Bucket=s3_bucket)["Contents"]) == 1
+
+    writer._upload_table.side_effect = upload
+    writer.append([ticker(bestBid="2")], "ticker")
+    writer.save_and_refresh("ticker")
+    keys = [o["Key"] for o in writer.client.list_objects_v2(Bucket=s3_bucket)["Contents"]]
+    assert len(keys) == 2
+    rows = {key.split("/")[2]: pq.read_table(pa.BufferReader(
+        writer.client.get_object(Bucket=s3_bucket, Key=key)["Body"].read())).num_rows for key in keys}
+    assert rows == {"exchange=bitvavo": 2, "exchange=btcturk": 1}
+    assert writer.buffer["ticker"] == []
+    # the next flush writes new files
+    writer.append([ticker()], "ticker")
+    writer.save_and_refresh("ticker")
+    assert len(writer.client.list_objects_v2(Bucket=s3_bucket)["Contents"]) == 3
+
+
+def test_encoding_profile_options_follow_the_schema():
+    profile = EncodingProfile("test", compression="zstd", dictionary_columns=["market", "side"],
+                              byte_stream_split=True, write_statistics=["market", "timestamp"])
+    options = profile.write_options(get_schema("orderbook"))
+    assert options["use_dictionary"] == ["market"]
+    assert options["use_byte_stream_split"] == ["bids.list.item.list.item", "asks.list.item.list.item"]
+    assert options["write_statistics"] == ["market", "timestamp"]
+
+    with pytest.raises(ValueError):
+        get_encoding_profile("missing")
+    assert get_encoding_profile("archive").compression == "zstd"
+
+
+def test_local_writer_applies_the_encoding_profile(tmp_path):
+    profile = EncodingProfile("test", compression="zstd", dictionary_columns=["market"], byte_stream_split=True)
+    writer = LocalParquetWriter(buffer_size=1, data_directory=str(tmp_path), encoding=profile)
+    writer.append([ticker(bestBid="1"), ticker(market="ETH-EUR", bestBid="2")], "ticker")
+    writer.save_and_refresh("ticker")
+
+    (file,) = (tmp_path / "ticker").rglob("*.parquet")
+    metadata = pq.ParquetFile(file).metadata
+    columns = {metadata.row_group(0).column(i).path_in_schema: metadata.row_group(0).column(i)
+               for i in range(metadata.num_columns)}
+    assert columns["bestBid"].compression == "ZSTD"
+    assert "BYTE_STREAM_SPLIT" in columns["bestBid"].encodings
+    assert columns["market"].has_dictionary_page and not columns["exchange"].has_dictionary_page
+
+
+def trade(time_ms, market="BTC-EUR", **values):
+    record = {"event": "trades", "exchange": "bitvavo", "market": market, "id": str(time_ms),
+              "timestamp": time_ms, "price": "1", "amount": "1", "side": "buy",
+              # received late, e.g. after a reconnect
+              "fetch_time": (time_ms + 3 * 3600 * 1000) * 1_000_000}
+    record.update(values)
+    return record
+
+
+def test_partitions_follow_the_event_time(tmp_path):
+    # 2023-08-01 09:59:59.999 and 10:00:00.000 UTC
+    before, after = 1690883999999, 1690884000000
+    writer = LocalParquetWriter(buffer_size=10, data_directory=str(tmp_path), partition_cols=["exchange", "market"])
+    writer.append([trade(after), trade(before), trade(after, market="ETH-EUR"),
+                   trade(before, timestamp=None, fetch_time=1690891200000000000)], "trades")
+    writer.save_and_refresh("trades")
+
+    directories = sorted(str(f.parent.relative_to(tmp_path / "trades")) for f in (tmp_path / "trades").rglob("*.parquet"))
+    assert directories == ["exchange=bitvavo/market=BTC-EUR/date=2023-08-01/hour=09",
+                           "exchange=bitvavo/market=BTC-EUR/date=2023-08-01/hour=10",
+                           "exchange=bitvavo/market=BTC-EUR/date=2023-08-01/hour=12",
+                           "exchange=bitvavo/market=ETH-EUR/date=2023-08-01/hour=10"]
+
+    dataset = ds.dataset(tmp_path / "trades", format="parquet",
+                         partitioning=dataset_partitioning(["exchange", "market"]))
+    query = partition_filter(after * 1_000_000, (after + 1) * 1_000_000, market="BTC-EUR")
+    assert len(list(dataset.get_fragments(filter=query))) == 1
+    assert dataset.to_table(filter=query).column("timestamp").to_pylist() == [after]
+    # a range over several days compares date and hour
+    assert len(list(dataset.get_fragments(filter=partition_filter(0, after * 1_000_000)))) == 3
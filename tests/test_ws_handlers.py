@@ -0,0 +1,89 @@
+import pytest
+
+from src.ws_handlers.bitvavo import BitvavoWSHandler
+from src.utils.clock import now_ns, ms_to_ns
+from src.utils.metrics import LatencyHistogram
+from src.utils.dedup import RecentIdIndex
+
+
+def test_fetch_time_is_utc_nanoseconds(mocker):
+    handler = BitvavoWSHandler("trades", mocker.Mock())
+    before = now_ns()
+    handler.callback({"id": "1", "amount": "0.1", "price": "100", "timestamp": before // 1_000_000,
+                      "market": "BTC-EUR", "side": "buy"})
+    after = now_ns()
+
+    trade = handler.extract_data()[0]
+    assert isinstance(trade["fetch_time"], int)
+    assert before <= trade["fetch_time"] <= after
+    assert trade["exchange"] == "bitvavo"
+    # the trade carries an exchange timestamp, so a latency sample is recorded
+    assert handler.latency.count == 1
+
+
+def test_orderbook_callback_does_not_mutate_sdk_book(mocker):
+    handler = BitvavoWSHandler("orderbook", mocker.Mock(), limit=1)
+    local_book = {"market": "BTC-EUR", "nonce": 1, "bids": [["2", "1"], ["1", "1"]], "asks": [["3", "1"], ["4", "1"]]}
+    handler.callback(local_book)
+    local_book["nonce"] = 2
+    handler.callback(local_book)
+
+    books = handler.extract_data()
+    assert [book["nonce"] for book in books] == [1, 2]
+    assert books[0]["bids"] == [["2", "1"]]
+    assert len(local_book["bids"]) == 2
+    assert "fetch_time" not in local_book
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for latency_ms in [1, 2, 3, 100]:
+        histogram.record(latency_ms * 1_000_000)
+    histogram.record(-5)
+
+    summary = histogram.summary()
+    assert summary["count"] == 4
+    assert summary["negative"] == 1
+    assert summary["min_ms"] == 1
+    assert summary["max_ms"] == 100
+    # bucket upper bounds are powers of two in microseconds
+    assert 2 <= summary["p50_ms"] <= 2.1
+    assert summary["p99_ms"] == 100
+
+
+def test_ms_to_ns():
+    assert ms_to_ns(1690998560339) == 1690998560339 * 1_000_000
+    assert ms_to_ns("1.5") == 1_500_000
+
+
+def test_recent_id_index_is_bounded():
+    index = RecentIdIndex(capacity=2)
+    assert index.add("1") and index.add("2")
+    assert not index.add("1")
+    assert index.add("3")
+    # the oldest id was evicted
+    assert "1" not in index and len(index) == 2
+
+
+def test_duplicate_trades_are_dropped_per_market(mocker):
+    handler = BitvavoWSHandler("trades", mocker.Mock())
+    trade = {"id": "1", "amount": "0.1", "price": "100", "timestamp": 1, "market": "BTC-EUR", "side": "buy"}
+    handler.callback(dict(trade))
+    handler.callback(dict(trade))
+    # the same id in another market is a different trade
+    handler.callback(dict(trade, market="ETH-EUR"))
+
+    assert [t["market"] for t in handler.extract_data()] == ["BTC-EUR", "ETH-EUR"]
+    assert handler.duplicates == {"BTC-EUR": 1}
+
+
+def test_listeners_get_every_buffered_event(mocker):
+    handler = BitvavoWSHandler("trades", mocker.Mock())
+    received = []
+    handler.add_listener(mocker.Mock(side_effect=RuntimeError("consumer bug")))
+    handler.add_listener(received.append)
+    handler.callback({"id": "1", "amount": "0.1", "price": "100", "timestamp": 1, "market": "BTC-EUR", "side": "buy"})
+
+    # the failing listener neither stops the buffering nor the other listeners
+    assert received == handler.extract_data()
+    assert received[0]["market"] == "BTC-EUR"